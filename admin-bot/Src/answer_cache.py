@@ -0,0 +1,144 @@
+# Two tier answer cache for FireflyBot questions, used by qa_engine.QueryEngine
+import logging
+import re
+import threading
+from collections import OrderedDict
+from time import monotonic
+from typing import Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_question(text: str) -> str:
+    """
+    Normalizes a question for the exact-match tier
+    :param text: The question as typed by the user
+    :return: Lowercase text with collapsed whitespace and without trailing punctuation
+
+    example:
+    text = "  How do I   connect AWS?? " - will be returned "how do i connect aws"
+    """
+    return re.sub(r"\s+", " ", text).strip().lower().rstrip("?!. ")
+
+
+class AnswerCache:
+    """
+    Caches FireflyBot answers in two tiers:
+    - exact: keyed on the normalized question, answered without any Azure OpenAI call
+    - semantic: keyed on the question embedding, hit when the cosine similarity passes the threshold.
+      Off unless a threshold is given: ada-002 scores questions that differ in a single entity ("connect an
+      AWS account" / "connect a GCP project") above 0.95, so a low threshold answers a different question.
+      Use at least 0.98 and check it with benchmarks/eval_semantic_cache.py against the deployed model.
+
+    Both tiers share the same entries, so TTL expiry and LRU eviction apply to both. Safe to use from
+    Bolt's worker threads.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: float = 3600, similarity_threshold: float = None):
+        """
+        :param max_entries: Number of answers kept before the least recently used one is evicted
+        :param ttl: Seconds an answer stays valid
+        :param similarity_threshold: Minimal cosine similarity for a semantic hit, None (or 0) disables the tier
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold or None
+        self._entries = OrderedDict()  # normalized question -> {"result", "vector", "created"}
+        self._matrix = None  # stacked unit vectors of _entries, rebuilt lazily after a change
+        self._matrix_keys = []
+        self._lock = threading.Lock()
+        self._counters = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def _expired(self, entry: Dict) -> bool:
+        return monotonic() - entry["created"] > self.ttl
+
+    def _drop(self, key: str):
+        del self._entries[key]
+        self._matrix = None
+
+    def get_exact(self, text: str) -> Optional[Dict]:
+        """
+        :param text: The user's question
+        :return: The cached result of the same (normalized) question, or None
+        """
+        key = normalize_question(text)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self._expired(entry):
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            self._counters["exact_hits"] += 1
+            return entry["result"]
+
+    def get_semantic(self, vector: List[float]) -> Optional[Dict]:
+        """
+        Looks for a cached question whose embedding is close enough to vector.
+        Counts a miss when nothing qualifies, so call it after get_exact().
+        :param vector: The embedding of the user's question
+        :return: The cached result of the most similar question, or None (always, if the tier is disabled)
+        """
+        if self.similarity_threshold is None:
+            with self._lock:
+                self._counters["misses"] += 1
+            return None
+        query = np.asarray(vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if self._expired(entry)]:
+                self._drop(key)
+            if not self._entries:
+                self._counters["misses"] += 1
+                return None
+            if self._matrix is None:
+                self._matrix_keys = list(self._entries)
+                self._matrix = np.vstack([self._entries[key]["vector"] for key in self._matrix_keys])
+
+            similarities = self._matrix @ query
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.similarity_threshold:
+                self._counters["misses"] += 1
+                return None
+            key = self._matrix_keys[best]
+            self._entries.move_to_end(key)
+            self._counters["semantic_hits"] += 1
+            logger.debug(f"🧠 Semantic cache hit on '{key}' (similarity {similarities[best]:.3f})")
+            return self._entries[key]["result"]
+
+    def put(self, text: str, vector: List[float], result: Dict):
+        """
+        Stores an answer, evicting the least recently used one when the cache is full
+        :param text: The user's question
+        :param vector: The embedding of the question
+        :param result: The result returned by QueryEngine.query()
+        """
+        unit = np.asarray(vector, dtype=np.float32)
+        unit = unit / (np.linalg.norm(unit) or 1.0)
+        key = normalize_question(text)
+        with self._lock:
+            self._entries[key] = {"result": result, "vector": unit, "created": monotonic()}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters["evictions"] += 1
+            self._matrix = None
+
+    def invalidate(self):
+        """
+        Drops every cached answer. Called whenever the FAISS indices are (re)loaded.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+            self._counters["invalidations"] += 1
+
+    def stats(self) -> Dict:
+        """
+        :return: The hit/miss counters and the current number of entries
+        """
+        with self._lock:
+            return {**self._counters, "entries": len(self._entries)}
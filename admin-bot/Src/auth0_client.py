@@ -0,0 +1,235 @@
+# Auth0 Management API token and user queries, used by utility.py
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from time import monotonic
+from typing import Callable, Dict, List
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+ACCOUNT_USERS_QUERY = "app_metadata.originalAccountId:*"  # users that belong to a Firefly account
+MAX_PER_PAGE = 100  # the largest page the users endpoint returns
+MAX_SEARCH_RESULTS = 1000  # Auth0 never pages past the first 1000 results of a search
+
+
+def create_session(retries: int = 3, pool_size: int = 10) -> requests.Session:
+    """
+    :return: A pooled HTTP session that retries rate limited (429) and unavailable (503) responses,
+             waiting for the Retry-After Auth0 sends with them
+    """
+    retry = Retry(total=retries, status_forcelist=[429, 503], backoff_factor=0.5, respect_retry_after_header=True,
+                  allowed_methods=None)  # the token POST is safe to retry too
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_size, pool_maxsize=pool_size)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    return session
+
+
+class Auth0TokenManager:
+    """
+    Caches the Management API token and renews it before it expires.
+
+    get_token() returns the cached token until refresh_margin seconds before its expires_in runs out.
+    When it has to renew, concurrent callers wait for a single client-credentials request instead of sending
+    one each. Once start() was called, a daemon thread renews the token ahead of time, so handlers never wait.
+    """
+
+    def __init__(self, domain: str, client_id: str, client_secret: str, session: requests.Session = None,
+                 refresh_margin: float = 300, timeout: float = 10):
+        """
+        :param domain: The Auth0 tenant domain
+        :param client_id: The client id of the machine to machine application
+        :param client_secret: Its client secret
+        :param session: The HTTP session to use, see create_session()
+        :param refresh_margin: Seconds before expiry at which the token is renewed
+        :param timeout: Timeout of the token request, in seconds
+        """
+        self.domain = domain
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.session = session or create_session()
+        self.refresh_margin = refresh_margin
+        self.timeout = timeout
+        self._token = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+        self._used = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _request_token(self):
+        response = self.session.post(f"https://{self.domain}/oauth/token", timeout=self.timeout, json={
+            "grant_type": "client_credentials",
+            "client_id": self.client_id,
+            "client_secret": self.client_secret,
+            "audience": f"https://{self.domain}/api/v2/",
+        })
+        response.raise_for_status()
+        data = response.json()
+        self._token = data["access_token"]
+        self._expires_at = monotonic() + float(data.get("expires_in", 86400))
+        logger.info(f"🔑 Auth0 management token renewed, valid for {float(data.get('expires_in', 86400)):.0f}s")
+
+    def _is_fresh(self) -> bool:
+        return self._token is not None and monotonic() < self._expires_at - self.refresh_margin
+
+    def get_token(self) -> str:
+        """
+        :return: A valid Management API token
+        """
+        self._used.set()
+        if self._is_fresh():
+            return self._token
+        with self._lock:
+            if not self._is_fresh():  # renewed by another caller while we waited
+                self._request_token()
+            return self._token
+
+    def invalidate(self):
+        """
+        Drops the cached token, e.g. after Auth0 rejected it
+        """
+        with self._lock:
+            self._token = None
+
+    def start(self):
+        """
+        Renews the token in a daemon thread ahead of its expiry, from its first use on
+        """
+        self._thread = threading.Thread(target=self._run, name="auth0-token", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._used.set()
+
+    def _run(self):
+        self._used.wait()
+        while not self._stop.is_set():
+            delay = self._expires_at - self.refresh_margin - monotonic()
+            if delay > 0 and self._stop.wait(delay):
+                return
+            try:
+                with self._lock:
+                    if not self._is_fresh():
+                        self._request_token()
+            except Exception as e:
+                logger.error(f"🚨 Auth0 token renewal failed: {str(e)}")
+                if self._stop.wait(30):
+                    return
+
+
+def lucene_datetime(value: datetime) -> str:
+    """
+    :return: A datetime in the format of the users' created_at, e.g. 2024-09-13T09:30:00.000Z
+    """
+    value = value.astimezone(timezone.utc)
+    return value.strftime("%Y-%m-%dT%H:%M:%S.") + f"{value.microsecond // 1000:03d}Z"
+
+
+def created_between_query(start: datetime, end: datetime, query: str = ACCOUNT_USERS_QUERY) -> str:
+    """
+    :return: A Lucene query for the users matching query and created from start to end (inclusive)
+    """
+    return f"{query} AND created_at:[{lucene_datetime(start)} TO {lucene_datetime(end)}]"
+
+
+class Auth0UserQuery:
+    """
+    Searches Auth0 users with the filtering done by Auth0.
+
+    The created_at range is part of the Lucene query, so only the matching users are paged through,
+    100 per request, and include_totals tells when the last page was reached without an extra request.
+    The users created in the last 7 days are cached for ttl seconds, so the sandbox count, its options and
+    the details view share one result set, and concurrent callers share one search.
+    A request rejected with 401 (e.g. the token was revoked before it expired) is sent once more with a new token.
+    """
+
+    def __init__(self, domain: str, get_token: Callable[[], str], ttl: float = 60, per_page: int = MAX_PER_PAGE,
+                 session: requests.Session = None, timeout: float = 10, invalidate_token: Callable[[], None] = None):
+        """
+        :param domain: The Auth0 tenant domain
+        :param get_token: Returns a Management API token
+        :param ttl: Seconds a result set is reused
+        :param per_page: Users per page, at most 100
+        :param session: The HTTP session to use, see create_session()
+        :param timeout: Timeout of a single request, in seconds
+        :param invalidate_token: Drops the cached token, so get_token() requests a new one, e.g.
+                                 Auth0TokenManager.invalidate. Without it a 401 is raised right away
+        """
+        self.domain = domain
+        self.get_token = get_token
+        self.invalidate_token = invalidate_token
+        self.ttl = ttl
+        self.per_page = min(per_page, MAX_PER_PAGE)
+        self.session = session or create_session()
+        self.timeout = timeout
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def _get(self, url: str, params: Dict) -> Dict:
+        """
+        :return: The JSON of a Management API GET, renewing the token once if Auth0 rejects it
+        """
+        response = self.session.get(url, headers={"Authorization": f"Bearer {self.get_token()}"}, params=params,
+                                    timeout=self.timeout)
+        if response.status_code == 401 and self.invalidate_token is not None:
+            logger.warning("🔑 Auth0 rejected the management token, retrying with a new one")
+            self.invalidate_token()
+            response = self.session.get(url, headers={"Authorization": f"Bearer {self.get_token()}"}, params=params,
+                                        timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def search(self, query: str) -> List[Dict]:
+        """
+        :param query: A Lucene query of the v3 user search
+        :return: Every user matching the query
+        """
+        url = f"https://{self.domain}/api/v2/users"
+        params = {"q": query, "search_engine": "v3", "include_totals": "true", "per_page": self.per_page, "page": 0}
+        users = []
+        while True:
+            data = self._get(url, params)
+            page = data.get("users", [])
+            users.extend(page)
+            total = data.get("total", 0)
+            if not page or len(users) >= min(total, MAX_SEARCH_RESULTS):
+                break
+            params["page"] += 1
+        if total > MAX_SEARCH_RESULTS:
+            logger.warning(f"⚠️ Auth0 search matched {total} users, only the first {MAX_SEARCH_RESULTS} are returned")
+        return users
+
+    def get_users_created_between(self, start: datetime, end: datetime) -> List[Dict]:
+        """
+        :return: Users of Firefly accounts created from start to end (inclusive), not cached
+        """
+        started = monotonic()
+        users = self.search(created_between_query(start, end))
+        logger.debug(f"🔍 Auth0 returned {len(users)} users created between {start} and {end} "
+                     f"in {monotonic() - started:.2f}s")
+        return users
+
+    def get_users_created_last_days(self, days: int = 7) -> List[Dict]:
+        """
+        Users created in the last days (from yesterday), served from the cache while it is fresh
+        Example: if today is 14.9, last 7 days should be 7.9-13.9
+        """
+        with self._lock:
+            cached = self._cache.get(days)
+            if cached and monotonic() - cached[0] < self.ttl:
+                return cached[1]
+            # Calculate from yesterday (not from today)
+            yesterday = datetime.now(timezone.utc) - timedelta(days=1)
+            users = self.get_users_created_between(yesterday - timedelta(days=days), yesterday)
+            self._cache[days] = (monotonic(), users)
+            return users
+
+    def invalidate(self):
+        with self._lock:
+            self._cache.clear()
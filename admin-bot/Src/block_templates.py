@@ -0,0 +1,108 @@
+# Slack Block Kit templates loaded once and copied per render, used by utility.py
+import json
+import logging
+import marshal
+import os
+import threading
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+
+class TemplateError(Exception):
+    """
+    A template file is missing, is not valid JSON or lacks a block the renderers fill in
+    """
+
+
+def validate_template(name: str, template, min_blocks: int = 0):
+    """
+    :param min_blocks: Number of blocks a message template has to hold, 0 for a single block template
+    :raise TemplateError: If the template has not the expected shape
+    """
+    if not isinstance(template, dict):
+        raise TemplateError(f"Template {name} is not a JSON object")
+    if min_blocks:
+        blocks = template.get("blocks")
+        if not isinstance(blocks, list) or len(blocks) < min_blocks:
+            raise TemplateError(f"Template {name} needs at least {min_blocks} blocks")
+    elif "type" not in template:
+        raise TemplateError(f"Template {name} is not a block, it has no type")
+
+
+class TemplateRegistry:
+    """
+    Parses every template once, so a render costs a copy instead of opening and parsing a file.
+
+    load() reads and validates all templates, at startup a broken template fails right away instead of on the
+    first click. Parsed templates are kept marshalled (JSON only holds types marshal supports), so get() hands out
+    a fresh deep copy for about half the cost of json.loads and a tenth of copy.deepcopy. With reload set, get()
+    compares the modification time of the file first and parses it again when it was changed, which is handy
+    while editing templates.
+    """
+
+    def __init__(self, paths: Dict[str, str], min_blocks: Dict[str, int] = None, reload: bool = False):
+        """
+        :param paths: Template name -> JSON file
+        :param min_blocks: Template name -> number of blocks it must hold, see validate_template()
+        :param reload: Whether get() picks up changed files
+        """
+        self.paths = paths
+        self.min_blocks = min_blocks or {}
+        self.reload = reload
+        self._templates = {}  # name -> (mtime, marshalled template)
+        self._lock = threading.Lock()
+
+    def _read(self, name: str):
+        path = self.paths[name]
+        try:
+            mtime = os.path.getmtime(path)
+            with open(path, "r") as f:
+                template = json.load(f)
+        except FileNotFoundError:
+            raise TemplateError(f"Template file not found: {path}")
+        except json.JSONDecodeError as e:
+            raise TemplateError(f"Failed to parse template {path}: {str(e)}")
+        validate_template(name, template, self.min_blocks.get(name, 0))
+        self._templates[name] = (mtime, marshal.dumps(template))
+
+    def _changed(self, name: str, mtime: float) -> bool:
+        try:
+            return os.path.getmtime(self.paths[name]) != mtime
+        except OSError:
+            return False  # e.g. replaced right now, keep the parsed one
+
+    def load(self):
+        """
+        Reads and validates every template
+        :raise TemplateError: If one of them is broken
+        """
+        with self._lock:
+            for name in self.paths:
+                self._read(name)
+        logger.info(f"🧩 Loaded {len(self.paths)} Slack templates")
+
+    def get(self, name: str):
+        """
+        :param name: A template name, e.g. "block"
+        :return: A copy of the template to fill in
+        :raise TemplateError: If the template cannot be read
+        """
+        cached = self._templates.get(name)
+        if cached is None or (self.reload and self._changed(name, cached[0])):
+            with self._lock:
+                try:
+                    self._read(name)
+                except TemplateError as e:
+                    if cached is None:
+                        raise
+                    # half saved or broken edit, keep rendering the last good version
+                    logger.error(f"🚨 Keeping the previous Slack template {name}: {str(e)}")
+                    try:
+                        self._templates[name] = (os.path.getmtime(self.paths[name]), cached[1])
+                    except OSError:
+                        pass
+                else:
+                    if cached is not None:
+                        logger.info(f"🧩 Reloaded the changed Slack template {name}")
+        return marshal.loads(self._templates[name][1])
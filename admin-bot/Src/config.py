@@ -25,4 +25,62 @@ class Vars(BaseSettings):
     deals_api_url: str = Field(default_factory=lambda: os.getenv("DEALS_API_URL", ""))
     owners_api_url: str = Field(default_factory=lambda: os.getenv("OWNERS_API_URL", ""))
     AZURE_API_KEY: str = Field(default_factory=lambda: os.getenv("AZURE_API_KEY", ""))
-    AZURE_OPENAI_ENDPOINT: str = Field(default_factory=lambda: os.getenv("AZURE_OPENAI_ENDPOINT", ""))
\ No newline at end of file
+    AZURE_OPENAI_ENDPOINT: str = Field(default_factory=lambda: os.getenv("AZURE_OPENAI_ENDPOINT", ""))
+
+    # FireflyBot query engine
+    qa_max_workers: int = Field(default_factory=lambda: int(os.getenv("QA_MAX_WORKERS", "6")))
+    qa_source_timeout: float = Field(default_factory=lambda: float(os.getenv("QA_SOURCE_TIMEOUT", "15")))
+    qa_source_weights: str = Field(default_factory=lambda: os.getenv("QA_SOURCE_WEIGHTS", ""))
+
+    # FireflyBot answer cache
+    answer_cache_size: int = Field(default_factory=lambda: int(os.getenv("ANSWER_CACHE_SIZE", "256")))
+    answer_cache_ttl: float = Field(default_factory=lambda: float(os.getenv("ANSWER_CACHE_TTL", "3600")))
+    # Cosine similarity of a semantic cache hit, 0 (default) only serves exact repeats. With ada-002 use at least 0.98,
+    # lower values answer questions about a different entity, see benchmarks/eval_semantic_cache.py
+    answer_cache_similarity: float = Field(default_factory=lambda: float(os.getenv("ANSWER_CACHE_SIMILARITY", "0")))
+
+    # FAISS index hot reload from S3, 0 disables it
+    index_refresh_interval: float = Field(default_factory=lambda: float(os.getenv("INDEX_REFRESH_INTERVAL", "600")))
+
+    # Seconds between two edits of a streamed FireflyBot answer
+    slack_stream_interval: float = Field(default_factory=lambda: float(os.getenv("SLACK_STREAM_INTERVAL", "1.5")))
+    # Optional token budget of a FireflyBot answer, 0 means only Slack's size limit applies
+    answer_max_tokens: int = Field(default_factory=lambda: int(os.getenv("ANSWER_MAX_TOKENS", "0")))
+
+    # FAISS index type per source ("hnsw" or "slack:ivf_pq,confluence:hnsw"), built by rebuild_indices.py
+    faiss_index_type: str = Field(default_factory=lambda: os.getenv("FAISS_INDEX_TYPE", "flat"))
+    faiss_nprobe: int = Field(default_factory=lambda: int(os.getenv("FAISS_NPROBE", "16")))
+    faiss_ef_search: int = Field(default_factory=lambda: int(os.getenv("FAISS_EF_SEARCH", "64")))
+
+    # 'start' dashboard: sources fetched concurrently, each one shown as unavailable after its timeout
+    dashboard_max_workers: int = Field(default_factory=lambda: int(os.getenv("DASHBOARD_MAX_WORKERS", "12")))
+    dashboard_source_timeout: float = Field(default_factory=lambda: float(os.getenv("DASHBOARD_SOURCE_TIMEOUT", "10")))
+    # Seconds between two background rebuilds of the dashboard snapshot (0 disables them), and the maximal age
+    # of a snapshot served by 'start' before it is rebuilt on the spot
+    dashboard_refresh_interval: float = Field(default_factory=lambda: float(os.getenv("DASHBOARD_REFRESH_INTERVAL", "300")))
+    dashboard_max_age: float = Field(default_factory=lambda: float(os.getenv("DASHBOARD_MAX_AGE", "900")))
+
+    # Local time series of website visitor events (rb2b-filter messages)
+    visitor_store_path: str = Field(default_factory=lambda: os.getenv("VISITOR_STORE_PATH", "./visitors.sqlite"))
+
+    # Seconds the Auth0 users created in the last 7 days are reused
+    auth0_cache_ttl: float = Field(default_factory=lambda: float(os.getenv("AUTH0_CACHE_TTL", "60")))
+
+    # Local SQLite mirror of the HubSpot deals, synced by hs_lastmodifieddate. Queries reuse a sync for
+    # DEAL_MIRROR_SYNC_INTERVAL seconds, deleted deals are dropped by a full sync every DEAL_MIRROR_FULL_SYNC_INTERVAL
+    deal_mirror_path: str = Field(default_factory=lambda: os.getenv("DEAL_MIRROR_PATH", "./deals.sqlite"))
+    deal_mirror_retention_days: int = Field(default_factory=lambda: int(os.getenv("DEAL_MIRROR_RETENTION_DAYS", "120")))
+    deal_mirror_sync_interval: float = Field(default_factory=lambda: float(os.getenv("DEAL_MIRROR_SYNC_INTERVAL", "60")))
+    deal_mirror_full_sync_interval: float = Field(default_factory=lambda: float(os.getenv("DEAL_MIRROR_FULL_SYNC_INTERVAL", "86400")))
+
+    # Re-read a Slack template when its file changes (for editing templates, they are parsed once otherwise)
+    template_reload: bool = Field(default_factory=lambda: os.getenv("TEMPLATE_RELOAD", "false").lower() == "true")
+
+    # Seconds a Slack user name is cached before it is looked up again (the whole workspace is reloaded as often)
+    user_directory_ttl: float = Field(default_factory=lambda: float(os.getenv("USER_DIRECTORY_TTL", "3600")))
+
+    # Account management sessions: idle seconds before a session expires, the most kept in memory, and an optional
+    # redis:// URL (needs the redis package) so several bot replicas share them
+    session_ttl: float = Field(default_factory=lambda: float(os.getenv("SESSION_TTL", "3600")))
+    session_max: int = Field(default_factory=lambda: int(os.getenv("SESSION_MAX", "1000")))
+    session_redis_url: str = Field(default_factory=lambda: os.getenv("SESSION_REDIS_URL", ""))
\ No newline at end of file
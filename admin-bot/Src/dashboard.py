@@ -0,0 +1,199 @@
+# Concurrent assembly of the dashboard posted on 'start', used by main.main_menu
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from time import monotonic, time
+from typing import Callable, Dict
+
+import requests
+
+import utility
+
+logger = logging.getLogger(__name__)
+
+
+def get_retool_results(url: str, timeout: float) -> Dict:
+    """
+    :return: The JSON returned by a Retool workflow, e.g. {"results": [[id, name], ...]}
+    """
+    response = requests.get(url, timeout=timeout)
+    response.raise_for_status()
+    return response.json()
+
+
+def get_sandbox_users() -> list:
+    """
+    Unlike utility.get_users_created_in_last_seven_days(), lets Auth0 errors through,
+    so the section is shown as unavailable instead of as 0
+    :return: Auth0 users created in the last 7 days (from yesterday)
+    """
+    return utility.auth0_users.get_users_created_last_days(7)
+
+
+def make_dashboard_sources(slack_client, trial_urls: Dict[str, str], request_timeout: float = 10) -> Dict[str, Callable]:
+    """
+    Declares every data source of the dashboard as an independent task
+    :param slack_client: The Slack WebClient used to count website visitors, with a timeout of about request_timeout
+    :param trial_urls: Dashboard key -> Retool workflow URL (trial_7_days, trial_about_end, trial_in_progress)
+    :param request_timeout: Timeout of a single Retool request, in seconds
+    :return: A dictionary of source name -> function without arguments, see utility.make_tel_block() for the names
+    """
+    sources = {key: (lambda url=url: get_retool_results(url, request_timeout)) for key, url in trial_urls.items()}
+    sources["sandbox_users"] = get_sandbox_users
+    sources["deals"] = utility.get_dashboard_deals  # every deal window from one query of the deal mirror
+    sources["visitors_last_7_days"] = lambda: utility.get_visitors_last_7_days(slack_client)
+    sources["visitors_current_month"] = lambda: utility.get_visitors_current_month(slack_client)
+    sources["visitors_last_month"] = lambda: utility.get_visitors_last_month(slack_client)
+    sources["visitors_two_months_back"] = lambda: utility.get_visitors_two_months_back(slack_client)
+    return sources
+
+
+class DashboardBuilder:
+    """
+    Runs the data sources of the dashboard concurrently.
+
+    Each source gets its own deadline. A source that fails or misses it is left out of the result,
+    so the dashboard is rendered with the other sections and a "data unavailable" marker for it,
+    instead of the whole 'start' command failing or waiting on the slowest API. A source that is already
+    running when it misses its deadline keeps its worker until it returns, so every source has to bound
+    its own requests: Retool through request_timeout, HubSpot and Auth0 through the timeout of their
+    clients in utility.py and the visitor counts through the timeout of the Slack client.
+    """
+
+    def __init__(self, make_sources: Callable[[], Dict[str, Callable]], max_workers: int = 12,
+                 timeout: float = 10, source_timeouts: Dict[str, float] = None):
+        """
+        :param make_sources: Returns source name -> function, called on every build so date ranges stay current
+        :param max_workers: Maximal number of sources fetched at the same time
+        :param timeout: Seconds a source may take before its section is shown as unavailable
+        :param source_timeouts: Optional per-source overrides of timeout
+        """
+        self.make_sources = make_sources
+        self.timeout = timeout
+        self.source_timeouts = source_timeouts or {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="dashboard")
+
+    def build(self) -> Dict:
+        """
+        Fetches every source
+        :return: {"data": source -> value, "errors": source -> message, "timings": source -> seconds, "seconds": total}
+        """
+        started = monotonic()
+        sources = self.make_sources()
+        futures = {name: self._executor.submit(self._timed_call, func) for name, func in sources.items()}
+        deadlines = {name: started + self.source_timeouts.get(name, self.timeout) for name in sources}
+
+        data, errors, timings = {}, {}, {}
+        pending = set(futures)
+        while pending:
+            now = monotonic()
+            for name in [name for name in pending if deadlines[name] <= now and not futures[name].done()]:
+                futures[name].cancel()
+                errors[name] = f"timed out after {deadlines[name] - started:.1f}s"
+                timings[name] = now - started
+                pending.discard(name)
+            if not pending:
+                break
+            wait([futures[name] for name in pending], timeout=max(min(deadlines[name] for name in pending) - now, 0),
+                 return_when="FIRST_COMPLETED")
+            for name in [name for name in pending if futures[name].done()]:
+                pending.discard(name)
+                try:
+                    data[name], timings[name] = futures[name].result()
+                except Exception as e:
+                    errors[name] = str(e)
+                    timings[name] = monotonic() - started
+
+        total = monotonic() - started
+        breakdown = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in
+                              sorted(timings.items(), key=lambda item: item[1], reverse=True))
+        logger.info(f"📊 Dashboard built in {total:.2f}s ({len(errors)} unavailable): {breakdown}")
+        for name, error in errors.items():
+            logger.warning(f"⚠️ Dashboard source {name} is unavailable: {error}")
+        return {"data": data, "errors": errors, "timings": timings, "seconds": total}
+
+    @staticmethod
+    def _timed_call(func: Callable):
+        """
+        :return: (value, seconds the source took)
+        """
+        started = monotonic()
+        value = func()
+        return value, monotonic() - started
+
+
+class DashboardSnapshot:
+    """
+    Keeps the latest dashboard precomputed, so 'start' answers from memory.
+
+    A daemon thread rebuilds the snapshot every interval seconds. get() serves the latest snapshot and only
+    builds one itself when there is none yet or it is older than max_age (e.g. the thread is stuck on an API).
+    refresh() forces a rebuild. Concurrent rebuilds are collapsed into one: callers that arrive while a build is
+    running wait for it and share its result instead of hitting HubSpot/Auth0/Slack again.
+    """
+
+    def __init__(self, builder: DashboardBuilder, interval: float = 300, max_age: float = 900):
+        """
+        :param builder: Builds the dashboard data
+        :param interval: Seconds between two background rebuilds, 0 disables the background thread
+        :param max_age: Seconds after which get() rebuilds a snapshot itself
+        """
+        self.builder = builder
+        self.interval = interval
+        self.max_age = max_age
+        self._snapshot = None
+        self._build_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        Starts rebuilding in a daemon thread, the first snapshot is built right away
+        """
+        if self.interval <= 0:
+            return
+        self._thread = threading.Thread(target=self._run, name="dashboard-snapshot", daemon=True)
+        self._thread.start()
+        logger.info(f"🔄 Dashboard snapshot refreshed every {self.interval}s")
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"🚨 Dashboard snapshot refresh failed: {str(e)}", exc_info=True)
+            if self._stop.wait(self.interval):
+                return
+
+    def age(self) -> float:
+        """
+        :return: Seconds since the current snapshot was built, None if there is none
+        """
+        snapshot = self._snapshot
+        return time() - snapshot["built_at"] if snapshot else None
+
+    def get(self) -> Dict:
+        """
+        :return: The latest snapshot (see DashboardBuilder.build() plus "built_at", a UNIX timestamp)
+        """
+        snapshot = self._snapshot
+        if snapshot is None or time() - snapshot["built_at"] > self.max_age:
+            return self.refresh()
+        return snapshot
+
+    def refresh(self) -> Dict:
+        """
+        Rebuilds the snapshot, or waits for the rebuild already in progress
+        :return: The new snapshot
+        """
+        previous = self._snapshot
+        with self._build_lock:
+            if self._snapshot is not previous:  # built by another caller while we waited
+                return self._snapshot
+            snapshot = self.builder.build()
+            snapshot["built_at"] = time()
+            self._snapshot = snapshot
+            return snapshot
@@ -1,32 +1,138 @@
 import boto3
+import json
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from time import perf_counter
+from boto3.s3.transfer import TransferConfig
 
 S3_BUCKET_NAME = "firefly-ai-bot"
 LOCAL_DOWNLOAD_DIR = "/src/data"  # Store data inside the container
 
+# files downloaded in parallel, each one is fetched in ranged parts by the boto3 transfer manager
+SYNC_WORKERS = int(os.getenv("S3_SYNC_WORKERS", "8"))
+TRANSFER_CONFIG = TransferConfig(multipart_threshold=16 * 2 ** 20,
+                                 multipart_chunksize=16 * 2 ** 20,
+                                 max_concurrency=int(os.getenv("S3_PART_CONCURRENCY", "4")))
+
+# ETag/size of every synced object, used to skip unchanged files on the next start
+MANIFEST_FILE_NAME = ".s3_manifest.json"
+PARTIAL_SUFFIX = ".part"
+
 # ✅ Use default AWS authentication (works with IRSA in Kubernetes)
 s3_client = boto3.client("s3")
 
-def download_all_s3_files(bucket_name, local_dir):
+
+def list_bucket_objects(client, bucket_name):
+    """
+    Lists every object in the bucket, following the 1000 keys per page pagination.
+    :return: A dictionary of key -> {"etag": ..., "size": ...}
+    """
+    objects = {}
+    for page in client.get_paginator("list_objects_v2").paginate(Bucket=bucket_name):
+        for obj in page.get("Contents", []):
+            if obj["Key"].endswith("/"):  # skip "folder" placeholder objects
+                continue
+            objects[obj["Key"]] = {"etag": obj["ETag"], "size": obj["Size"]}
+    return objects
+
+
+def read_manifest(local_dir):
+    """
+    :return: The manifest of the last sync into local_dir, empty if there was none
+    """
+    try:
+        with open(os.path.join(local_dir, MANIFEST_FILE_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_manifest(local_dir, manifest):
+    path = os.path.join(local_dir, MANIFEST_FILE_NAME)
+    with open(path + PARTIAL_SUFFIX, "w") as f:
+        json.dump(manifest, f)
+    os.replace(path + PARTIAL_SUFFIX, path)
+
+
+def is_up_to_date(local_dir, key, obj, manifest):
+    """
+    :return: True if the local copy of key matches the object in S3
+    """
+    local_path = os.path.join(local_dir, key)
+    return manifest.get(key) == obj and os.path.exists(local_path) and os.path.getsize(local_path) == obj["size"]
+
+
+def download_file(client, bucket_name, key, local_path):
+    """
+    Downloads a single object next to its destination and renames it into place,
+    so a crash never leaves a half written file behind.
+    :return: The number of seconds the download took
+    """
+    started = perf_counter()
+    os.makedirs(os.path.dirname(local_path), exist_ok=True)
+    client.download_file(bucket_name, key, local_path + PARTIAL_SUFFIX, Config=TRANSFER_CONFIG)
+    os.replace(local_path + PARTIAL_SUFFIX, local_path)
+    return perf_counter() - started
+
+
+def sync_bucket(client, bucket_name, local_dir, workers=SYNC_WORKERS, objects=None):
+    """
+    Makes local_dir a copy of the bucket: new and changed objects are downloaded in parallel,
+    unchanged ones (same ETag and size as in the manifest) are skipped and deleted ones are removed.
+    :param objects: The bucket listing, if the caller already has it
+    :return: A dictionary with the downloaded/skipped/removed counts, bytes, seconds and per-file timings
+    """
+    started = perf_counter()
     os.makedirs(local_dir, exist_ok=True)
+    if objects is None:
+        objects = list_bucket_objects(client, bucket_name)
+    manifest = read_manifest(local_dir)
 
-    # List all files in S3 bucket
-    objects = s3_client.list_objects_v2(Bucket=bucket_name)
-    if "Contents" not in objects:
-        print("🚨 No files found in S3 bucket!")
-        return
+    to_download = {key: obj for key, obj in objects.items() if not is_up_to_date(local_dir, key, obj, manifest)}
+    removed = [key for key in manifest if key not in objects]
+
+    timings = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {executor.submit(download_file, client, bucket_name, key, os.path.join(local_dir, key)): key
+                   for key in to_download}
+        for future in as_completed(futures):
+            key = futures[future]
+            timings[key] = future.result()
+            print(f"✅ Downloaded: {key} ({to_download[key]['size']} bytes in {timings[key]:.2f}s)")
 
-    print("📂 Downloading files from S3...")
-    for obj in objects["Contents"]:
-        key = obj["Key"]
+    for key in removed:
         local_path = os.path.join(local_dir, key)
+        if os.path.exists(local_path):
+            os.remove(local_path)
+        print(f"🗑️ Removed: {key}")
+
+    write_manifest(local_dir, objects)
+    total_bytes = sum(obj["size"] for obj in to_download.values())
+    seconds = perf_counter() - started
+    return {"downloaded": len(to_download),
+            "skipped": len(objects) - len(to_download),
+            "removed": len(removed),
+            "bytes": total_bytes,
+            "seconds": seconds,
+            "timings": timings}
+
+
+def download_all_s3_files(bucket_name, local_dir):
+    objects = list_bucket_objects(s3_client, bucket_name)
+    if not objects:
+        print("🚨 No files found in S3 bucket!")
+        return
 
-        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+    print(f"📂 Syncing {len(objects)} files from S3 with {SYNC_WORKERS} workers...")
+    stats = sync_bucket(s3_client, bucket_name, local_dir, objects=objects)
+    rate = stats["bytes"] / stats["seconds"] if stats["seconds"] else 0
+    print(f"📊 {stats['downloaded']} downloaded, {stats['skipped']} unchanged, {stats['removed']} removed: "
+          f"{stats['bytes'] / 2 ** 20:.1f} MB in {stats['seconds']:.2f}s ({rate / 2 ** 20:.1f} MB/s)")
+    for key, seconds in sorted(stats["timings"].items(), key=lambda item: item[1], reverse=True):
+        print(f"⏱️ {key}: {seconds:.2f}s")
 
-        print(f"📥 {key} -> {local_path}")
-        s3_client.download_file(bucket_name, key, local_path)
-        print(f"✅ Downloaded: {local_path}")
 
-# Run the download
-download_all_s3_files(S3_BUCKET_NAME, LOCAL_DOWNLOAD_DIR)
-print(f"🎉 All S3 files downloaded to {LOCAL_DOWNLOAD_DIR}")
\ No newline at end of file
+if __name__ == "__main__":
+    # Run the download
+    download_all_s3_files(S3_BUCKET_NAME, LOCAL_DOWNLOAD_DIR)
+    print(f"🎉 All S3 files downloaded to {LOCAL_DOWNLOAD_DIR}")
@@ -0,0 +1,327 @@
+# Memory-mapped, lazily loaded FAISS indices with an on-disk document store, used by main.py
+import json
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+from time import perf_counter
+from typing import Dict, List, Tuple
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+# files written by LangChain's FAISS.save_local()
+INDEX_FILE_NAME = "index.faiss"
+DOCSTORE_FILE_NAME = "index.pkl"
+
+# IO_FLAG_MMAP_IFC also maps the codes of flat indices (faiss >= 1.8), IO_FLAG_MMAP alone only covers IVF lists
+MMAP_FLAGS = faiss.IO_FLAG_MMAP | getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+
+# "flat" is the exact index written by LangChain, the others are approximate and built by rebuild_indices.py
+INDEX_TYPES = ("flat", "ivf_flat", "hnsw", "ivf_pq")
+DEFAULT_NPROBE = 16
+DEFAULT_EF_SEARCH = 64
+
+
+def get_rss_bytes() -> int:
+    """
+    :return: The resident set size of the process in bytes, 0 where /proc is not available
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def index_file_name(index_type: str) -> str:
+    """
+    :return: The file name of an index type inside an index directory, e.g. index_hnsw.faiss
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown FAISS index type {index_type}, expected one of {', '.join(INDEX_TYPES)}")
+    return INDEX_FILE_NAME if index_type == "flat" else f"index_{index_type}.faiss"
+
+
+def parse_index_types(s: str, default: str = "flat") -> Dict[str, str]:
+    """
+    :param s: Either a single index type used by every source ("hnsw"),
+              or comma separated source:type pairs ("slack:ivf_pq,confluence:hnsw")
+    :return: A dictionary of source -> index type, the "*" key holds the type of unlisted sources
+    """
+    index_types = {"*": default}
+    for item in filter(None, (part.strip() for part in (s or "").split(","))):
+        source, _, index_type = item.rpartition(":")
+        index_file_name(index_type.strip())  # validates the type
+        index_types[source.strip() or "*"] = index_type.strip()
+    return index_types
+
+
+def build_ann_index(flat_index, index_type: str, nlist: int = None, hnsw_m: int = 32, pq_m: int = None,
+                    train_size: int = 100000, batch_size: int = 50000, seed: int = 1234):
+    """
+    Builds an approximate index holding the same vectors, with the same row ids, as an exact flat index,
+    so the document store of the flat index keeps working unchanged.
+    :param flat_index: The flat index written by LangChain's FAISS.save_local()
+    :param index_type: One of "ivf_flat", "hnsw", "ivf_pq"
+    :param nlist: Number of IVF lists, 4 * sqrt(vectors) by default
+    :param hnsw_m: Neighbours per HNSW node
+    :param pq_m: Number of PQ sub-quantizers (must divide the dimension), about dimension / 8 by default
+    :param train_size: Maximal number of vectors sampled to train IVF/PQ quantizers
+    :param batch_size: Vectors reconstructed and added per batch
+    :return: The new index
+    """
+    n, dim, metric = flat_index.ntotal, flat_index.d, flat_index.metric_type
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, hnsw_m, metric)
+        index.hnsw.efConstruction = 200
+    elif index_type in ("ivf_flat", "ivf_pq"):
+        # faiss wants at least 39 training points per list
+        nlist = max(1, min(nlist or int(4 * np.sqrt(n)), n // 39))
+        quantizer = faiss.IndexFlat(dim, metric)
+        if index_type == "ivf_flat":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist, metric)
+        else:
+            if n < 256:
+                raise ValueError(f"IVF-PQ needs at least 256 vectors to train, the index has {n}")
+            pq_m = pq_m or next(m for m in range(max(1, dim // 8), 0, -1) if dim % m == 0)
+            if dim % pq_m:
+                raise ValueError(f"pq_m={pq_m} does not divide the dimension {dim}")
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, pq_m, 8, metric)
+        sample = np.random.default_rng(seed).choice(n, size=min(n, train_size), replace=False)
+        index.train(np.vstack([flat_index.reconstruct(int(i)) for i in np.sort(sample)]))
+        # hand the quantizer over to the index, so it is freed together with it
+        index.own_fields = True
+        quantizer.this.disown()
+    else:
+        raise ValueError(f"Cannot build an approximate index of type {index_type}")
+
+    for start in range(0, n, batch_size):
+        index.add(flat_index.reconstruct_n(start, min(batch_size, n - start)))
+    return index
+
+
+def set_search_params(index, nprobe: int = DEFAULT_NPROBE, ef_search: int = DEFAULT_EF_SEARCH):
+    """
+    Sets the query-time accuracy/speed knobs of an approximate index, does nothing for flat indices
+    :param nprobe: IVF lists scanned per query
+    :param ef_search: Size of the HNSW candidate list per query
+    """
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = min(nprobe, ivf.nlist)
+    hnsw = getattr(faiss.downcast_index(index), "hnsw", None)
+    if hnsw is not None:
+        hnsw.efSearch = ef_search
+
+
+def index_type_of(index) -> str:
+    """
+    :return: The INDEX_TYPES name of a loaded index
+    """
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf_flat"
+    return "flat"
+
+
+def write_metadata_store(metadata_path: str, rows) -> int:
+    """
+    Writes a slim SQLite document store keyed by FAISS row id.
+    The store is written to a temporary file and renamed, so readers never see a half written store.
+    :param metadata_path: Where to write the SQLite store
+    :param rows: An iterable of (row_id, doc_id, page_content, metadata dictionary)
+    :return: The number of documents written
+    """
+    tmp_path = metadata_path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    connection = sqlite3.connect(tmp_path)
+    count = 0
+    try:
+        connection.execute("CREATE TABLE docs (row_id INTEGER PRIMARY KEY, doc_id TEXT, page_content TEXT, metadata TEXT)")
+        for row_id, doc_id, page_content, metadata in rows:
+            connection.execute("INSERT INTO docs VALUES (?, ?, ?, ?)",
+                               (int(row_id), doc_id, page_content, json.dumps(metadata, default=str)))
+            count += 1
+        connection.commit()
+    finally:
+        connection.close()
+    os.replace(tmp_path, metadata_path)
+    return count
+
+
+def build_metadata_store(index_dir: str, metadata_path: str) -> int:
+    """
+    Converts the pickled LangChain docstore of an index into a slim SQLite store (see write_metadata_store)
+    :param index_dir: The directory written by FAISS.save_local()
+    :param metadata_path: Where to write the SQLite store
+    :return: The number of documents written
+    """
+    with open(os.path.join(index_dir, DOCSTORE_FILE_NAME), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+
+    def rows():
+        for row_id, doc_id in index_to_docstore_id.items():
+            doc = docstore.search(doc_id)
+            if isinstance(doc, Document):
+                yield row_id, doc_id, doc.page_content, doc.metadata
+
+    return write_metadata_store(metadata_path, rows())
+
+
+def ensure_metadata_store(source: str, index_dir: str, metadata_path: str) -> bool:
+    """
+    Builds the SQLite document store of an index if it is missing or older than the pickled docstore.
+    Called when the data is downloaded or refreshed, so LazyFaissIndex.load() only has to open the store.
+    :param source: The name of the source, used in log lines
+    :param index_dir: The directory written by FAISS.save_local()
+    :param metadata_path: Where the SQLite store is kept
+    :return: True if the store was (re)built
+    """
+    docstore_path = os.path.join(index_dir, DOCSTORE_FILE_NAME)
+    if os.path.exists(metadata_path) and not (
+            os.path.exists(docstore_path) and os.path.getmtime(metadata_path) < os.path.getmtime(docstore_path)):
+        return False
+    started = perf_counter()
+    logger.info(f"🔄 Building document store {metadata_path} for {source}...")
+    count = build_metadata_store(index_dir, metadata_path)
+    logger.info(f"✅ Document store for {source} built with {count} documents in {perf_counter() - started:.2f}s")
+    return True
+
+
+class LazyFaissIndex:
+    """
+    A read-only FAISS vector store that is opened on first query.
+
+    The raw index file (the exact flat index, or an approximate one built by rebuild_indices.py) is
+    memory-mapped, so vectors are paged in by the kernel instead of being copied into the process, and
+    document text lives in a SQLite store that is read only for the rows a search returns. That store is
+    built from the pickled docstore ahead of time (see ensure_metadata_store()), the first query only
+    maps the index and opens the store.
+    Exposes the same similarity_search_with_score_by_vector() as LangChain's FAISS.
+    """
+
+    def __init__(self, source: str, index_dir: str, metadata_path: str, index_type: str = "flat",
+                 nprobe: int = DEFAULT_NPROBE, ef_search: int = DEFAULT_EF_SEARCH):
+        """
+        :param source: The name of the source, used in log lines
+        :param index_dir: The directory written by FAISS.save_local()
+        :param metadata_path: The SQLite document store of the index, see ensure_metadata_store()
+        :param index_type: Which index file of the directory to open, one of INDEX_TYPES
+        :param nprobe: IVF lists scanned per query (ivf_flat, ivf_pq)
+        :param ef_search: HNSW candidate list size per query (hnsw)
+        """
+        self.source = source
+        self.index_dir = index_dir
+        self.metadata_path = metadata_path
+        self.index_type = index_type
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self.index = None
+        self.closed = False
+        self._connection = None
+        self._lock = threading.Lock()
+        self._stats = {"loaded": False, "index_type": index_type, "vectors": 0, "mapped_bytes": 0,
+                       "loaded_bytes": 0, "load_seconds": 0.0}
+
+    def load(self):
+        """
+        Opens the index and its document store. Safe to call from several threads, only the first call loads.
+        :raise FileNotFoundError: If the document store was not built
+        :raise ValueError: If the index does not measure L2 distances, see QueryEngine.retrieve()
+        """
+        if self.index is not None or self.closed:
+            return
+        with self._lock:
+            if self.index is not None or self.closed:
+                return
+            started = perf_counter()
+            rss_before = get_rss_bytes()
+            index_path = os.path.join(self.index_dir, index_file_name(self.index_type))
+            if not os.path.exists(self.metadata_path):
+                raise FileNotFoundError(f"Document store {self.metadata_path} of {self.source} was not built, "
+                                        f"see ensure_metadata_store()")
+
+            # IVF lists are mapped by IO_FLAG_MMAP alone, it does not combine with IO_FLAG_MMAP_IFC
+            mmap_flags = faiss.IO_FLAG_MMAP if self.index_type.startswith("ivf") else MMAP_FLAGS
+            try:
+                index = faiss.read_index(index_path, mmap_flags)
+                mapped_bytes = os.path.getsize(index_path)
+            except RuntimeError as e:
+                # index types without mmap support are read into memory
+                logger.warning(f"⚠️ Could not memory-map FAISS index for {self.source}, reading it instead: {str(e)}")
+                index = faiss.read_index(index_path)
+                mapped_bytes = 0
+            # the hits of all sources are merged by distance, smallest first, which is wrong for similarity scores
+            if index.metric_type != faiss.METRIC_L2:
+                raise ValueError(f"FAISS index of {self.source} uses metric {index.metric_type}, only L2 "
+                                 f"({faiss.METRIC_L2}) indices can be merged with the other sources")
+            set_search_params(index, self.nprobe, self.ef_search)
+
+            self._connection = sqlite3.connect(f"file:{self.metadata_path}?mode=ro", uri=True,
+                                               check_same_thread=False)
+            self.index = index
+            self._stats = {"loaded": True,
+                           "index_type": self.index_type,
+                           "vectors": index.ntotal,
+                           "mapped_bytes": mapped_bytes,
+                           "loaded_bytes": max(get_rss_bytes() - rss_before, 0),
+                           "load_seconds": perf_counter() - started}
+            logger.info(f"✅ FAISS {self.index_type} index loaded for {self.source}: {index.ntotal} vectors, "
+                        f"{self._stats['mapped_bytes'] / 2 ** 20:.1f} MB mapped, "
+                        f"{self._stats['loaded_bytes'] / 2 ** 20:.1f} MB loaded in "
+                        f"{self._stats['load_seconds']:.2f}s")
+
+    def similarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4) -> List[Tuple[Document, float]]:
+        """
+        :param embedding: The query vector
+        :param k: Number of documents to return
+        :return: A list of (document, L2 distance) tuples, closest first. Approximate index types may miss
+                 some of the true nearest neighbours and return approximate distances (ivf_pq).
+        """
+        self.load()
+        index = self.index
+        if index is None:  # closed by an index swap
+            return []
+        distances, ids = index.search(np.asarray([embedding], dtype=np.float32), k)
+        hits = [(int(row_id), float(distance)) for row_id, distance in zip(ids[0], distances[0]) if row_id != -1]
+        if not hits:
+            return []
+
+        placeholders = ",".join("?" * len(hits))
+        with self._lock:
+            if self._connection is None:
+                return []
+            rows = self._connection.execute(
+                f"SELECT row_id, page_content, metadata FROM docs WHERE row_id IN ({placeholders})",
+                [row_id for row_id, _ in hits]).fetchall()
+        docs = {row_id: Document(page_content=page_content, metadata=json.loads(metadata))
+                for row_id, page_content, metadata in rows}
+        return [(docs[row_id], distance) for row_id, distance in hits if row_id in docs]
+
+    def stats(self) -> Dict:
+        """
+        :return: Whether the index is loaded, its type and vector count, mapped vs. loaded bytes and load time
+        """
+        return dict(self._stats)
+
+    def close(self):
+        """
+        Releases the index and closes the document store. Queries that still reach it return no documents.
+        """
+        with self._lock:
+            self.closed = True
+            if self._connection is not None:
+                self._connection.close()
+            self._connection = None
+            self.index = None
+            self._stats["loaded"] = False
@@ -0,0 +1,485 @@
+# HubSpot CRM deals search, used by utility.py and by the deals cronjob.
+# This is the canonical copy: deals_cronjob/src/hubspot_client.py holds the client part of this file, everything but
+# DealMirror (the cronjob image is built from deals_cronjob only), so make changes here and copy them over.
+import json
+import logging
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
+from time import monotonic, time
+from typing import Dict, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+DEALS_API_URL = "https://api.hubapi.com/crm/v3/objects/deals"
+OWNERS_API_URL = "https://api.hubapi.com/crm/v3/owners"
+DEAL_PROPERTIES = ["dealtype", "dealname", "amount", "createdate", "hubspot_owner_id", "deal_source_1",
+                   "deal_source_2"]
+MAX_PAGE_SIZE = 100  # the largest page the search endpoint returns
+MAX_SEARCH_RESULTS = 10000  # HubSpot never pages past the first 10,000 results of a search
+MODIFIED_PROPERTY = "hs_lastmodifieddate"  # the high-water mark of the deal mirror
+
+
+def create_session(retries: int = 3, pool_size: int = 4) -> requests.Session:
+    """
+    :return: A pooled HTTP session that retries rate limited (429) and unavailable (502/503/504) responses,
+             waiting for the Retry-After HubSpot sends with them
+    """
+    retry = Retry(total=retries, status_forcelist=[429, 502, 503, 504], backoff_factor=1,
+                  respect_retry_after_header=True, allowed_methods=None)  # a search is a read-only POST
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_size, pool_maxsize=pool_size)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    return session
+
+
+def epoch_millis(value: datetime) -> str:
+    """
+    :return: A datetime as the milliseconds since the epoch HubSpot compares date properties with
+    """
+    return str(int(value.timestamp() * 1000))
+
+
+def parse_hubspot_datetime(value: str) -> datetime:
+    """
+    :return: A HubSpot timestamp such as 2024-09-13T09:30:00.123Z as an aware datetime, None if it is not one
+    """
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+
+def bucket_deals(deals: List[Dict], windows: Dict[str, Tuple[datetime, datetime]]) -> Dict[str, List[Dict]]:
+    """
+    Assigns every deal to each window its createdate falls in, windows may overlap.
+    The createdate of a deal is parsed once, and the deals keep their order inside a window.
+    :param deals: Deals as returned by HubSpotDealsClient.search()
+    :param windows: Window name -> (start, end), both inclusive
+    :return: Window name -> its deals, len() of a list is the count of the window
+    """
+    buckets = {name: [] for name in windows}
+    for deal in deals:
+        created = parse_hubspot_datetime(deal.get("properties", {}).get("createdate"))
+        if created is None:
+            continue
+        for name, (start, end) in windows.items():
+            if start <= created <= end:
+                buckets[name].append(deal)
+    return buckets
+
+
+def owner_name(owner: Dict) -> Optional[str]:
+    """
+    :return: "First Last" of a HubSpot owner, None if it has no full name
+    """
+    if owner.get("firstName") and owner.get("lastName"):
+        return owner["firstName"] + " " + owner["lastName"]
+    return None
+
+
+def created_between_filters(deal_type: str, start: datetime, end: datetime) -> List[Dict]:
+    """
+    :return: Search filters for the deals of deal_type created from start to end (inclusive)
+    """
+    return [{"propertyName": "dealtype", "operator": "EQ", "value": deal_type},
+            {"propertyName": "createdate", "operator": "GTE", "value": epoch_millis(start)},
+            {"propertyName": "createdate", "operator": "LTE", "value": epoch_millis(end)}]
+
+
+class _DealWindows:
+    """
+    get_deals_in_windows() for any class with get_deals_created_between(deal_type, start, end)
+    """
+
+    def get_deals_in_windows(self, deal_type: str,
+                             windows: Dict[str, Tuple[datetime, datetime]]) -> Dict[str, List[Dict]]:
+        """
+        Fetches the deals of every reporting window (e.g. last 7 days and the last three months) with one search
+        over their union range, instead of one search per window
+        :param deal_type: The dealtype to report
+        :param windows: Window name -> (start, end), both inclusive
+        :return: Window name -> its deals, newest first, see bucket_deals()
+        """
+        start = min(start for start, _ in windows.values())
+        end = max(end for _, end in windows.values())
+        buckets = bucket_deals(self.get_deals_created_between(deal_type, start, end), windows)
+        logger.debug("🗂️ Deals per window: " + ", ".join(f"{name} {len(deals)}" for name, deals in buckets.items()))
+        return buckets
+
+
+class HubSpotDealsClient(_DealWindows):
+    """
+    Searches HubSpot deals with the filtering done by HubSpot.
+
+    The deal type and the createdate range are filters of the CRM search endpoint, so only the matching deals
+    are paged through, 100 per request and newest first, with just the properties the reports show.
+    The number of requests grows with the deals of the period instead of with the whole CRM.
+    """
+
+    def __init__(self, api_key: str, deals_api_url: str = None, properties: List[str] = None,
+                 session: requests.Session = None, timeout: float = 30):
+        """
+        :param api_key: The private app token
+        :param deals_api_url: The deals object URL (DEALS_API_URL), the search endpoint is below it
+        :param properties: The deal properties to return, DEAL_PROPERTIES by default
+        :param session: The HTTP session to use, see create_session()
+        :param timeout: Timeout of a single request, in seconds
+        """
+        self.api_key = api_key
+        self.search_url = (deals_api_url or DEALS_API_URL).rstrip("/") + "/search"
+        self.properties = properties or DEAL_PROPERTIES
+        self.session = session or create_session()
+        self.timeout = timeout
+
+    def search(self, filters: List[Dict], sorts: List[Dict] = None, properties: List[str] = None) -> List[Dict]:
+        """
+        :param filters: The filters of a single filter group, all of them have to match
+        :param sorts: e.g. [{"propertyName": "createdate", "direction": "DESCENDING"}]
+        :param properties: The deal properties to return, self.properties by default
+        :return: Every deal matching the filters (at most MAX_SEARCH_RESULTS), as {"id": ..., "properties": {...}}
+        """
+        headers = {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
+        body = {"filterGroups": [{"filters": filters}], "properties": properties or self.properties,
+                "limit": MAX_PAGE_SIZE}
+        if sorts:
+            body["sorts"] = sorts
+        deals = []
+        while True:
+            response = self.session.post(self.search_url, headers=headers, json=body, timeout=self.timeout)
+            response.raise_for_status()
+            data = response.json()
+            deals.extend(data.get("results", []))
+            after = data.get("paging", {}).get("next", {}).get("after")
+            if not after or len(deals) >= MAX_SEARCH_RESULTS:
+                break
+            body["after"] = after
+        total = data.get("total", len(deals))
+        if total > MAX_SEARCH_RESULTS:
+            logger.warning(f"⚠️ HubSpot search matched {total} deals, only the first {MAX_SEARCH_RESULTS} are returned")
+        return deals
+
+    def get_deals_created_between(self, deal_type: str, start: datetime, end: datetime) -> List[Dict]:
+        """
+        :return: Deals of deal_type created from start to end (inclusive), newest first
+        """
+        started = monotonic()
+        deals = self.search(created_between_filters(deal_type, start, end),
+                            sorts=[{"propertyName": "createdate", "direction": "DESCENDING"}])
+        logger.debug(f"🔍 HubSpot returned {len(deals)} {deal_type} deals created between {start} and {end} "
+                     f"in {monotonic() - started:.2f}s")
+        return deals
+
+
+class DealMirror(_DealWindows):
+    """
+    A local SQLite copy of the deals created in the last retention_days, so reports read deals from disk.
+
+    sync() asks HubSpot only for the deals modified since the newest hs_lastmodifieddate already mirrored
+    (the high-water mark), oldest first, and upserts them. After the first sync a report costs one small
+    delta search. Deals are matched to the mirror by id, so a deal seen twice is stored once.
+    Deleted or archived deals are not returned by the search, so every full_sync_interval seconds the whole
+    retention period is fetched again and mirrored deals that are gone are dropped.
+    With deal_types set only those deals are mirrored, other types are searched in HubSpot as before.
+    """
+
+    def __init__(self, client: HubSpotDealsClient, path: str, deal_types: List[str] = None, retention_days: int = 120,
+                 min_sync_interval: float = 60, full_sync_interval: float = 86400):
+        """
+        :param client: The HubSpot client the deltas are searched with
+        :param path: The SQLite file
+        :param deal_types: The internal values of the deal types to mirror (e.g. ["newbusiness"]), None for all
+        :param retention_days: Deals created earlier are not mirrored, reports look back about 3 months
+        :param min_sync_interval: Seconds during which queries reuse the last sync, or the mirror as it is after a
+                                  failed sync, instead of asking HubSpot
+        :param full_sync_interval: Seconds between two full syncs that drop deleted deals, 0 disables them
+        """
+        self.client = client
+        self.path = path
+        self.deal_types = sorted(deal_type.strip().lower() for deal_type in deal_types) if deal_types else None
+        self.retention_days = retention_days
+        self.min_sync_interval = min_sync_interval
+        self.full_sync_interval = full_sync_interval
+        self.properties = list(client.properties) + [MODIFIED_PROPERTY]
+        self._last_attempt = None  # monotonic() of the last sync, successful or failed
+        self._sync_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS deals (id TEXT PRIMARY KEY, dealtype TEXT, "
+                                     "created INTEGER, modified INTEGER NOT NULL, properties TEXT NOT NULL)")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS deals_type_created ON deals (dealtype, created)")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    def _get_meta(self, key: str) -> str:
+        with self._lock:
+            row = self._connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _upsert(self, deals: List[Dict]):
+        """
+        Stores deals and moves the high-water mark to the newest hs_lastmodifieddate among them, in one transaction
+        """
+        rows = []
+        for deal in deals:
+            properties = deal.get("properties", {})
+            created = parse_hubspot_datetime(properties.get("createdate"))
+            modified = parse_hubspot_datetime(properties.get(MODIFIED_PROPERTY))
+            if modified is None:
+                continue
+            rows.append((deal["id"], (properties.get("dealtype") or "").strip().lower(),
+                         int(created.timestamp() * 1000) if created else None,
+                         int(modified.timestamp() * 1000), json.dumps(properties)))
+        if not rows:
+            return
+        with self._lock, self._connection:
+            self._connection.executemany("INSERT OR REPLACE INTO deals VALUES (?, ?, ?, ?, ?)", rows)
+            self._connection.execute(
+                "INSERT INTO meta VALUES ('high_water', ?) ON CONFLICT(key) DO UPDATE SET value = "
+                "MAX(CAST(value AS INTEGER), CAST(excluded.value AS INTEGER))", (str(max(row[3] for row in rows)),))
+
+    def _search_filters(self, created_from: datetime) -> List[Dict]:
+        """
+        :return: The filters every search of the mirror starts with
+        """
+        filters = [{"propertyName": "createdate", "operator": "GTE", "value": epoch_millis(created_from)}]
+        if self.deal_types:
+            filters.append({"propertyName": "dealtype", "operator": "IN", "values": self.deal_types})
+        return filters
+
+    def _fetch_modified_since(self, high_water: int, created_from: datetime) -> set:
+        """
+        Mirrors the deals created since created_from and modified at or after high_water (epoch milliseconds)
+        :return: The ids of the fetched deals
+        """
+        ids = set()
+        while True:
+            deals = self.client.search(
+                self._search_filters(created_from)
+                + [{"propertyName": MODIFIED_PROPERTY, "operator": "GTE", "value": str(high_water)}],
+                sorts=[{"propertyName": MODIFIED_PROPERTY, "direction": "ASCENDING"}], properties=self.properties)
+            self._upsert(deals)
+            ids.update(deal["id"] for deal in deals)
+            if len(deals) < MAX_SEARCH_RESULTS:
+                return ids
+            # the search stops at 10,000 results, continue from the last modification it returned
+            last_modified = parse_hubspot_datetime(deals[-1].get("properties", {}).get(MODIFIED_PROPERTY))
+            last_modified = int(last_modified.timestamp() * 1000) if last_modified else high_water
+            if last_modified <= high_water:
+                # all of them were modified at the same millisecond (e.g. a bulk import), page through it by id
+                ids.update(self._fetch_modified_at(high_water, created_from))
+                last_modified = high_water + 1
+            high_water = last_modified
+
+    def _fetch_modified_at(self, modified: int, created_from: datetime) -> set:
+        """
+        Mirrors the deals created since created_from and modified exactly at modified (epoch milliseconds),
+        in order of their id, so any number of them is fetched
+        :return: The ids of the fetched deals
+        """
+        ids = set()
+        after_id = "0"
+        while True:
+            deals = self.client.search(
+                self._search_filters(created_from)
+                + [{"propertyName": MODIFIED_PROPERTY, "operator": "EQ", "value": str(modified)},
+                   {"propertyName": "hs_object_id", "operator": "GT", "value": after_id}],
+                sorts=[{"propertyName": "hs_object_id", "direction": "ASCENDING"}], properties=self.properties)
+            self._upsert(deals)
+            ids.update(deal["id"] for deal in deals)
+            if len(deals) < MAX_SEARCH_RESULTS:
+                return ids
+            after_id = deals[-1]["id"]
+
+    def sync(self, full: bool = False):
+        """
+        Fetches the deals modified since the last sync, or every deal of the retention period
+        if the mirror is empty, full is set or the last full sync is older than full_sync_interval
+        """
+        started = monotonic()
+        created_from = datetime.now(timezone.utc) - timedelta(days=self.retention_days)
+        high_water = self._get_meta("high_water")
+        last_full = float(self._get_meta("last_full_sync") or 0)
+        deal_types = json.dumps(self.deal_types)
+        full = (full or high_water is None or self._get_meta("deal_types") != deal_types
+                or (self.full_sync_interval > 0 and time() - last_full > self.full_sync_interval))
+
+        ids = self._fetch_modified_since(0 if full else int(high_water), created_from)
+        if full:
+            with self._lock, self._connection:
+                mirrored = [row[0] for row in self._connection.execute(
+                    "SELECT id FROM deals WHERE created >= ?", (int(created_from.timestamp() * 1000),))]
+                gone = [(deal_id,) for deal_id in mirrored if deal_id not in ids]
+                self._connection.executemany("DELETE FROM deals WHERE id = ?", gone)
+                self._connection.execute("INSERT OR REPLACE INTO meta VALUES ('last_full_sync', ?)", (str(time()),))
+                self._connection.execute("INSERT OR REPLACE INTO meta VALUES ('deal_types', ?)", (deal_types,))
+            logger.info(f"🔄 Deal mirror fully synced: {len(ids)} deals, {len(gone)} dropped, "
+                        f"in {monotonic() - started:.2f}s")
+        else:
+            logger.debug(f"🔄 Deal mirror synced {len(ids)} modified deals in {monotonic() - started:.2f}s")
+        self._last_attempt = monotonic()
+
+    def ensure_synced(self):
+        """
+        Syncs unless the last sync attempt is less than min_sync_interval seconds old. Concurrent callers share
+        one sync. If HubSpot fails, the mirror is served as it is until the next attempt, unless it was never synced.
+        """
+        last_attempt = self._last_attempt
+        if last_attempt is not None and monotonic() - last_attempt < self.min_sync_interval:
+            return
+        with self._sync_lock:
+            if self._last_attempt is not last_attempt:  # attempted by another caller while we waited
+                return
+            self._last_attempt = monotonic()
+            try:
+                self.sync()
+            except Exception as e:
+                if self._get_meta("high_water") is None:
+                    self._last_attempt = None  # nothing to serve, so the next query tries again
+                    raise
+                logger.error(f"🚨 Deal mirror sync failed, serving the mirrored deals: {str(e)}")
+
+    def get_deals_created_between(self, deal_type: str, start: datetime, end: datetime) -> List[Dict]:
+        """
+        :return: Mirrored deals of deal_type created from start to end (inclusive), newest first,
+                 in the shape HubSpot returns them ({"id": ..., "properties": {...}})
+        """
+        if self.deal_types and deal_type.strip().lower() not in self.deal_types:
+            return self.client.get_deals_created_between(deal_type, start, end)
+        self.ensure_synced()
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT id, properties FROM deals WHERE dealtype = ? AND created BETWEEN ? AND ? ORDER BY created DESC",
+                (deal_type.strip().lower(), int(start.timestamp() * 1000), int(end.timestamp() * 1000))).fetchall()
+        return [{"id": deal_id, "properties": json.loads(properties)} for deal_id, properties in rows]
+
+
+class OwnerDirectory:
+    """
+    HubSpot owner id -> "First Last", loaded on first use instead of at import.
+
+    Every page of the owners list is read. Once the names are older than ttl seconds, get() still answers from
+    them and a daemon thread reloads the list, so only the very first lookup waits for HubSpot. An id missing from
+    the list (e.g. an owner added since the last load) is fetched on its own once, and misses are remembered.
+    Used like the dictionary it replaces: owners.get(owner_id, "Unknown Owner").
+    """
+
+    def __init__(self, api_key: str, owners_api_url: str = None, ttl: float = 3600, retry_interval: float = 60,
+                 session: requests.Session = None, timeout: float = 10):
+        """
+        :param api_key: The private app token
+        :param owners_api_url: The owners URL (OWNERS_API_URL), a single owner is read from <url>/<id>
+        :param ttl: Seconds after which the owner list is reloaded in the background
+        :param retry_interval: Seconds before a failed load is retried
+        :param session: The HTTP session to use, see create_session()
+        :param timeout: Timeout of a single request, in seconds
+        """
+        self.api_key = api_key
+        self.owners_api_url = (owners_api_url or OWNERS_API_URL).rstrip("/")
+        self.ttl = ttl
+        self.retry_interval = retry_interval
+        self.session = session or create_session()
+        self.timeout = timeout
+        self._names = None
+        self._missing = set()
+        self._next_load = 0.0  # monotonic() from which the list is (re)loaded
+        self._lock = threading.Lock()
+        self._refreshing = threading.Lock()
+
+    def _headers(self) -> Dict:
+        return {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
+
+    def _fetch_all(self) -> Dict[str, str]:
+        """
+        :return: Owner id -> name of every page of the owners list
+        """
+        names = {}
+        params = {"limit": MAX_PAGE_SIZE, "archived": "false"}
+        while True:
+            response = self.session.get(self.owners_api_url, headers=self._headers(), params=params,
+                                        timeout=self.timeout)
+            response.raise_for_status()
+            data = response.json()
+            for owner in data.get("results", []):
+                name = owner_name(owner)
+                if name:
+                    names[str(owner["id"])] = name
+            after = data.get("paging", {}).get("next", {}).get("after")
+            if not after:
+                return names
+            params["after"] = after
+
+    def refresh(self):
+        """
+        Reloads the owner list, failures keep the current names until retry_interval passed
+        """
+        started = monotonic()
+        try:
+            names = self._fetch_all()
+        except Exception as e:
+            logger.error(f"🚨 Loading the HubSpot owners failed: {str(e)}")
+            self._next_load = monotonic() + self.retry_interval
+            return
+        with self._lock:
+            self._names = names
+            self._missing = set()
+            self._next_load = monotonic() + self.ttl
+        logger.info(f"👥 Loaded {len(names)} HubSpot owners in {monotonic() - started:.2f}s")
+
+    def _refresh_in_background(self):
+        if not self._refreshing.acquire(blocking=False):
+            return  # already reloading
+
+        def run():
+            try:
+                self.refresh()
+            finally:
+                self._refreshing.release()
+
+        threading.Thread(target=run, name="hubspot-owners", daemon=True).start()
+
+    def _fetch_one(self, owner_id: str) -> Optional[str]:
+        response = self.session.get(f"{self.owners_api_url}/{owner_id}", headers=self._headers(),
+                                    timeout=self.timeout)
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return owner_name(response.json())
+
+    def get(self, owner_id, default: str = None) -> str:
+        """
+        :return: The name of the owner, default if HubSpot does not know it
+        """
+        if not owner_id:
+            return default
+        owner_id = str(owner_id)
+        if self._names is None:
+            with self._refreshing:  # the first lookup loads the list, concurrent ones wait for it
+                if self._names is None and monotonic() >= self._next_load:
+                    self.refresh()
+        elif monotonic() >= self._next_load:
+            self._refresh_in_background()
+
+        names = self._names or {}
+        if owner_id in names:
+            return names[owner_id]
+        if owner_id in self._missing or self._names is None or not owner_id.isdigit():  # e.g. "N/A"
+            return default
+        try:
+            name = self._fetch_one(owner_id)
+        except Exception as e:
+            logger.error(f"🚨 Loading HubSpot owner {owner_id} failed: {str(e)}")
+            return default
+        with self._lock:
+            if name:
+                self._names[owner_id] = name
+            else:
+                self._missing.add(owner_id)
+        return name or default
@@ -0,0 +1,124 @@
+# Background refresh of the FAISS indices from S3, started by main.py
+import gc
+import logging
+import os
+import shutil
+import threading
+from datetime import datetime, timezone
+from time import perf_counter
+from typing import Callable, Dict
+
+import download_s3
+
+logger = logging.getLogger(__name__)
+
+
+def link_tree(source_dir: str, target_dir: str):
+    """
+    Recreates source_dir in target_dir with hard links (copies where linking is not possible)
+    """
+    for root, _, files in os.walk(source_dir):
+        target_root = os.path.join(target_dir, os.path.relpath(root, source_dir))
+        os.makedirs(target_root, exist_ok=True)
+        for name in files:
+            try:
+                os.link(os.path.join(root, name), os.path.join(target_root, name))
+            except OSError:
+                shutil.copy2(os.path.join(root, name), os.path.join(target_root, name))
+
+
+class IndexRefresher:
+    """
+    Polls the knowledge-base bucket and hot-swaps the FAISS indices when it changes.
+
+    Changes are detected by comparing the bucket listing with the sync manifest of the live directory
+    (see download_s3.py). Every refresh builds a new version directory: the live directory is hard-linked
+    into it and download_s3.sync_bucket() downloads only the changed objects. The new indices are fully loaded in the
+    refresher's thread, then handed to swap_indices(), which replaces them atomically and returns the
+    old ones once no in-flight query uses them anymore. The old indices are closed and the old version
+    directory is removed, so their memory and disk space are released.
+    """
+
+    def __init__(self, s3_client, bucket_name: str, live_dir: str, versions_dir: str,
+                 load_indices: Callable[[str], Dict], swap_indices: Callable[[Dict], Dict], interval: float = 600):
+        """
+        :param s3_client: A boto3 S3 client
+        :param bucket_name: The bucket holding the FAISS files
+        :param live_dir: The directory the current indices were loaded from
+        :param versions_dir: Where new versions of the data directory are staged
+        :param load_indices: Gets a data directory and returns source name -> index (see main.load_faiss_indices)
+        :param swap_indices: Gets the new indices, installs them and returns the old ones once they are unused
+        :param interval: Seconds between two polls of the bucket
+        """
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+        self.live_dir = live_dir
+        self.versions_dir = versions_dir
+        self.load_indices = load_indices
+        self.swap_indices = swap_indices
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        Starts polling in a daemon thread
+        """
+        self._thread = threading.Thread(target=self._run, name="index-refresher", daemon=True)
+        self._thread.start()
+        logger.info(f"🔄 FAISS index refresher polling s3://{self.bucket_name} every {self.interval}s")
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"🚨 FAISS index refresh failed: {str(e)}", exc_info=True)
+            if self._stop.wait(self.interval):
+                return
+
+    def refresh(self) -> bool:
+        """
+        Checks the bucket once and swaps the indices if any object changed.
+        :return: True if new indices were installed
+        """
+        objects = download_s3.list_bucket_objects(self.s3_client, self.bucket_name)
+        manifest = download_s3.read_manifest(self.live_dir)
+
+        changed = [key for key, obj in objects.items() if manifest.get(key) != obj]
+        removed = [key for key in manifest if key not in objects]
+        if not changed and not removed:
+            logger.debug("✅ FAISS indices are up to date")
+            return False
+
+        started = perf_counter()
+        logger.info(f"📥 Knowledge base changed in S3 ({len(changed)} changed, {len(removed)} removed), refreshing...")
+        staging_dir = os.path.join(self.versions_dir, datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S%f"))
+        try:
+            link_tree(self.live_dir, staging_dir)
+            stats = download_s3.sync_bucket(self.s3_client, self.bucket_name, staging_dir, objects=objects)
+            logger.info(f"📥 Downloaded {stats['downloaded']} files ({stats['bytes'] / 2 ** 20:.1f} MB) "
+                        f"in {stats['seconds']:.2f}s")
+            new_indices = self.load_indices(staging_dir)
+            for index in new_indices.values():
+                index.load()  # load off the hot path, queries only ever see ready indices
+        except Exception:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            raise
+
+        old_indices = self.swap_indices(new_indices)
+        old_dir = self.live_dir
+        self.live_dir = staging_dir
+        logger.info(f"✅ FAISS indices swapped to {staging_dir} in {perf_counter() - started:.2f}s")
+
+        for index in old_indices.values():
+            index.close()
+        del old_indices
+        gc.collect()
+        # the directory downloaded at startup is left alone, only staged versions are ours to delete
+        if os.path.abspath(old_dir).startswith(os.path.abspath(self.versions_dir) + os.sep):
+            shutil.rmtree(old_dir, ignore_errors=True)
+        return True
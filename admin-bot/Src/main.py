@@ -1,25 +1,33 @@
 import os
 import signal
+import threading
 import json
 from pydantic_settings import BaseSettings
 from pydantic import Field
 from slack_sdk import WebClient
 from slack_bolt import App
 from slack_bolt.adapter.socket_mode import SocketModeHandler
-from time import time
 from datetime import datetime, timedelta, timezone
 from slack_sdk.errors import SlackApiError
 import utility
+import qa_engine
+import answer_cache
+import faiss_store
+import index_refresher
+import download_s3
+import slack_stream
+import text_budget
+import dashboard
+import visitors
+import session_store
+from user_directory import UserDirectory
 import requests
 import config
 import logging
 import pickle
 import faiss
 from pythonjsonlogger import jsonlogger
-from langchain.text_splitter import TokenTextSplitter
 from langchain_openai import AzureOpenAIEmbeddings, AzureChatOpenAI
-from langchain_community.vectorstores import FAISS
-from langchain.chains import RetrievalQA
 from openai import BadRequestError
 
 # Basic logging configuration
@@ -35,10 +43,14 @@ app = App(token=key)
 
 # parse the account name to use an action on
 client = WebClient(token=key)
-admin_list = utility.make_admin_list(variables.admin_list_var)
 
-# list of users who have a running configuration
-active_list = []
+# user names for log lines, cached and refreshed in the background so handlers never wait on users.info
+user_directory = UserDirectory(client, ttl=variables.user_directory_ttl)
+user_directory.start()
+
+# the users who have a running configuration and its state, expired after SESSION_TTL idle seconds
+sessions = session_store.SessionStore(
+    session_store.create_backend(variables.session_redis_url, variables.session_max), ttl=variables.session_ttl)
 
 ####################################################
 # Azure OpenAI Configuration
@@ -49,19 +61,25 @@ AZURE_OPENAI_API_VERSION = "2024-02-01"
 AZURE_DEPLOYMENT_NAME = "text-embedding-ada-002"
 
 FAISS_LOCAL_DIR = "./data"
+FAISS_VERSIONS_DIR = "./data_versions"  # refreshed copies of FAISS_LOCAL_DIR, see index_refresher.py
 
+# paths inside the data directory
 FAISS_INDEX_PATHS = {
-    "firefly": os.path.join(FAISS_LOCAL_DIR, "faiss_index_firefly"),
-    "confluence": os.path.join(FAISS_LOCAL_DIR, "faiss_index_confluence"),
-    "slack": os.path.join(FAISS_LOCAL_DIR, "faiss_index_slack")
+    "firefly": "faiss_index_firefly",
+    "confluence": "faiss_index_confluence",
+    "slack": "faiss_index_slack"
 }
 
+# slim on-disk document stores, built from each index's pickled docstore when the data is downloaded or refreshed
 FAISS_METADATA_PATHS = {
-    "firefly": os.path.join(FAISS_LOCAL_DIR, "faiss_metadata_firefly.pkl"),
-    "confluence": os.path.join(FAISS_LOCAL_DIR, "faiss_metadata_confluence.pkl"),
-    "slack": os.path.join(FAISS_LOCAL_DIR, "faiss_metadata_slack.pkl")
+    "firefly": "faiss_metadata_firefly.sqlite",
+    "confluence": "faiss_metadata_confluence.sqlite",
+    "slack": "faiss_metadata_slack.sqlite"
 }
 
+# exact ("flat") or approximate index per source, see rebuild_indices.py
+FAISS_INDEX_TYPES = faiss_store.parse_index_types(variables.faiss_index_type)
+
 # 🔺 Initialize Embeddings Model
 embeddings_model = AzureOpenAIEmbeddings(
     api_key=AZURE_API_KEY,
@@ -70,59 +88,114 @@ embeddings_model = AzureOpenAIEmbeddings(
     openai_api_version=AZURE_OPENAI_API_VERSION,
 )
 
-# 🔺 Load FAISS Index from Downloaded S3 Data
-def load_faiss_index(index_key):
+# 🔺 Register FAISS Index from Downloaded S3 Data
+def load_faiss_index(index_key, data_dir=FAISS_LOCAL_DIR):
     """
-    Loads a FAISS index from the downloaded S3 files.
+    Registers a FAISS index from the downloaded S3 files and builds its document store if it is missing or stale.
+    The index is memory-mapped on its first query, not here.
     """
-    if not os.path.exists(FAISS_INDEX_PATHS[index_key]):
+    index_path = os.path.join(data_dir, FAISS_INDEX_PATHS[index_key])
+    if not os.path.exists(os.path.join(index_path, faiss_store.INDEX_FILE_NAME)):
         logger.warning(f"🚨 FAISS index not found for {index_key}. Exiting...")
         return None
 
-    try:
-        logger.info(f"🔄 Loading FAISS index from {FAISS_INDEX_PATHS[index_key]}...")
-        
-        # ✅ Pass the embeddings model to fix the error
-        vector_store = FAISS.load_local(
-            FAISS_INDEX_PATHS[index_key], 
-            embeddings_model,  # ✅ Fix: Add missing argument
-            allow_dangerous_deserialization=True
-        )
-        
-        logger.info(f"✅ FAISS index loaded successfully for {index_key}.")
-        return vector_store
-    except Exception as e:
-        logger.error(f"🚨 Error loading FAISS index for {index_key}: {str(e)}", exc_info=True)
-        return None
+    index_type = FAISS_INDEX_TYPES.get(index_key, FAISS_INDEX_TYPES["*"])
+    if not os.path.exists(os.path.join(index_path, faiss_store.index_file_name(index_type))):
+        logger.warning(f"⚠️ No {index_type} FAISS index for {index_key}, using the flat one")
+        index_type = "flat"
+
+    # unpickling the docstore is slow, it is done here (at startup or by the refresher) and not on the first query
+    metadata_path = os.path.join(data_dir, FAISS_METADATA_PATHS[index_key])
+    faiss_store.ensure_metadata_store(index_key, index_path, metadata_path)
+
+    logger.info(f"🔄 Registering {index_type} FAISS index from {index_path}...")
+    return faiss_store.LazyFaissIndex(
+        index_key,
+        index_path,
+        metadata_path,
+        index_type=index_type,
+        nprobe=variables.faiss_nprobe,
+        ef_search=variables.faiss_ef_search,
+    )
 
 
-# 🔺 Load FAISS indices
-faiss_indices = {}
-for source in FAISS_INDEX_PATHS.keys():
-    faiss_index = load_faiss_index(source)
-    if faiss_index:
-        faiss_indices[source] = faiss_index
+def load_faiss_indices(data_dir=FAISS_LOCAL_DIR):
+    """
+    Registers every FAISS index found in a data directory
+    :param data_dir: A directory holding the files of the firefly-ai-bot bucket
+    :return: A dictionary of source name -> index
+    """
+    indices = {}
+    for source in FAISS_INDEX_PATHS.keys():
+        faiss_index = load_faiss_index(source, data_dir)
+        if faiss_index:
+            indices[source] = faiss_index
+    return indices
+
+
+# 🔺 Register FAISS indices (loaded lazily)
+faiss_indices = load_faiss_indices()
 
 print("🚀 FAISS indices are ready to use!")
 
-# 🔺 Initialize Retrieval QA for Each Source
-qa_chains = {}
-for source, faiss_index in faiss_indices.items():
-    qa_chains[source] = RetrievalQA.from_chain_type(
-        llm=AzureChatOpenAI(
-            model="testdeployment",
-            api_key=AZURE_API_KEY,
-            azure_endpoint=AZURE_OPENAI_ENDPOINT,
-            api_version=AZURE_OPENAI_API_VERSION,
-        ),
-        retriever=faiss_index.as_retriever()
-    )
+# 🔺 Initialize the chat model that answers over the merged FAISS results
+llm = AzureChatOpenAI(
+    model="testdeployment",
+    api_key=AZURE_API_KEY,
+    azure_endpoint=AZURE_OPENAI_ENDPOINT,
+    api_version=AZURE_OPENAI_API_VERSION,
+)
+
+# 🔺 Search all sources concurrently, answer once
+query_engine = qa_engine.QueryEngine(
+    embeddings_model,
+    faiss_indices,
+    llm,
+    max_workers=variables.qa_max_workers,
+    source_timeout=variables.qa_source_timeout,
+    source_weights=qa_engine.parse_source_weights(variables.qa_source_weights),
+    answer_cache=answer_cache.AnswerCache(
+        max_entries=variables.answer_cache_size,
+        ttl=variables.answer_cache_ttl,
+        similarity_threshold=variables.answer_cache_similarity,
+    ),
+)
+
+
+# 🔺 Answers are cut to what fits in a Slack message (room is left for the header and the sources line)
+answer_truncator = text_budget.AnswerTruncator(
+    max_chars=text_budget.SLACK_MAX_MESSAGE_CHARS - 200,
+    max_tokens=variables.answer_max_tokens or None,
+)
+
+
+def swap_faiss_indices(new_indices):
+    """
+    Installs freshly loaded indices. Called from the index refresher thread.
+    :return: The previous indices, once no in-flight question uses them
+    """
+    global faiss_indices
+    faiss_indices = new_indices
+    return query_engine.set_indices(new_indices)
+
+
+# 🔺 Pick up knowledge base updates from S3 without a restart
+if variables.index_refresh_interval > 0:
+    index_refresher.IndexRefresher(
+        download_s3.s3_client,
+        download_s3.S3_BUCKET_NAME,
+        FAISS_LOCAL_DIR,
+        FAISS_VERSIONS_DIR,
+        load_faiss_indices,
+        swap_faiss_indices,
+        interval=variables.index_refresh_interval,
+    ).start()
 
 
 ####################################################
 
 def kill_server(message: {}):
-    logger.info(f"Trigger self destruct funcion kill_server by user {app.client.users_info(user=message.get('user')).get('user').get('name')}")    
+    logger.info(f"Trigger self destruct funcion kill_server by user {user_directory.name(message.get('user'))}")    
     os._exit(0)
 
 @app.action("abort_action")
@@ -135,41 +208,43 @@ def abort_action(user_id: str, channel_id: str, say, ack):
     :param ack: Sending acknowledgement to Slack
     :exception: If failed to delete messages , raises an exception
     """
-    username = app.client.users_info(user=user_id).get('user').get('real_name')
+    username = user_directory.real_name(user_id)
     ack()
-    if admin_list[user_id] == "":
-        say("You don't have any active sessions.")
-        return
-    say("Aborting...")
-    # delete accounts message
-    try:
-        app.client.chat_delete(token=key, channel=channel_id, ts=utility.get_item(admin_list, user_id, "Timestamp"))
-    except SlackApiError as e:
-        logger.error(
-            f"failed in function abort_action() for user {app.client.users_info(user=user_id).get('user').get('name')}",
-            extra={"user_id": user_id,
-                   "text": e,
-                   "level": "ERROR"})
-        return
-
-    # removes user from active list
-    active_list.remove(user_id)
-    if utility.get_item(admin_list, user_id, "Prev") != "":  # delete leftover messages
+    # a second 'end' or a pick of the same user waits until the session is gone
+    with sessions.lock(user_id):
+        session = sessions.get(user_id)
+        if session is None:
+            say("You don't have any active sessions.")
+            return
+        say("Aborting...")
+        # delete accounts message
         try:
-            app.client.chat_delete(token=key, channel=channel_id, ts=utility.get_item(admin_list, user_id, "Prev"))
+            app.client.chat_delete(token=key, channel=channel_id, ts=session.ts)
         except SlackApiError as e:
             logger.error(
-                f"failed in function abort_action() for user {app.client.users_info(user=user_id).get('user').get('name')}",
+                f"failed in function abort_action() for user {user_directory.name(user_id)}",
                 extra={"user_id": user_id,
                        "text": e,
                        "level": "ERROR"})
             return
+
+        # ends the session of the user
+        sessions.end(user_id)
+        if session.prev_ts:  # delete leftover messages
+            try:
+                app.client.chat_delete(token=key, channel=channel_id, ts=session.prev_ts)
+            except SlackApiError as e:
+                logger.error(
+                    f"failed in function abort_action() for user {user_directory.name(user_id)}",
+                    extra={"user_id": user_id,
+                           "text": e,
+                           "level": "ERROR"})
+                return
     logger.info(
         f"Exited successfully from function abort_action() for user {username}",
         extra={"user_id": user_id,
                "level": "INFO"})
 
-    utility.remove(admin_list, user_id)  # removes value from admin list
     say("You have successfully aborted the session.\nTo start a new session, please type: start")
 
 @app.action("select_account")
@@ -184,47 +259,33 @@ def select_account(action: {}, ack, say, user_id: str, channel_id: str):
     :exception: If message could not be delete , raise exception
     """
     ack()
-    utility.update(admin_list, user_id, "Account", action.get("selected_option", {}).get("text", {}).get("text"))
-    #  edit message according to input
-    request = requests.get(variables.change_status,
-                           data={"name": utility.get_item(admin_list, user_id, "Account")}).json()
-    # if an action message was not created
-    if utility.get_item(admin_list, user_id, "Prev") == "":
-        say(utility.update_block(request))  # send message to slack
-        # save timestamp of message for future use
-        try:
-            utility.update(admin_list, user_id, "Prev", client.conversations_history(channel=channel_id,
-                                                                                     inclusive=True,
-                                                                                     latest=str(time()),
-                                                                                     limit=1)["messages"][0].get('ts'))
-        except SlackApiError as e:
-            logger.error(
-                f"failed in function select_account() for user {app.client.users_info(user=user_id).get('user').get('name')}",
-                extra={"user_id": user_id,
-                       "text": e,
-                       "level": "ERROR"})
+    account = action.get("selected_option", {}).get("text", {}).get("text")
+    # one account and one account message per user, also when the user picks two accounts in a row
+    with sessions.lock(user_id):
+        # e.g. the session expired, a message posted now could never be deleted by 'end'
+        session = sessions.update(user_id, account=account)
+        if session is None:
+            say(f"<@{user_id}> You don't have any active sessions. To start a new session, please type: start")
             return
-
-    # if an action message was previously deleted
-    else:
-        app.client.chat_delete(token=key, channel=channel_id, ts=utility.get_item(admin_list, user_id, "Prev"))
-        # send message to slack
-        say(utility.update_block(request))
-        # save timestamp of message for future use
+        #  edit message according to input
+        request = requests.get(variables.change_status,
+                               data={"name": account}).json()
+        # if an action message was previously created, delete it
+        prev_ts = session.prev_ts
+        if prev_ts:
+            app.client.chat_delete(token=key, channel=channel_id, ts=prev_ts)
+        # send message to slack and save its timestamp for future use
         try:
-            utility.update(admin_list, user_id, "Prev", client.conversations_history(channel=channel_id,
-                                                                                     inclusive=True,
-                                                                                     latest=str(time()),
-                                                                                     limit=1)["messages"][0].get('ts'))
+            sessions.update(user_id, prev_ts=say(utility.update_block(request)).get('ts'))
         except SlackApiError as e:
             logger.error(
-                f"failed in function select_account() for user {app.client.users_info(user=user_id).get('user').get('name')}",
+                f"failed in function select_account() for user {user_directory.name(user_id)}",
                 extra={"user_id": user_id,
                        "text": e,
                        "level": "ERROR"})
             return
     logger.info(
-        f"Function select_account() successfully finished for user {app.client.users_info(user=user_id).get('user').get('name')}",
+        f"Function select_account() successfully finished for user {user_directory.name(user_id)}",
         extra={"user_id": user_id,
                "text": action.get("selected_option", {}).get("text", {}).get("text"),
                "level": "INFO"})
@@ -237,12 +298,12 @@ def select_action(action: {}, ack, user_id: str):
     :param ack: Sending acknowledgement to Slack
     :param user_id: Id of the action initiator
     """
-    utility.update(admin_list, user_id, "Action", action.get("selected_option", {}).get("text", {}).get("text"))
+    session = sessions.update(user_id, action=action.get("selected_option", {}).get("text", {}).get("text"))
     ack()
     logger.info(
-        f"Function select_action() successfully finished for user {app.client.users_info(user=user_id).get('user').get('name')}",
+        f"Function select_action() successfully finished for user {user_directory.name(user_id)}",
         extra={"user_id": user_id,
-               "text": utility.get_item(admin_list, user_id, 'Action'),
+               "text": session.action if session else None,
                "level": "INFO"})
 
 @app.action("execute_action")
@@ -254,21 +315,21 @@ def execute_action(user_id: str, say, ack):
     :param ack: Sending acknowledgement to Slack
     """
     ack()
-    name = utility.get_item(admin_list, user_id, "Account")
+    session = sessions.get(user_id) or session_store.Session(user_id)
+    name = session.account
     data = requests.get(variables.get_id,
                             data={"id": "",
-                                  "name": client.users_info(user=user_id).get("user", {}).get("real_name"),
+                                  "name": user_directory.real_name(user_id, wait=True),
                                   "url": name})
     response_data = data.json()
-    if utility.get_item(admin_list, user_id, "Action") == "" or utility.get_item(admin_list, user_id,
-                                                                                 "Account") == "":  # makes sure both fields are selected
+    if session.action == "" or session.account == "":  # makes sure both fields are selected
         say(f"<@{user_id}> Please make sure that you've selected an account and action!")
     
     # execute suspend / activate / extend poc function
-    elif utility.get_item(admin_list, user_id, "Action") == ":x: Suspend :x:" or \
-            utility.get_item(admin_list, user_id, "Action") == ":white_check_mark: Activate :white_check_mark:":
+    elif session.action == ":x: Suspend :x:" or \
+            session.action == ":white_check_mark: Activate :white_check_mark:":
 
-        status = "false" if utility.get_item(admin_list, user_id, "Action") == ":x: Suspend :x:" else "true"
+        status = "false" if session.action == ":x: Suspend :x:" else "true"
 
         #  makes an API request to Retool to suspend / activate
         requests.get(variables.suspend_activate,
@@ -281,8 +342,7 @@ def execute_action(user_id: str, say, ack):
             f"#account-mgmt-audit for more details")
 
     # execute extend POC 7 days
-    elif utility.get_item(admin_list, user_id,
-                          "Action") == ":hourglass_flowing_sand: Extend POC +7 days :hourglass_flowing_sand:":
+    elif session.action == ":hourglass_flowing_sand: Extend POC +7 days :hourglass_flowing_sand:":
         requests.get(
             variables.extend_poc_7_days,
             data={"id": response_data['id'],
@@ -292,8 +352,7 @@ def execute_action(user_id: str, say, ack):
         say(f"Account successfully extended POC +7 days. Please check #account-mgmt-audit for more details")
     
     # execute extend POC 2 days
-    elif utility.get_item(admin_list, user_id,
-                          "Action") == ":hourglass_flowing_sand: Extend POC +2 days :hourglass_flowing_sand:":
+    elif session.action == ":hourglass_flowing_sand: Extend POC +2 days :hourglass_flowing_sand:":
         requests.get(
             variables.extend_poc_2_days,
             data={"id": response_data['id'],
@@ -305,14 +364,14 @@ def execute_action(user_id: str, say, ack):
     else:
         requests.get(variables.change_tier,
                      data={"id": response_data['id'],
-                           "status": utility.get_tier(utility.get_item(admin_list, user_id, "Action")),
+                           "status": utility.get_tier(session.action),
                            "name": response_data['name'],
                            "url": response_data['url']})
         # send confirmation message that the action successfully finished
-        say(f"Account successfully changed to {utility.get_tier(utility.get_item(admin_list, user_id, 'Action'))}. Please check"
+        say(f"Account successfully changed to {utility.get_tier(session.action)}. Please check"
             f" #account-mgmt-audit for more details")
     logger.info(
-        f"Exited successfully from function execute_action() for user {app.client.users_info(user=user_id).get('user').get('name')}",
+        f"Exited successfully from function execute_action() for user {user_directory.name(user_id)}",
         extra={"user_id": user_id,
                "level": "INFO"})
 
@@ -421,42 +480,92 @@ def handle_some_action(message: {}, ack, body, logger, say):
         logger.error(f"Error in account_search handler: {str(e)}")
         say(f"⚠️ An error occurred while processing your search: {str(e)}")
 
-def main_menu(message: {}, say, num: int):
+# 🔺 Renew the Auth0 management token before it expires, so sandbox views never wait for it
+utility.auth0_tokens.start()
+
+# 🔺 Website visitors are recorded as they are posted, the history is backfilled once at startup
+visitor_store = visitors.VisitorEventStore(variables.visitor_store_path)
+visitors.set_event_store(visitor_store)
+threading.Thread(
+    target=visitor_store.backfill,
+    args=(client, min(first_day for first_day, _ in visitors.get_period_days().values())),
+    name="visitor-backfill",
+    daemon=True,
+).start()
+
+# 🔺 Dashboard sources run concurrently, a slow or failing one only blanks its own section
+# the visitor counts read Slack through a client of their own, whose requests give up after the source timeout
+dashboard_slack_client = WebClient(token=key, timeout=max(int(variables.dashboard_source_timeout), 1))
+dashboard_builder = dashboard.DashboardBuilder(
+    lambda: dashboard.make_dashboard_sources(
+        dashboard_slack_client,
+        {
+            "trial_7_days": variables.trial_started_last_7_days,
+            "trial_about_end": variables.trial_about_end,
+            "trial_in_progress": variables.trial_in_progress,
+        },
+        request_timeout=variables.dashboard_source_timeout,
+    ),
+    max_workers=variables.dashboard_max_workers,
+    timeout=variables.dashboard_source_timeout,
+)
+
+# 🔺 'start' is served from a snapshot that is rebuilt in the background
+dashboard_snapshot = dashboard.DashboardSnapshot(
+    dashboard_builder,
+    interval=variables.dashboard_refresh_interval,
+    max_age=variables.dashboard_max_age,
+)
+dashboard_snapshot.start()
 
-    # adds user to list of users that have active configurations
-    if message.get('user') in active_list:
-        say(f"<@{message.get('user')}> Your current session is active. To start a new session, click on the END "
-            f"SESSION button or type ‘end’")
-        return
-    
-    # makes an API request to Retool that returns trial_started_last_7_days
-    response_7_days = requests.get(variables.trial_started_last_7_days)
-    response_about_end = requests.get(variables.trial_about_end)
-    response_in_progress = requests.get(variables.trial_in_progress)
-    sandbox_last_7_days = utility.get_users_created_in_last_seven_days()
-
-    # parse it into json
-    request_7_days = response_7_days.json()
-    request_about_end = response_about_end.json()
-    request_in_progress = response_in_progress.json()
-    request_sandbox_last_7_days = sandbox_last_7_days
-    
-    m = utility.make_tel_block(request_7_days.get('results'), request_about_end.get('results'),request_in_progress.get('results'), sandbox_last_7_days, client)
+
+def main_menu(message: {}, say, num: int, force_refresh: bool = False):
+
+    user_id = message.get('user')
+    # the Retool trials, Auth0 sandbox users, HubSpot deals and website visitors, precomputed in the background.
+    # a forced refresh can take a while, so it runs before the user lock is taken
+    snapshot = dashboard_snapshot.refresh() if force_refresh else dashboard_snapshot.get()
+    m = utility.make_tel_block(snapshot["data"], snapshot["built_at"])
     if m == {}:  # if no results were returned
         say("No search results found , please try again")
         return
-    # adds user to list of users that have active configurations
-    active_list.append(message.get('user'))
-    # send the message to the channel
-    say(m)
-    curr_message = client.conversations_history(channel=message.get('channel'), inclusive=True, latest=str(time()),
-                                                limit=1)
-    utility.add_user_info(admin_list, message.get('user'), curr_message["messages"][0].get('ts'), request_7_days, message)
-    utility.add_user_info(admin_list, message.get('user'), curr_message["messages"][0].get('ts'), request_about_end, message)
-    utility.add_user_info(admin_list, message.get('user'), curr_message["messages"][0].get('ts'), request_in_progress, message)
-    utility.add_user_info(admin_list, message.get('user'), curr_message["messages"][0].get('ts'), request_sandbox_last_7_days, message)
-
-    logger.info(f"Function main_menu() successfully finished for user {app.client.users_info(user=message.get('user')).get('user').get('name')}")
+
+    with sessions.lock(user_id):
+        # adds user to the users that have active configurations, before posting, so a second 'start' is refused
+        if sessions.start(user_id, None, message.get('channel')) is None:
+            say(f"<@{user_id}> Your current session is active. To start a new session, click on the END "
+                f"SESSION button or type ‘end’")
+            return
+        try:
+            # send the message to the channel, chat.postMessage returns the timestamp of the posted message
+            sessions.update(user_id, ts=say(m).get('ts'))
+        except Exception:
+            sessions.end(user_id)
+            raise
+
+    logger.info(f"Function main_menu() successfully finished for user {user_directory.name(message.get('user'))}")
+
+@app.action("refresh_dashboard")
+def handle_refresh_dashboard(ack, body, client):
+    """
+    Recomputes the dashboard snapshot and updates the dashboard message in place
+    """
+    ack()
+    try:
+        snapshot = dashboard_snapshot.refresh()
+        m = utility.make_tel_block(snapshot["data"], snapshot["built_at"])
+        if not m or not m.get("blocks"):
+            raise ValueError("the dashboard has no blocks")
+        client.chat_update(channel=body["channel"]["id"], ts=body["message"]["ts"], text="Dashboard",
+                           blocks=m["blocks"])
+        logger.info(f"🔄 Dashboard refreshed in {snapshot['seconds']:.2f}s")
+    except Exception as e:
+        logger.error(f"🚨 Failed to refresh the dashboard: {str(e)}")
+        try:
+            client.chat_postEphemeral(channel=body["channel"]["id"], user=body["user"]["id"],
+                                      text="⚠️ Refreshing the dashboard failed, please try again.")
+        except SlackApiError as e:
+            logger.error(f"🚨 Failed to report the failed dashboard refresh: {str(e)}")
 
 ########################################################################################################
 @app.event("block_actions")
@@ -478,8 +587,8 @@ def handle_block_actions(payload):
             utility.handle_view_sandbox_details(payload)
         elif action_id == "view_deals_details":
             utility.handle_view_deals_details(payload)
-        elif action_id == "account_search":
-            # This should be handled by the @app.action("account_search") decorator
+        elif action_id in ("account_search", "refresh_dashboard"):
+            # These are handled by their @app.action() decorators
             pass
         else:
             logger.info(f"Unhandled action_id: {action_id}")
@@ -634,8 +743,9 @@ def handle_message_events(body, say):
     text = event.get("text", "").strip().lower()
     channel_id = event.get("channel")
 
-    # IGNORE messages from the website visitors channel - bot should only READ from it, not respond
-    if channel_id == "C08N60KMEA2":
+    # website visitors channel - bot should only READ from it, not respond
+    if channel_id == visitors.VISITORS_CHANNEL_ID:
+        visitor_store.add_message(event)
         return
 
     if not text:
@@ -646,6 +756,10 @@ def handle_message_events(body, say):
         logger.info(f"🚀 Triggering main_menu() for {user_id}")
         main_menu(event, say, 0)
         return
+    elif text == "refresh":
+        logger.info(f"🔄 Triggering main_menu() with a fresh dashboard for {user_id}")
+        main_menu(event, say, 0, force_refresh=True)
+        return
     elif text == "end":
         logger.info(f"🛑 Triggering abort_action() for {user_id}")
         abort_action(user_id, event.get("channel"), say, lambda: None)
@@ -657,68 +771,39 @@ def handle_message_events(body, say):
 
     # 🔄 Process normal messages (search FAISS)
     logger.info(f"🔍 Processing normal message for search: '{text}'")
+    # post a placeholder right away and stream the answer into it
+    stream = slack_stream.SlackAnswerStream(app.client, channel_id, min_interval=variables.slack_stream_interval,
+                                            truncate=answer_truncator.truncate)
+    stream.start()
     try:
-        best_answer = None
-        combined_context = ""
-        max_score = -float("inf")
-        max_retrieved_docs = 5  # Number of documents to retrieve from FAISS
-
         logger.debug("🔍 Searching FAISS indexes...")
 
-        for source, qa_chain in qa_chains.items():
-            try:
-                logger.debug(f"🔎 Querying FAISS index: {source}")
-
-                # 🔹 Invoke LLM to get an answer
-                result = qa_chain.invoke(text)
-                answer = result["result"] if isinstance(result, dict) else result
-                logger.debug(f"📝 {source} response: {answer}")
-
-                # Filter out generic "I don't know" responses
-                if not any(phrase in answer.lower() for phrase in ["i'm sorry", "i don't know", "i don't have"]):
-                    combined_context += f"{answer}\n"
-
-                    # Retrieve supporting documents
-                    docs = qa_chain.retriever.invoke(text, search_kwargs={"k": max_retrieved_docs})
-
-                    if docs:
-                        score = docs[0].metadata.get("score", 0)  # Get score from metadata
-                        if score > max_score:
-                            max_score = score
-                            best_answer = answer
-
-            except BadRequestError as e:
-                if "context_length_exceeded" in str(e):
-                    say("⚠️ *FireflyBot Alert:* Your query is too broad and exceeds the token limit. Try rewording your question.")
-                    return
-                logger.error(f"🚨 OpenAI BadRequestError in {source}: {str(e)}")
-
-            except Exception as e:
-                logger.error(f"🚨 Error processing FAISS index {source}: {str(e)}", exc_info=True)
-
-        # 🔹 Token Limit Check - Ensure within Model Context Length
-        max_tokens = 16000  # Keep below model max limit (16385 tokens)
-        text_splitter = TokenTextSplitter(chunk_size=max_tokens, chunk_overlap=0)
-
-        # Select the best answer or fallback to combined context
-        if best_answer:
-            split_text = text_splitter.split_text(best_answer)
-        else:
-            split_text = text_splitter.split_text(combined_context)
+        try:
+            result = query_engine.query(text, on_token=stream.push)
+        except BadRequestError as e:
+            if "context_length_exceeded" in str(e):
+                stream.finish("⚠️ *FireflyBot Alert:* Your query is too broad and exceeds the token limit. Try rewording your question.")
+                return
+            # e.g. a content filter hit or an invalid request, not something the user can fix by rewording
+            logger.error(f"🚨 OpenAI BadRequestError: {str(e)}")
+            stream.finish("⚠️ *FireflyBot Alert:* An error occurred while processing your question.")
+            return
+
+        best_answer = result["answer"]
 
-        truncated_context = split_text[0] if split_text else ""
+        # 🔹 Size Check - Ensure the answer fits in a Slack message
+        truncated_context = answer_truncator.truncate(best_answer) if best_answer else ""
 
         if truncated_context.strip():
             logger.info(f"✅ Responding with: {truncated_context}")
-            say(f"🧐 *FireflyBot Answer:*\n{truncated_context}\n")
+            stream.finish(f"{slack_stream.ANSWER_HEADER}{truncated_context}\n", result["sources"])
         else:
             logger.warning("⚠️ No valid answer found or response too long.")
-            say("⚠️ *FireflyBot Alert:* Your query is too broad and exceeds the token limit. Try elaborating on a more specific question.")
+            stream.finish("⚠️ *FireflyBot Alert:* Your query is too broad and exceeds the token limit. Try elaborating on a more specific question.")
 
     except Exception as e:
         logger.error(f"🚨 Unexpected error: {str(e)}", exc_info=True)
-        if "say" in locals():
-            say("⚠️ *FireflyBot Alert:* An error occurred while processing your question.")
+        stream.finish("⚠️ *FireflyBot Alert:* An error occurred while processing your question.")
 
 ########################################################################################################
 
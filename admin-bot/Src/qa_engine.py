@@ -0,0 +1,244 @@
+# FireflyBot query engine - main.py hands every question to QueryEngine.query()
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from time import perf_counter
+from typing import Callable, Dict, List, Tuple
+
+from langchain.chains.question_answering.stuff_prompt import PROMPT_SELECTOR
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+# answers containing one of these are treated as "the knowledge base had nothing useful"
+NO_ANSWER_PHRASES = ["i'm sorry", "i don't know", "i don't have"]
+
+MAX_RETRIEVED_DOCS = 5  # Number of documents sent to the LLM after merging all sources
+
+
+def is_useful_answer(answer: str) -> bool:
+    """
+    :param answer: The text returned by the LLM
+    :return: False if the answer is empty or a generic "I don't know" response
+    """
+    if not answer or not answer.strip():
+        return False
+    return not any(phrase in answer.lower() for phrase in NO_ANSWER_PHRASES)
+
+
+def parse_source_weights(s: str) -> Dict[str, float]:
+    """
+    Parses the QA_SOURCE_WEIGHTS setting
+    :param s: A string of source:weight pairs, for example "firefly:1.2, slack:0.8"
+    :return: A dictionary of source -> weight. Sources that are not listed get a weight of 1
+    """
+    weights = {}
+    for element in s.split(","):
+        if ":" not in element:
+            continue
+        source, weight = element.split(":", 1)
+        weights[source.strip()] = float(weight)
+    return weights
+
+
+class QueryEngine:
+    """
+    Answers a question from all FAISS sources with a single LLM call.
+
+    The question is embedded once and the vector is searched in every index concurrently, with a
+    per-source deadline. The hits of all sources are merged and reranked by their real L2 distance
+    (divided by the source's weight, so a weight above 1 favours a source) and the top hits are "stuffed"
+    into one prompt. All indices are built with the same embeddings model, so their distances are comparable.
+    Only L2 indices can be merged this way, faiss_store.LazyFaissIndex refuses to load any other metric.
+
+    When an answer_cache is given, repeated questions are answered from it: an exact repeat without any
+    Azure OpenAI call, a rephrased one after the embedding call but without retrieval and generation.
+    """
+
+    def __init__(self, embeddings_model, faiss_indices: Dict, llm, max_workers: int = 6,
+                 source_timeout: float = 15.0, max_retrieved_docs: int = MAX_RETRIEVED_DOCS,
+                 source_weights: Dict[str, float] = None, answer_cache=None):
+        """
+        :param embeddings_model: The model used to build the FAISS indices
+        :param faiss_indices: Source name -> FAISS vector store
+        :param llm: The chat model that writes the answer
+        :param max_workers: Upper bound of threads shared by all in-flight questions
+        :param source_timeout: Seconds a source search may take before it is dropped
+        :param max_retrieved_docs: Number of merged documents sent to the LLM
+        :param source_weights: Optional source -> weight, see parse_source_weights()
+        :param answer_cache: Optional answer_cache.AnswerCache
+        """
+        self.embeddings_model = embeddings_model
+        self.faiss_indices = faiss_indices
+        self._indices_condition = threading.Condition()
+        self._readers = {}  # id(indices dict) -> number of searches (and questions submitting them) using it
+        self._generation = 0  # incremented by set_indices(), answers of older generations are not cached
+        self.source_timeout = source_timeout
+        self.max_retrieved_docs = max_retrieved_docs
+        self.source_weights = source_weights or {}
+        self.answer_cache = answer_cache
+        self.answer_chain = PROMPT_SELECTOR.get_prompt(llm) | llm
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="faiss-query")
+
+    def _search_source(self, source: str, faiss_index, vector: List[float]) -> Tuple[List[Tuple], float]:
+        """
+        Searches a single index with the shared question vector.
+        :return: A list of (document, distance) tuples, closest first, and the seconds the search took
+        """
+        started = perf_counter()
+        hits = faiss_index.similarity_search_with_score_by_vector(vector, k=self.max_retrieved_docs)
+        elapsed = perf_counter() - started
+        logger.info(f"⏱️ FAISS source {source}: {len(hits)} hits in {elapsed:.3f}s")
+        return hits, elapsed
+
+    def _hold(self, key: int):
+        with self._indices_condition:
+            self._readers[key] = self._readers.get(key, 0) + 1
+
+    def _release(self, key: int):
+        with self._indices_condition:
+            self._readers[key] -= 1
+            if not self._readers[key]:
+                del self._readers[key]
+                self._indices_condition.notify_all()
+
+    def retrieve(self, vector: List[float]) -> Tuple[List, Dict]:
+        """
+        Searches every index concurrently and merges the hits.
+        :param vector: The embedding of the question
+        :return: The top documents of all sources (with "source_index" and "score" set in their metadata)
+                 and the search time of every source (None if it failed or missed the deadline)
+        """
+        with self._indices_condition:
+            faiss_indices = self.faiss_indices
+            key = id(faiss_indices)
+            self._hold(key)
+        # every search holds the indices until it finished, a search that missed the deadline may still be running
+        futures = {}
+        try:
+            for source, faiss_index in faiss_indices.items():
+                self._hold(key)
+                try:
+                    future = self._executor.submit(self._search_source, source, faiss_index, vector)
+                except Exception:
+                    self._release(key)
+                    raise
+                future.add_done_callback(lambda _: self._release(key))
+                futures[future] = source
+        finally:
+            self._release(key)
+        done, pending = wait(futures, timeout=self.source_timeout)
+        for future in pending:
+            future.cancel()
+
+        hits = []
+        timings = {}
+        for future, source in futures.items():
+            if future in pending:
+                logger.warning(f"⏱️ FAISS source {source} dropped, missed the {self.source_timeout}s deadline")
+                timings[source] = None
+                continue
+            try:
+                source_hits, timings[source] = future.result()
+            except Exception as e:
+                logger.error(f"🚨 Error processing FAISS index {source}: {str(e)}", exc_info=True)
+                timings[source] = None
+                continue
+            weight = self.source_weights.get(source, 1.0)
+            for doc, distance in source_hits:
+                hits.append((float(distance) / weight, source, doc, float(distance)))
+
+        hits.sort(key=lambda hit: hit[0])
+        docs = []
+        for _, source, doc, distance in hits[:self.max_retrieved_docs]:
+            # copy, the stored document is shared with every other question
+            docs.append(Document(page_content=doc.page_content,
+                                 metadata={**doc.metadata, "source_index": source, "score": distance}))
+        return docs, timings
+
+    def set_indices(self, faiss_indices: Dict, drain_timeout: float = 60) -> Dict:
+        """
+        Atomically replaces the FAISS indices queried by the engine and drops the cached answers built from
+        the old ones. Questions that already started keep searching the old indices, their answers are not cached.
+        :param faiss_indices: Source name -> FAISS vector store
+        :param drain_timeout: Seconds between two warnings while in-flight searches still use the old indices
+        :return: The old indices, once no search (also none that missed its deadline) uses them, safe to release
+        """
+        with self._indices_condition:
+            old_indices = self.faiss_indices
+            self.faiss_indices = faiss_indices
+            self._generation += 1
+            if self.answer_cache:
+                self.answer_cache.invalidate()
+            waited = 0
+            while not self._indices_condition.wait_for(lambda: id(old_indices) not in self._readers, drain_timeout):
+                waited += drain_timeout
+                logger.warning(f"⏱️ In-flight searches still use the old FAISS indices after {waited}s, "
+                               f"they are closed once these finish")
+        return old_indices
+
+    def _cached(self, result: Dict, tier: str) -> Dict:
+        logger.info(f"⚡ FireflyBot answer served from the {tier} cache ({self.answer_cache.stats()})")
+        return {**result, "cache": tier}
+
+    def query(self, text: str, on_token: Callable[[str], None] = None) -> Dict:
+        """
+        Embeds the question, retrieves the best documents from all sources and asks the LLM once.
+        :param text: The user's question
+        :param on_token: Optional callback that receives the answer piece by piece while it is generated.
+                         Not called for cached answers
+        :return: {"answer": the answer or None, "source": source of the closest document or None,
+                  "sources": sources of the documents that were used, "timings": source -> seconds,
+                  "cache": "exact" / "semantic" when served from the answer cache, otherwise None}
+        :exception: Raises openai.BadRequestError if the prompt exceeds the model's context length
+        """
+        generation = self._generation
+        if self.answer_cache:
+            cached = self.answer_cache.get_exact(text)
+            if cached:
+                return self._cached(cached, "exact")
+
+        started = perf_counter()
+        vector = self.embeddings_model.embed_query(text)
+        logger.info(f"⏱️ Question embedded in {perf_counter() - started:.2f}s")
+
+        if self.answer_cache:
+            cached = self.answer_cache.get_semantic(vector)
+            if cached:
+                return self._cached(cached, "semantic")
+
+        docs, timings = self.retrieve(vector)
+        answer = None
+        if docs:
+            generation_started = perf_counter()
+            context = "\n\n".join(doc.page_content for doc in docs)
+            if on_token:
+                answer = ""
+                for chunk in self.answer_chain.stream({"context": context, "question": text}):
+                    answer += chunk.content
+                    on_token(chunk.content)
+            else:
+                answer = self.answer_chain.invoke({"context": context, "question": text}).content
+            logger.info(f"⏱️ Answer generated in {perf_counter() - generation_started:.2f}s")
+            logger.debug(f"📝 LLM response: {answer}")
+            if not is_useful_answer(answer):
+                answer = None
+
+        sources = list(dict.fromkeys(doc.metadata["source_index"] for doc in docs))
+        breakdown = ", ".join(f"{source}={'dropped' if elapsed is None else f'{elapsed:.3f}s'}"
+                              for source, elapsed in timings.items())
+        logger.info(f"⏱️ FireflyBot query finished in {perf_counter() - started:.2f}s "
+                    f"(sources used: {sources}, {breakdown})")
+
+        result = {"answer": answer,
+                  "source": sources[0] if sources else None,
+                  "sources": sources,
+                  "timings": timings,
+                  "cache": None}
+        # only real answers are cached, "nothing found" should be retried once the indices change
+        if self.answer_cache and answer:
+            with self._indices_condition:
+                # not if the indices were replaced meanwhile, the cache was invalidated for the new ones
+                if self._generation == generation:
+                    self.answer_cache.put(text, vector, result)
+        return result
@@ -0,0 +1,137 @@
+# Converts the flat FAISS indices of the knowledge base into approximate (IVF-Flat, HNSW, IVF-PQ) indices
+# and reports their recall/latency against the exact search. See faiss_store.build_ann_index().
+#
+# usage:
+#     python rebuild_indices.py --data-dir ./data --types ivf_flat hnsw ivf_pq --report report.json
+#     python rebuild_indices.py --sources slack --types ivf_pq --upload   # also pushes the files to S3
+import argparse
+import json
+import os
+from time import perf_counter
+
+import faiss
+import numpy as np
+
+import download_s3
+import faiss_store
+
+SOURCES = ["firefly", "confluence", "slack"]
+
+
+def write_index(index, path: str):
+    """
+    Writes an index next to its destination and renames it into place, so a running bot never maps a
+    half written file
+    """
+    faiss.write_index(index, path + download_s3.PARTIAL_SUFFIX)
+    os.replace(path + download_s3.PARTIAL_SUFFIX, path)
+
+
+def sample_queries(flat_index, count: int, seed: int = 42) -> np.ndarray:
+    """
+    Real questions need the Azure embeddings, so stored vectors with a little noise stand in for them
+    :return: A (count, dimension) float32 array
+    """
+    rng = np.random.default_rng(seed)
+    ids = rng.choice(flat_index.ntotal, size=min(count, flat_index.ntotal), replace=False)
+    vectors = np.vstack([flat_index.reconstruct(int(i)) for i in ids])
+    noise = rng.standard_normal(vectors.shape).astype(np.float32) * vectors.std() * 0.1
+    return vectors + noise
+
+
+def measure(index, queries: np.ndarray, truth: np.ndarray, k: int) -> dict:
+    """
+    Searches one query at a time, the way the bot does
+    :return: recall@k against the exact results and p50/p95 latency in milliseconds
+    """
+    samples = []
+    hits = 0
+    for query, expected in zip(queries, truth):
+        started = perf_counter()
+        _, ids = index.search(query[None, :], k)
+        samples.append((perf_counter() - started) * 1000)
+        hits += len(set(ids[0].tolist()) & set(expected.tolist()))
+    return {f"recall_at_{k}": hits / (len(queries) * k),
+            "p50_ms": float(np.percentile(samples, 50)),
+            "p95_ms": float(np.percentile(samples, 95))}
+
+
+def rebuild_source(data_dir: str, source: str, index_types, args) -> dict:
+    """
+    Builds every requested index type of a source and measures it
+    :return: The report of the source
+    """
+    index_dir = os.path.join(data_dir, f"faiss_index_{source}")
+    flat_path = os.path.join(index_dir, faiss_store.INDEX_FILE_NAME)
+    if not os.path.exists(flat_path):
+        print(f"🚨 No flat index for {source} in {index_dir}, skipping")
+        return {}
+
+    flat_index = faiss.read_index(flat_path, faiss_store.MMAP_FLAGS)
+    print(f"📂 {source}: {flat_index.ntotal} vectors of dimension {flat_index.d}")
+    queries = sample_queries(flat_index, args.queries)
+    _, truth = flat_index.search(queries, args.k)
+
+    report = {"vectors": flat_index.ntotal,
+              "dimension": flat_index.d,
+              "flat": dict(measure(flat_index, queries, truth, args.k), bytes=os.path.getsize(flat_path))}
+    for index_type in index_types:
+        started = perf_counter()
+        try:
+            index = faiss_store.build_ann_index(flat_index, index_type, nlist=args.nlist, hnsw_m=args.hnsw_m,
+                                                pq_m=args.pq_m)
+        except ValueError as e:
+            print(f"🚨 Cannot build {index_type} for {source}: {str(e)}")
+            continue
+        build_seconds = perf_counter() - started
+        path = os.path.join(index_dir, faiss_store.index_file_name(index_type))
+        write_index(index, path)
+
+        # accuracy/speed trade-off for the query-time knob of the type
+        knob, values = ("ef_search", args.ef_search) if index_type == "hnsw" else ("nprobe", args.nprobe)
+        sweep = []
+        for value in values:
+            faiss_store.set_search_params(index, **{knob: value})
+            sweep.append(dict(measure(index, queries, truth, args.k), **{knob: value}))
+            print(f"✅ {source} {index_type} {knob}={value}: recall@{args.k} {sweep[-1][f'recall_at_{args.k}']:.3f}, "
+                  f"p50 {sweep[-1]['p50_ms']:.2f}ms, p95 {sweep[-1]['p95_ms']:.2f}ms")
+        report[index_type] = {"bytes": os.path.getsize(path), "build_seconds": build_seconds, "sweep": sweep}
+        print(f"💾 {path}: {report[index_type]['bytes'] / 2 ** 20:.1f} MB "
+              f"(flat: {report['flat']['bytes'] / 2 ** 20:.1f} MB), built in {build_seconds:.1f}s")
+
+        if args.upload:
+            key = os.path.relpath(path, data_dir)
+            download_s3.s3_client.upload_file(path, args.bucket, key)
+            print(f"☁️ Uploaded s3://{args.bucket}/{key}")
+        del index
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Builds approximate FAISS indices from the flat ones")
+    parser.add_argument("--data-dir", default="./data", help="directory holding the faiss_index_<source> folders")
+    parser.add_argument("--sources", nargs="+", default=SOURCES, choices=SOURCES)
+    parser.add_argument("--types", nargs="+", default=["ivf_flat", "hnsw", "ivf_pq"],
+                        choices=[t for t in faiss_store.INDEX_TYPES if t != "flat"])
+    parser.add_argument("--nlist", type=int, default=None, help="IVF lists, 4 * sqrt(vectors) by default")
+    parser.add_argument("--hnsw-m", type=int, default=32, help="neighbours per HNSW node")
+    parser.add_argument("--pq-m", type=int, default=None, help="PQ sub-quantizers, must divide the dimension")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 8, 16, 32, 64], help="nprobe values to report")
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[16, 32, 64, 128],
+                        help="efSearch values to report")
+    parser.add_argument("--queries", type=int, default=200, help="sampled queries used for the report")
+    parser.add_argument("--k", type=int, default=5, help="neighbours per query")
+    parser.add_argument("--report", default=None, help="where to write the JSON report")
+    parser.add_argument("--upload", action="store_true", help="upload the new index files to the bucket")
+    parser.add_argument("--bucket", default=download_s3.S3_BUCKET_NAME)
+    args = parser.parse_args()
+
+    report = {source: rebuild_source(args.data_dir, source, args.types, args) for source in args.sources}
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"🎉 Report written to {args.report}")
+
+
+if __name__ == "__main__":
+    main()
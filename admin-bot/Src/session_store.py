@@ -0,0 +1,235 @@
+# Conversation state of the account management sessions ('start' ... 'end'), used by main.py
+import json
+import logging
+import threading
+import weakref
+from collections import OrderedDict
+from time import monotonic, time
+from typing import Dict, Optional
+
+try:
+    import redis
+except ImportError:  # only needed when the sessions are shared through Redis
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+
+class Session:
+    """
+    What a handler needs to know about a running session: Slack ids, timestamps and the picked account/action
+    """
+    __slots__ = ("user_id", "channel_id", "ts", "prev_ts", "account", "action", "started_at")
+
+    def __init__(self, user_id: str, channel_id: str = None, ts: str = None, prev_ts: str = "", account: str = "",
+                 action: str = "", started_at: float = None):
+        """
+        :param user_id: The Slack user that typed 'start'
+        :param channel_id: The channel the dashboard was posted to
+        :param ts: Timestamp of the dashboard message
+        :param prev_ts: Timestamp of the account details message, "" while there is none
+        :param account: The selected account name
+        :param action: The selected action label
+        :param started_at: UNIX timestamp of 'start'
+        """
+        self.user_id = user_id
+        self.channel_id = channel_id
+        self.ts = ts
+        self.prev_ts = prev_ts
+        self.account = account
+        self.action = action
+        self.started_at = started_at if started_at is not None else time()
+
+    def to_dict(self) -> Dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Session":
+        return cls(**{name: data[name] for name in cls.__slots__ if name in data})
+
+
+class MemoryBackend:
+    """
+    Sessions of this process, the least recently used first so expired ones are dropped from the front
+    """
+
+    def __init__(self, max_sessions: int = 1000):
+        """
+        :param max_sessions: The least recently used sessions are dropped beyond this number
+        """
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()  # user id -> (monotonic() it expires at, session dict)
+        self._lock = threading.Lock()
+        self._user_locks = weakref.WeakValueDictionary()
+
+    def _purge(self):
+        now = monotonic()
+        while self._sessions:
+            user_id, (expires_at, _) = next(iter(self._sessions.items()))
+            if expires_at > now and len(self._sessions) <= self.max_sessions:
+                return
+            del self._sessions[user_id]
+
+    def get(self, user_id: str) -> Optional[Dict]:
+        with self._lock:
+            self._purge()
+            entry = self._sessions.get(user_id)
+            return entry[1] if entry else None
+
+    def set(self, user_id: str, data: Dict, ttl: float, only_new: bool = False) -> bool:
+        """
+        :param only_new: Do not replace a running session
+        :return: False if only_new was set and the user already has a session
+        """
+        with self._lock:
+            self._purge()
+            if only_new and user_id in self._sessions:
+                return False
+            self._sessions[user_id] = (monotonic() + ttl, data)
+            self._sessions.move_to_end(user_id)
+            return True
+
+    def update(self, user_id: str, fields: Dict, ttl: float) -> Optional[Dict]:
+        """
+        :return: The updated session, None if the user has none
+        """
+        with self._lock:
+            self._purge()
+            entry = self._sessions.get(user_id)
+            if entry is None:
+                return None
+            data = dict(entry[1], **fields)
+            self._sessions[user_id] = (monotonic() + ttl, data)
+            self._sessions.move_to_end(user_id)
+            return data
+
+    def delete(self, user_id: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._sessions.pop(user_id, None)
+            return entry[1] if entry else None
+
+    def lock(self, user_id: str):
+        """
+        :return: The lock of the user, it lives as long as someone holds it
+        """
+        with self._lock:
+            user_lock = self._user_locks.get(user_id)
+            if user_lock is None:
+                user_lock = threading.Lock()
+                self._user_locks[user_id] = user_lock
+            return user_lock
+
+
+class RedisBackend:
+    """
+    Sessions in Redis (or anything speaking its get/set/delete/lock API), so several bot replicas share them.
+    Redis expires idle sessions itself, and the per-user lock is a Redis lock, so it holds across replicas.
+    """
+
+    def __init__(self, client, prefix: str = "admin-bot:session:", lock_timeout: float = 30):
+        """
+        :param client: e.g. redis.Redis.from_url(url)
+        :param prefix: Prefix of the keys
+        :param lock_timeout: Seconds after which the lock of a crashed handler is released
+        """
+        self.client = client
+        self.prefix = prefix
+        self.lock_timeout = lock_timeout
+
+    def get(self, user_id: str) -> Optional[Dict]:
+        data = self.client.get(self.prefix + user_id)
+        return json.loads(data) if data else None
+
+    def set(self, user_id: str, data: Dict, ttl: float, only_new: bool = False) -> bool:
+        return bool(self.client.set(self.prefix + user_id, json.dumps(data), ex=max(int(ttl), 1), nx=only_new))
+
+    def update(self, user_id: str, fields: Dict, ttl: float) -> Optional[Dict]:
+        # a short lock of its own, the user lock may be held by the handler calling this
+        with self.client.lock(self.prefix + "write:" + user_id, timeout=5):
+            data = self.get(user_id)
+            if data is None:
+                return None
+            data.update(fields)
+            self.client.set(self.prefix + user_id, json.dumps(data), ex=max(int(ttl), 1), xx=True)
+            return data
+
+    def delete(self, user_id: str) -> Optional[Dict]:
+        data = self.get(user_id)
+        self.client.delete(self.prefix + user_id)
+        return data
+
+    def lock(self, user_id: str):
+        return self.client.lock(self.prefix + "lock:" + user_id, timeout=self.lock_timeout)
+
+
+def create_backend(redis_url: str = "", max_sessions: int = 1000):
+    """
+    :param redis_url: A redis:// URL to share the sessions, empty to keep them in memory
+    :return: The backend of a SessionStore
+    """
+    if redis_url:
+        if redis is not None:
+            logger.info("🗄️ Sessions are shared through Redis")
+            return RedisBackend(redis.Redis.from_url(redis_url))
+        logger.error("🚨 SESSION_REDIS_URL is set but the redis package is not installed, keeping sessions in memory")
+    return MemoryBackend(max_sessions)
+
+
+class SessionStore:
+    """
+    The running sessions, at most one per user.
+
+    Every read and write is atomic, and lock(user_id) serialises a handler that reads a session, talks to Slack
+    and writes it back against a second click of the same user. A session expires ttl seconds after it was last
+    changed, so an abandoned dashboard does not block 'start' forever. Only ids, timestamps and the picked
+    account/action are kept (see Session), not the Retool responses or the Slack messages.
+    """
+
+    def __init__(self, backend=None, ttl: float = 3600):
+        """
+        :param backend: MemoryBackend (default) or RedisBackend, see create_backend()
+        :param ttl: Seconds a session is kept after its last change
+        """
+        self.backend = backend or MemoryBackend()
+        self.ttl = ttl
+
+    def lock(self, user_id: str):
+        """
+        :return: A context manager held while a handler works on the session of user_id
+        """
+        return self.backend.lock(user_id)
+
+    def start(self, user_id: str, ts: str, channel_id: str = None) -> Optional[Session]:
+        """
+        :return: The new session, None if the user already has one
+        """
+        session = Session(user_id, channel_id, ts)
+        return session if self.backend.set(user_id, session.to_dict(), self.ttl, only_new=True) else None
+
+    def get(self, user_id: str) -> Optional[Session]:
+        """
+        :return: The session of the user, None if there is none or it expired
+        """
+        data = self.backend.get(user_id) if user_id else None
+        return Session.from_dict(data) if data else None
+
+    def is_active(self, user_id: str) -> bool:
+        return self.get(user_id) is not None
+
+    def update(self, user_id: str, **fields) -> Optional[Session]:
+        """
+        Changes fields of the session (e.g. account=..., prev_ts=...) and restarts its ttl
+        :return: The updated session, None if the user has no session
+        """
+        unknown = set(fields) - set(Session.__slots__)
+        if unknown:
+            raise AttributeError(f"Sessions have no {', '.join(sorted(unknown))}")
+        data = self.backend.update(user_id, fields, self.ttl) if user_id else None
+        return Session.from_dict(data) if data else None
+
+    def end(self, user_id: str) -> Optional[Session]:
+        """
+        :return: The removed session, None if there was none
+        """
+        data = self.backend.delete(user_id)
+        return Session.from_dict(data) if data else None
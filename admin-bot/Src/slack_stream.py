@@ -0,0 +1,108 @@
+# Streams a FireflyBot answer into a single Slack message, used by main.handle_message_events
+import logging
+from time import monotonic, sleep
+from typing import Callable, List, Optional
+
+from slack_sdk.errors import SlackApiError
+
+logger = logging.getLogger(__name__)
+
+ANSWER_HEADER = "🧐 *FireflyBot Answer:*\n"
+PLACEHOLDER = "_Searching the knowledge base..._"
+CURSOR = " ▌"
+
+
+class SlackAnswerStream:
+    """
+    Posts a placeholder right away and keeps editing it with chat_update while the answer is generated.
+
+    Edits are batched: at most one per min_interval seconds and only once min_chars new characters
+    arrived. chat.update is a Tier 3 method, so a "ratelimited" error pauses the intermediate edits
+    for the Retry-After period instead of failing the answer.
+    """
+
+    def __init__(self, client, channel_id: str, min_interval: float = 1.5, min_chars: int = 20,
+                 truncate: Callable[[str], str] = None):
+        """
+        :param client: A Slack WebClient
+        :param channel_id: The channel the question was asked in
+        :param min_interval: Minimal seconds between two intermediate edits
+        :param min_chars: Minimal number of new characters before an intermediate edit
+        :param truncate: Optional function that cuts the streamed text to what fits in a Slack message
+        """
+        self.client = client
+        self.channel_id = channel_id
+        self.min_interval = min_interval
+        self.min_chars = min_chars
+        self.truncate = truncate or (lambda text: text)
+        self.ts = None
+        self.text = ""
+        self._shown_length = 0
+        self._next_update = 0.0
+
+    def start(self):
+        """
+        Posts the placeholder message. If it fails, finish() posts the answer as a new message.
+        """
+        try:
+            response = self.client.chat_postMessage(channel=self.channel_id, text=ANSWER_HEADER + PLACEHOLDER)
+            self.ts = response["ts"]
+            self._next_update = monotonic() + self.min_interval
+        except SlackApiError as e:
+            logger.error(f"🚨 Failed to post the FireflyBot placeholder: {str(e)}")
+
+    def push(self, token: str):
+        """
+        Appends a token of the answer and edits the message when the batch is big and old enough
+        :param token: The next piece of text streamed by the LLM
+        """
+        self.text += token
+        if self.ts is None or monotonic() < self._next_update or \
+                len(self.text) - self._shown_length < self.min_chars:
+            return
+        self._shown_length = len(self.text)
+        self._update(ANSWER_HEADER + self.truncate(self.text) + CURSOR)
+
+    def finish(self, text: str, sources: List[str] = None):
+        """
+        Replaces the streamed text with the final message. When there is no message to edit, or the edit
+        failed or stayed rate limited, the final message is posted as a new message instead.
+        :param text: The final message, including its header
+        :param sources: The knowledge-base sources the answer was built from
+        """
+        if sources:
+            text = f"{text}\n_Sources: {', '.join(sources)}_"
+        if self.ts is not None:
+            # the final edit must land, so wait out a rate limit instead of skipping it
+            for _ in range(3):
+                retry_after = self._update(text)
+                if retry_after == 0:
+                    return
+                if retry_after is None:
+                    break
+                sleep(retry_after)
+            else:
+                logger.error("🚨 Slack kept rate limiting the final FireflyBot edit")
+            logger.warning("⚠️ Posting the final FireflyBot answer as a new message")
+        try:
+            self.client.chat_postMessage(channel=self.channel_id, text=text)
+        except SlackApiError as e:
+            logger.error(f"🚨 Failed to post the FireflyBot answer: {str(e)}")
+
+    def _update(self, text: str) -> Optional[float]:
+        """
+        Edits the message
+        :return: 0 when the edit landed, seconds to wait when Slack rate limited it, None when it failed otherwise
+        """
+        try:
+            self.client.chat_update(channel=self.channel_id, ts=self.ts, text=text)
+            self._next_update = monotonic() + self.min_interval
+            return 0
+        except SlackApiError as e:
+            if e.response.get("error") == "ratelimited":
+                retry_after = max(float(e.response.headers.get("Retry-After", 1)), 1.0)
+                self._next_update = monotonic() + retry_after
+                logger.warning(f"⏱️ chat_update rate limited, pausing FireflyBot edits for {retry_after}s")
+                return retry_after
+            logger.error(f"🚨 Failed to update the FireflyBot answer: {str(e)}")
+            return None
@@ -0,0 +1,69 @@
+# Bounded truncation of FireflyBot answers before they are posted to Slack
+import threading
+
+import tiktoken
+
+# Slack truncates a message's text after 40,000 characters and recommends keeping it under 4,000
+SLACK_MAX_MESSAGE_CHARS = 4000
+TRUNCATION_MARKER = "…\n_(answer truncated)_"
+
+_encodings = {}
+_encodings_lock = threading.Lock()
+
+
+def get_encoding(encoding_name: str = "cl100k_base"):
+    """
+    :return: A tiktoken encoding, created once per process and shared by every caller
+    """
+    with _encodings_lock:
+        if encoding_name not in _encodings:
+            _encodings[encoding_name] = tiktoken.get_encoding(encoding_name)
+        return _encodings[encoding_name]
+
+
+class AnswerTruncator:
+    """
+    Cuts an answer down to what fits in a Slack message, and optionally to a token budget.
+
+    The character limit is applied first with a plain slice, so at most max_chars characters are ever
+    tokenized, no matter how long the answer is. The cost per answer is therefore constant.
+    """
+
+    def __init__(self, max_chars: int = SLACK_MAX_MESSAGE_CHARS, max_tokens: int = None,
+                 encoding_name: str = "cl100k_base"):
+        """
+        :param max_chars: Maximal length of the returned text, including the truncation marker
+        :param max_tokens: Optional maximal number of tokens of the returned text
+        :param encoding_name: The tiktoken encoding used to count tokens
+        """
+        self.max_chars = max_chars
+        self.max_tokens = max_tokens
+        self.encoding_name = encoding_name
+
+    def truncate(self, text: str) -> str:
+        """
+        :param text: The answer
+        :return: The answer itself if it fits, otherwise its beginning (cut at a word boundary when
+                 possible) followed by TRUNCATION_MARKER
+        """
+        fits_chars = len(text) <= self.max_chars
+        # a token covers at least one byte, so a short enough text cannot exceed the token budget
+        fits_tokens = self.max_tokens is None or len(text.encode("utf-8")) <= self.max_tokens
+        if fits_chars and fits_tokens:
+            return text
+
+        cut = text if fits_chars else text[:max(self.max_chars - len(TRUNCATION_MARKER), 0)]
+        if not fits_tokens:
+            encoding = get_encoding(self.encoding_name)
+            tokens = encoding.encode(cut)
+            if len(tokens) > self.max_tokens:
+                cut = encoding.decode(tokens[:self.max_tokens])
+            elif fits_chars:
+                return text
+
+        cut = cut[:max(self.max_chars - len(TRUNCATION_MARKER), 0)]
+        # prefer not to end in the middle of a word
+        boundary = max(cut.rfind("\n"), cut.rfind(" "))
+        if boundary > len(cut) * 0.8:
+            cut = cut[:boundary]
+        return cut.rstrip() + TRUNCATION_MARKER
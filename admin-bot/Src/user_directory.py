@@ -0,0 +1,140 @@
+# Cached Slack user names for log lines and audit records, used by main.py
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic, sleep
+from typing import Dict
+
+from slack_sdk.errors import SlackApiError
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 200  # users.list recommends at most 200 members per page
+
+
+def user_record(user: Dict) -> Dict:
+    """
+    :return: The fields of a users.list / users.info member that the bot uses
+    """
+    return {"name": user.get("name"), "real_name": user.get("real_name") or (user.get("profile") or {}).get("real_name")}
+
+
+class UserDirectory:
+    """
+    Slack user id -> name and real name, so a log line never waits on users.info.
+
+    start() warms the cache with every member of the workspace from users.list, and reloads it every ttl seconds
+    in a daemon thread. name() and real_name() only read the cache: for an unknown or expired user they return
+    the user id (or the cached value) and queue a single users.info lookup on a background worker, so the next
+    event of that user is logged with the name. Only callers that need the real value pass wait=True.
+    """
+
+    def __init__(self, client, ttl: float = 3600):
+        """
+        :param client: The Slack WebClient
+        :param ttl: Seconds a user is served from the cache before it is looked up again
+        """
+        self.client = client
+        self.ttl = ttl
+        self._users = {}  # user id -> (monotonic() of the lookup, record)
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="user-directory")
+        self._stop = threading.Event()
+        self._thread = None
+
+    def warm_up(self):
+        """
+        Caches every member of the workspace, paging through users.list and waiting out rate limits
+        """
+        started = monotonic()
+        cursor = None
+        count = 0
+        while True:
+            try:
+                response = self.client.users_list(limit=PAGE_SIZE, cursor=cursor)
+            except SlackApiError as e:
+                if e.response.get("error") != "ratelimited":
+                    raise
+                retry_after = float(e.response.headers.get("Retry-After", 1))
+                logger.warning(f"⏱️ users_list rate limited, retrying in {retry_after}s")
+                sleep(retry_after)
+                continue
+            now = monotonic()
+            with self._lock:
+                for user in response.get("members", []):
+                    self._users[user["id"]] = (now, user_record(user))
+                    count += 1
+            cursor = (response.get("response_metadata") or {}).get("next_cursor")
+            if not cursor:
+                break
+        logger.info(f"👤 Cached {count} Slack users in {monotonic() - started:.2f}s")
+
+    def start(self):
+        """
+        Warms up the cache in a daemon thread and reloads it every ttl seconds
+        """
+        self._thread = threading.Thread(target=self._run, name="user-directory", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while True:
+            try:
+                self.warm_up()
+            except Exception as e:
+                logger.error(f"🚨 Loading the Slack users failed: {str(e)}")
+            if self._stop.wait(self.ttl):
+                return
+
+    def _lookup(self, user_id: str) -> Dict:
+        """
+        Fetches a single user with users.info and caches it
+        """
+        try:
+            record = user_record(self.client.users_info(user=user_id).get("user") or {})
+            with self._lock:
+                self._users[user_id] = (monotonic(), record)
+            return record
+        except Exception as e:
+            logger.warning(f"⚠️ users_info failed for {user_id}: {str(e)}")
+            return None
+        finally:
+            with self._lock:
+                self._pending.discard(user_id)
+
+    def get(self, user_id: str, wait: bool = False) -> Dict:
+        """
+        :param wait: Look an unknown user up right away instead of in the background
+        :return: {"name": ..., "real_name": ...} of the user, None if it is not cached (yet)
+        """
+        if not user_id:
+            return None
+        with self._lock:
+            cached = self._users.get(user_id)
+            fresh = cached is not None and monotonic() - cached[0] < self.ttl
+            if fresh or (not wait and user_id in self._pending):
+                return cached[1] if cached else None
+            if not wait:
+                self._pending.add(user_id)
+        if wait:
+            return self._lookup(user_id) or (cached[1] if cached else None)
+        self._executor.submit(self._lookup, user_id)
+        return cached[1] if cached else None
+
+    def name(self, user_id: str) -> str:
+        """
+        :return: The Slack handle of the user, the user id while it is not cached
+        """
+        record = self.get(user_id)
+        return (record or {}).get("name") or user_id
+
+    def real_name(self, user_id: str, wait: bool = False) -> str:
+        """
+        :param wait: See get(), e.g. for the name written to the audit log
+        :return: The full name of the user, the user id while it is not cached
+        """
+        record = self.get(user_id, wait=wait)
+        return (record or {}).get("real_name") or user_id
@@ -4,9 +4,14 @@ import requests
 import logging
 import os
 from config import Vars
+import visitors
+import auth0_client
+import hubspot_client
+import block_templates
 from typing import List, Dict
 from datetime import datetime, timedelta, timezone
 import calendar
+import time
 
 ENTERPRISE = "ENTERPRISE"
 PREMIUM_TRIAL = "PREMIUM_TRIAL"
@@ -21,153 +26,56 @@ TEMPLATE_TEL_BLOCK = PATH_TO_LOCAL_PROJECT + "/templates/tel_block.json"
 
 variables = Vars()
 
+# Every template is parsed and validated once here, renders work on copies
+templates = block_templates.TemplateRegistry(
+    {"state": TEMPLATE_STATE, "actions": TEMPLATE_ACTIONS, "buttons": TEMPLATE_BUTTONS, "block": TEMPLATE_BLOCK,
+     "tel_block": TEMPLATE_TEL_BLOCK},
+    min_blocks={"state": 1, "block": 3, "tel_block": 15},  # the blocks the make_* functions fill in
+    reload=variables.template_reload)
+templates.load()
+
 ##########################################################################################################
-def get_hubspot_owners():
-    """Fetch all HubSpot owners to map owner IDs to names."""
-    headers = {
-        "Authorization": f"Bearer {variables.api_key_deals}",
-        "Content-Type": "application/json",
-    }
-#    print(f"Raw API Key: {repr(variables.api_key_deals)}")
-#    print(variables.owners_api_url)
+# Deal type to filter
+DEAL_TYPE = "newbusiness"  # Internal ID for New Business
+DAYS = 7  # Last 7 days
 
-    response = requests.get(variables.owners_api_url, headers=headers)
-    if response.status_code != 200:
-        print("Error fetching owners:", response.status_code, response.text)
-        return {}
+# One pooled session for every HubSpot search, the filtering is done by HubSpot.
+# Requests time out with the dashboard source, so a hung search does not hold a dashboard worker
+hubspot_deals = hubspot_client.HubSpotDealsClient(variables.api_key_deals, variables.deals_api_url or None,
+                                                  timeout=variables.dashboard_source_timeout)
+# Deals are read from a local mirror that only asks HubSpot for the deals modified since its last sync
+deal_mirror = hubspot_client.DealMirror(hubspot_deals, variables.deal_mirror_path, deal_types=[DEAL_TYPE],
+                                        retention_days=variables.deal_mirror_retention_days,
+                                        min_sync_interval=variables.deal_mirror_sync_interval,
+                                        full_sync_interval=variables.deal_mirror_full_sync_interval)
 
-    owners = response.json().get("results", [])
-    return {owner["id"]: owner["firstName"] + " " + owner["lastName"] for owner in owners if "firstName" in owner and "lastName" in owner}
 
 def get_recent_deals_by_type(deal_type, days=7, owners_map=None):
-    """Fetch all deals from HubSpot CRM with a specific deal type and created in the last 'days' days (from yesterday)."""
-    headers = {
-        "Authorization": f"Bearer {variables.api_key_deals}",
-        "Content-Type": "application/json",
-    }
-    params = {
-        "limit": 100,  # Number of records per page
-        "properties": "dealtype,dealname,amount,createdate,hubspot_owner_id,deal_source_1,deal_source_2",  # Include required properties
-        "archived": "false",
-    }
-
+    """Fetch the deals (from the local HubSpot mirror) with a specific deal type and created in the last 'days' days (from yesterday)."""
     # Calculate the cutoff datetime (7 days from yesterday, not from today)
     yesterday = datetime.now(timezone.utc) - timedelta(days=1)
     cutoff_date = yesterday - timedelta(days=days)
+    return deal_mirror.get_deals_created_between(deal_type, cutoff_date, yesterday)
 
-    deals = []
-    has_more = True
-    after = None
-
-    while has_more:
-        if after:
-            params["after"] = after  # Pagination token
-
-        response = requests.get(variables.deals_api_url, headers=headers, params=params)
-        if response.status_code != 200:
-            print("Error fetching deals:", response.status_code, response.text)
-            break
-
-        data = response.json()
-        for deal in data.get("results", []):
-            # Get the deal's created date
-            created_date = deal.get("properties", {}).get("createdate")
-            if created_date:
-                # Convert the ISO 8601 string to a datetime object
-                created_datetime = datetime.fromisoformat(created_date.replace("Z", "+00:00"))
-                # Check if the deal matches the type and is within the last 'days' days from yesterday
-                if deal.get("properties", {}).get("dealtype") == deal_type and cutoff_date <= created_datetime <= yesterday:
-                    deals.append(deal)
-
-        # Pagination handling
-        after = data.get("paging", {}).get("next", {}).get("after")
-        has_more = bool(after)
-
-    return deals
-
-owners_map = get_hubspot_owners()
-
-# Deal type to filter
-DEAL_TYPE = "newbusiness"  # Internal ID for New Business
-DAYS = 7  # Last 7 days
+# Owner id -> name, loaded on first use and reloaded in the background, so importing never waits for HubSpot
+owners_map = hubspot_client.OwnerDirectory(variables.api_key_deals, variables.owners_api_url or None,
+                                           session=hubspot_deals.session)
 
 ##########################################################################################################
 def get_deals_by_month(deal_type, start_date, end_date, owners_map=None):
     """
-    Fetch all deals from HubSpot CRM with a specific deal type within a given date range.
+    Fetch the deals (from the local HubSpot mirror) with a specific deal type within a given date range.
     
     Args:
         deal_type (str): The type of deal to filter (e.g., "newbusiness").
         start_date (datetime): Start date of the range (inclusive).
-        end_date (datetime): End date of the range (exclusive).
+        end_date (datetime): End date of the range (inclusive), see get_month_date_range().
         owners_map (dict): Optional mapping of HubSpot owner IDs to owner names.
 
     Returns:
-        list: A list of deals matching the criteria.
+        list: A list of deals matching the criteria, newest first.
     """
-    headers = {
-        "Authorization": f"Bearer {variables.api_key_deals}",
-        "Content-Type": "application/json",
-    }
-
-    # Initialize variables for pagination
-    deals = []
-    has_more = True
-    after = None
-
-    while has_more:
-        params = {
-            "limit": 100,  # Number of records per page
-            "properties": "dealtype,dealname,amount,createdate,hubspot_owner_id,deal_source_1,deal_source_2",
-            "archived": "false",
-            "filterGroups": [
-                {
-                    "filters": [
-                        {
-                            "propertyName": "createdate",
-                            "operator": "GTE",
-                            "value": f"{int(start_date.timestamp() * 1000)}"
-                        },
-                        {
-                            "propertyName": "createdate",
-                            "operator": "LTE",
-                            "value": f"{int(end_date.timestamp() * 1000)}"
-                        }
-                    ]
-                }
-            ]
-        }
-
-        if after:
-            params["after"] = after  # Add pagination token if available
-
-        response = requests.get(variables.deals_api_url, headers=headers, params=params)
-        if response.status_code != 200:
-            print(f"Error fetching deals: {response.status_code} - {response.text}")
-            break
-
-        data = response.json()
-        for deal in data.get("results", []):
-            created_date = deal.get("properties", {}).get("createdate")
-            deal_type_property = deal.get("properties", {}).get("dealtype")
-
-            if created_date:
-                try:
-                    created_datetime = datetime.fromisoformat(created_date.replace("Z", "+00:00"))
-                except ValueError:
-                    continue
-
-                # Normalize and compare deal type
-                if (
-                    deal_type_property and deal_type_property.strip().lower() == deal_type.strip().lower()
-                    and start_date <= created_datetime < end_date
-                ):
-                    deals.append(deal)
-
-        after = data.get("paging", {}).get("next", {}).get("after")
-        has_more = bool(after)
-
-    return deals
+    return deal_mirror.get_deals_created_between(deal_type, start_date, end_date)
 
 
 def get_month_date_range(year, month):
@@ -179,61 +87,23 @@ def get_month_date_range(year, month):
 
 #############################################################################################
 # Generate a Management API token
-def get_management_token() -> str:
-    """
-    Get the management token from Auth0.
-    """
-    url = f'https://{variables.auth0_doamin}/oauth/token'
-    payload = {
-        'grant_type': 'client_credentials',
-        'client_id': variables.client_id,
-        'client_secret': variables.client_secret,
-        'audience': f'https://{variables.auth0_doamin}/api/v2/'
-    }
-    response = requests.post(url, json=payload)
-    response.raise_for_status()
-    return response.json()['access_token']
+# One pooled session and one cached token for every Auth0 call
+auth0_session = auth0_client.create_session()
+auth0_tokens = auth0_client.Auth0TokenManager(variables.auth0_doamin, variables.client_id, variables.client_secret,
+                                              session=auth0_session, timeout=variables.dashboard_source_timeout)
 
-def get_filtered_users(token: str) -> List[Dict]:
-    """
-    Retrieve all users from Auth0 that have an 'originalAccountId' in their metadata.
-    """
-    url = f'https://{variables.auth0_doamin}/api/v2/users'
-    headers = {'Authorization': f'Bearer {token}'}
-    params = {
-        'q': 'app_metadata.originalAccountId:*',  # Query for users with originalAccountId
-        'search_engine': 'v3',  # Use the Lucene search engine
-        'page': 0,
-        'per_page': 50  # Adjust page size as needed
-    }
-    users = []
-    while True:
-        response = requests.get(url, headers=headers, params=params)
-        response.raise_for_status()
-        data = response.json()
-        if not data:
-            break
-        users.extend(data)
-        params['page'] += 1
-    return users
 
-def filter_last_seven_days(users: List[Dict]) -> List[Dict]:
+def get_management_token() -> str:
     """
-    Filter users created within the last 7 days (7 days from yesterday).
-    Example: if today is 14.9, last 7 days should be 7.9-13.9
+    Get the management token from Auth0. The token is cached and renewed shortly before it expires.
     """
-    last_seven_days = []
-    # Calculate 7 days from yesterday (not from today)
-    yesterday = datetime.now(timezone.utc) - timedelta(days=1)
-    seven_days_ago = yesterday - timedelta(days=7)
+    return auth0_tokens.get_token()
 
-    for user in users:
-        created_at = datetime.strptime(user['created_at'], '%Y-%m-%dT%H:%M:%S.%fZ').replace(tzinfo=timezone.utc)
-        if seven_days_ago <= created_at <= yesterday:
-            last_seven_days.append(user)
-#            print(last_seven_days)######################################
-#    print(last_seven_days)
-    return last_seven_days
+
+# Auth0 filters by created_at itself, and the result is shared by the dashboard count and the details view
+auth0_users = auth0_client.Auth0UserQuery(variables.auth0_doamin, get_management_token, ttl=variables.auth0_cache_ttl,
+                                          session=auth0_session, invalidate_token=auth0_tokens.invalidate,
+                                          timeout=variables.dashboard_source_timeout)
 
 
 def get_users_created_in_last_seven_days() -> List[Dict]:
@@ -241,15 +111,9 @@ def get_users_created_in_last_seven_days() -> List[Dict]:
     Retrieves users created in the last 7 days (from yesterday) by calling the Auth0 API.
     """
     try:
-        token = get_management_token()
-#        print("Token generated successfully")
-        users = get_filtered_users(token)
-#        print(f"Retrieved {len(users)} users.")
-        last_seven_days = filter_last_seven_days(users)
-#        print(f"Users created in the last 7 days: {len(last_seven_days)}")
-        return last_seven_days
+        return auth0_users.get_users_created_last_days(7)
     except requests.exceptions.RequestException as e:
-#        print("Error fetching users:", e)
+        logging.error(f"Error fetching Auth0 users: {e}")
         return []
 
 
@@ -279,27 +143,6 @@ def get_options_from_auth0(users: List[Dict]) -> List[Dict]:
         })
     return options
 
-'''def count_unique_account_names(data):
-    # Extract "account_name" values
-    account_names = [item['account_name'] for item in data if 'account_name' in item]
-    
-    # Count unique account names
-    unique_count = len(set(account_names))
-    print(unique_count)
-    return unique_count
-'''
-def count_unique_account_names() -> List[Dict]:
-    """
-    Retrieves users created in the last 7 days (from yesterday) by calling the Auth0 API.
-    """
-    
-    token = get_management_token()
-    users = get_filtered_users(token)
-    last_seven_days = filter_last_seven_days(users)
-    last_seven_days = len(last_seven_days)
-#    print(last_seven_days)
-    return last_seven_days
-
 ##############################################################################################
 
 def fetch_sandbox_last_7_days() -> List[Dict]:
@@ -409,24 +252,19 @@ def make_block(arr: [], name: str) -> json:
     :return: returns a json Slack block that will be sent to Slack
     """
     try:
-        with open(TEMPLATE_BLOCK, 'r+') as f:
-            data = json.load(f)
-            
-            options = get_options(arr)
-            
-            if len(options) == 0:
-                return {}
-                
-            data['blocks'][0]['text']['text'] = f"*SELECTED VALUE:* *{name}*"
-            data['blocks'][2]['accessory']['options'] = options
-            
-            return data
-            
-    except FileNotFoundError as e:
-        logging.error(f"Template file not found: {TEMPLATE_BLOCK}")
-        return {}
-    except json.JSONDecodeError as e:
-        logging.error(f"Failed to parse template JSON: {str(e)}")
+        options = get_options(arr)
+
+        if len(options) == 0:
+            return {}
+
+        data = templates.get("block")
+        data['blocks'][0]['text']['text'] = f"*SELECTED VALUE:* *{name}*"
+        data['blocks'][2]['accessory']['options'] = options
+
+        return data
+
+    except block_templates.TemplateError as e:
+        logging.error(str(e))
         return {}
     except Exception as e:
         logging.error(f"Unexpected error in make_block: {str(e)}")
@@ -437,169 +275,203 @@ def adjusted_count(arr):
         return 0  # Return 0 if the structure is not as expected
     return 0 if arr[0][0] == '-' else len(arr)
 
-def make_tel_block(
-    arr_7_days: [], 
-    arr_about_end: [], 
-    arr_in_progress: [], 
-    arr_sandbox_last_7_days: [],
-    slack_client=None
-) -> json:
-    """
-    Creates the Slack text block that will be posted after configuration is complete.
-    This includes sections for 'Started in the last 7 days', 'About to end', 
-    'In progress', and 'Sandbox last 7 days'.
-    :param arr_7_days: All the trials that were returned from Retool (for 7 days).
-    :param arr_about_end: Trials that are about to end.
-    :param arr_in_progress: Trials that are currently in progress.
-    :param arr_sandbox_last_7_days: Users from Auth0 who accessed the sandbox in the last 7 days.
+DATA_UNAVAILABLE = "_data unavailable_"
+
+
+def get_deal_month_ranges(now: datetime = None) -> Dict[str, tuple]:
+    """
+    Date ranges of the monthly deal counts shown on the dashboard
+    :param now: The current time, defaults to now (UTC)
+    :return: A dictionary of dashboard key -> (month number, start datetime, end datetime).
+             The current month runs from its 1st until yesterday, not until the end of the month.
+    """
+    now = now or datetime.now(timezone.utc)
+    current_year = now.year
+    current_month = now.month
+
+    # Current month range (from 1st until yesterday, not until end of month)
+    yesterday = now - timedelta(days=1)
+    start_current_month = datetime(current_year, current_month, 1, tzinfo=timezone.utc)
+    end_current_month = yesterday.replace(hour=23, minute=59, second=59, microsecond=999999)
+
+    # Last month range
+    last_month = current_month - 1 if current_month > 1 else 12
+    last_month_year = current_year if current_month > 1 else current_year - 1
+    start_last_month, end_last_month = get_month_date_range(last_month_year, last_month)
+
+    # Two months back range
+    two_months_back = last_month - 1 if last_month > 1 else 12
+    two_months_back_year = last_month_year if last_month > 1 else last_month_year - 1
+    start_two_months_back, end_two_months_back = get_month_date_range(two_months_back_year, two_months_back)
+
+    return {"deals_current_month": (current_month, start_current_month, end_current_month),
+            "deals_last_month": (last_month, start_last_month, end_last_month),
+            "deals_two_months_back": (two_months_back, start_two_months_back, end_two_months_back)}
+
+
+def get_deal_windows(now: datetime = None) -> Dict[str, tuple]:
+    """
+    Every reporting window of the dashboard deal counts
+    :param now: The current time, defaults to now (UTC)
+    :return: A dictionary of dashboard key -> (start datetime, end datetime), 'deals_last_7_days' plus
+             the months of get_deal_month_ranges()
+    """
+    now = now or datetime.now(timezone.utc)
+    yesterday = now - timedelta(days=1)
+    windows = {"deals_last_7_days": (yesterday - timedelta(days=DAYS), yesterday)}
+    for key, (_, start_date, end_date) in get_deal_month_ranges(now).items():
+        windows[key] = (start_date, end_date)
+    return windows
+
+
+def get_dashboard_deals(deal_type: str = DEAL_TYPE) -> Dict[str, list]:
+    """
+    Reads the deals of every dashboard window from the deal mirror in one query over their union range
+    :return: A dictionary of dashboard key -> deals, see get_deal_windows()
+    """
+    return deal_mirror.get_deals_in_windows(deal_type, get_deal_windows())
+
+
+def format_age(seconds: float) -> str:
+    """
+    :return: A short human readable age, e.g. "just now", "4 min ago", "2 h ago"
+    """
+    if seconds < 60:
+        return "just now"
+    if seconds < 3600:
+        return f"{int(seconds // 60)} min ago"
+    return f"{int(seconds // 3600)} h ago"
+
+
+def make_tel_block(data: Dict, built_at: float = None) -> json:
+    """
+    Creates the Slack text block of the dashboard that is posted on 'start'.
+    This includes sections for 'Started in the last 7 days', 'About to end', 'In progress',
+    'Sandbox last 7 days', the deal counts and the website visitors.
+    :param data: The dashboard data collected by dashboard.py, source name -> value:
+                 trial_7_days, trial_about_end, trial_in_progress (Retool responses), sandbox_users (Auth0 users),
+                 deals (HubSpot deals per window of get_deal_windows(), see get_dashboard_deals()),
+                 visitors_last_7_days, visitors_current_month, visitors_last_month, visitors_two_months_back (counts).
+                 Sources that failed are missing and their section shows DATA_UNAVAILABLE.
+    :param built_at: When the data was collected (UNIX timestamp), shown with a refresh button if given
     :return: Returns a JSON Slack block that will be sent to Slack.
     """
-#    print("Received in make_tel_block - arr_7_days:", arr_7_days)
-#    print("Received in make_tel_block - arr_about_end:", arr_about_end)
-#    print("Received in make_tel_block - arr_in_progress:", arr_in_progress)
-#    print("Received in make_tel_block - arr_sandbox_last_7_days:", arr_sandbox_last_7_days)
-    with open(TEMPLATE_TEL_BLOCK, 'r+') as f:
-        data = json.load(f)
-#        print(f"Blocks structure: {data['blocks']}")
-
-        # Get options for each section from the arrays passed in
-        options_7_days = get_options(arr_7_days) 
-        options_about_end = get_options(arr_about_end)
-        options_in_progress = get_options(arr_in_progress)
-        options_sandbox_last_7_days = get_options_from_auth0(arr_sandbox_last_7_days)
-#        print(f"arr_7_days: {options_7_days}")
-#        print(f"arr_about_end: {options_about_end}")
-#        print(f"arr_in_progress: {arr_in_progress}")
-#        print(f"arr_sandbox_last_7_days: {arr_sandbox_last_7_days}")
-#        print("Options for sandbox last 7 days:", options_sandbox_last_7_days)
-#        print("Options in progress:", options_in_progress)
-        if isinstance(arr_sandbox_last_7_days, dict):
-            arr_sandbox_last_7_days = list(arr_sandbox_last_7_days.values())
-
-        now = datetime.now(timezone.utc)
-        current_year = now.year
-        current_month = now.month
-
-        # Current month range (from 1st until yesterday, not until end of month)
-        yesterday = now - timedelta(days=1)
-        start_current_month = datetime(current_year, current_month, 1, tzinfo=timezone.utc)
-        end_current_month = yesterday.replace(hour=23, minute=59, second=59, microsecond=999999)
-        current_month_deals = get_deals_by_month(DEAL_TYPE, start_current_month, end_current_month, owners_map)
-
-# Last month range
-        last_month = current_month - 1 if current_month > 1 else 12
-        last_month_year = current_year if current_month > 1 else current_year - 1
-        start_last_month, end_last_month = get_month_date_range(last_month_year, last_month)
-        last_month_deals = get_deals_by_month(DEAL_TYPE, start_last_month, end_last_month, owners_map)
-
-# Two months back range
-        two_months_back = last_month - 1 if last_month > 1 else 12
-        two_months_back_year = last_month_year if last_month > 1 else last_month_year - 1
-        start_two_months_back, end_two_months_back = get_month_date_range(two_months_back_year, two_months_back)
-        two_months_back_deals = get_deals_by_month(DEAL_TYPE, start_two_months_back, end_two_months_back, owners_map)
-
-        # Get counts for each section
-        count_7_days = adjusted_count(arr_7_days)
-        count_about_end = adjusted_count(arr_about_end)
-        count_in_progress = adjusted_count(arr_in_progress)
-        count_sandbox_last_7_days = count_unique_account_names()
-        count_deals = len(get_recent_deals_by_type(DEAL_TYPE, DAYS, owners_map))
-
-        # Check if required options are available (but don't return early - we still want to show website visitors)
-        if not options_7_days or not options_about_end or not options_in_progress or not options_sandbox_last_7_days:
-            # Log warning but continue to show website visitors section
-            logging.warning("Some required options are empty, but continuing to show website visitors section")
-
-#        print(count_sandbox_last_7_days)
-        # Update the 'Started in the last 7 days' section
-        data['blocks'][2]['text']['text'] = f"*Started in the last 7 days:* *{count_7_days}*"
-        data['blocks'][2]['accessory']['options'] = options_7_days
-
-        # Update the 'About to end' section
-        data['blocks'][3]['text']['text'] = f"*About to end:* *{count_about_end}*"
-        data['blocks'][3]['accessory']['options'] = options_about_end
-
-        # Update the 'In progress' section
-        data['blocks'][4]['text']['text'] = f"*In progress:* *{count_in_progress}*"
-        data['blocks'][4]['accessory']['options'] = options_in_progress
-
-        # Update the 'Sandbox last 7 days' section
-        data['blocks'][7] = {
-            "type": "section",
-            "text": {"type": "mrkdwn", "text": f"*Sandbox last 7 days:* *{count_sandbox_last_7_days}*"},
-            "accessory": {
-                "type": "button",
-                "text": {"type": "plain_text", "text": "View Details"},
-                "action_id": "view_sandbox_details"
-            }
-        }
-        
-        data['blocks'][10] = {
-            "type": "section",
-            "text": {"type": "mrkdwn", "text": f"*New deals last 7 days:* *{count_deals}*"},
-            "accessory": {
-                "type": "button",
-                "text": {"type": "plain_text", "text": "View Details"},
-                "action_id": "view_deals_details"
-            }
-        }
-        data['blocks'][12] = {
-            "type": "section",
-            "text": {"type": "mrkdwn", "text": f"*Deals created current month:* *({now.strftime('%B')}): {len(current_month_deals)}*"},
+    def count_text(key, count):
+        return f"*{count(data[key])}*" if key in data else DATA_UNAVAILABLE
+
+    deals = data.get("deals", {})
+
+    def deals_count_text(key):
+        return f"*{len(deals[key])}*" if key in deals else DATA_UNAVAILABLE
+
+    block = templates.get("tel_block")
+
+    # Update the trial sections, a section without accounts has no select menu
+    for index, key, title in ((2, "trial_7_days", "Started in the last 7 days"),
+                              (3, "trial_about_end", "About to end"),
+                              (4, "trial_in_progress", "In progress")):
+        arr = (data.get(key) or {}).get('results')
+        options = get_options(arr)
+        block['blocks'][index]['text']['text'] = f"*{title}:* {count_text(key, lambda request: adjusted_count(arr))}"
+        if options:
+            block['blocks'][index]['accessory']['options'] = options
+        else:
+            block['blocks'][index].pop('accessory', None)
+
+    # Update the 'Sandbox last 7 days' section
+    block['blocks'][7] = {
+        "type": "section",
+        "text": {"type": "mrkdwn", "text": f"*Sandbox last 7 days:* {count_text('sandbox_users', len)}"},
+        "accessory": {
+            "type": "button",
+            "text": {"type": "plain_text", "text": "View Details"},
+            "action_id": "view_sandbox_details"
         }
-        data['blocks'][13] = {
-            "type": "section",
-            "text": {"type": "mrkdwn", "text": f"*Deals created last month:* *({calendar.month_name[last_month]}): {len(last_month_deals)}*"},
+    }
+
+    block['blocks'][10] = {
+        "type": "section",
+        "text": {"type": "mrkdwn", "text": f"*New deals last 7 days:* {deals_count_text('deals_last_7_days')}"},
+        "accessory": {
+            "type": "button",
+            "text": {"type": "plain_text", "text": "View Details"},
+            "action_id": "view_deals_details"
         }
-        data['blocks'][14] = {
+    }
+    month_ranges = get_deal_month_ranges()
+    for index, key, title in ((12, "deals_current_month", "Deals created current month"),
+                              (13, "deals_last_month", "Deals created last month"),
+                              (14, "deals_two_months_back", "Deals created two months back")):
+        month = calendar.month_name[month_ranges[key][0]]
+        text = f"*{title}:* *({month}): {len(deals[key])}*" if key in deals else f"*{title}:* *({month}):* {DATA_UNAVAILABLE}"
+        block['blocks'][index] = {
             "type": "section",
-            "text": {"type": "mrkdwn", "text": f"*Deals created two months back:* *({calendar.month_name[two_months_back]}): {len(two_months_back_deals)}*"},
+            "text": {"type": "mrkdwn", "text": text},
         }
-        
-        # Insert Website Visitors section before the search section
-        # Find the search section and insert before it
-        search_index = None
-        for i, block in enumerate(data['blocks']):
-            if block.get('type') == 'input' and block.get('element', {}).get('action_id') == 'account_search':
-                search_index = i
-                break
-        
-        if search_index is not None:
-            # Insert website visitors section before search
-            website_visitors_blocks = [
-                {
-                    "type": "section",
-                    "text": {"type": "mrkdwn", "text": ":globe_with_meridians: Website Visitors (filtered) :globe_with_meridians:"}
-                },
-                {
-                    "type": "divider"
-                },
-                {
-                    "type": "section",
-                    "text": {"type": "mrkdwn", "text": f"*Visitors last 7 days:* *{get_visitors_last_7_days(slack_client) if slack_client else 0}*"},
-                },
-                {
-                    "type": "section",
-                    "text": {"type": "mrkdwn", "text": f"*Visitors current month ({get_month_name(0)}):* *{get_visitors_current_month(slack_client) if slack_client else 0}*"},
-                },
-                {
-                    "type": "section",
-                    "text": {"type": "mrkdwn", "text": f"*Visitors last month ({get_month_name(1)}):* *{get_visitors_last_month(slack_client) if slack_client else 0}*"},
-                },
-                {
-                    "type": "section",
-                    "text": {"type": "mrkdwn", "text": f"*Visitors two months back ({get_month_name(2)}):* *{get_visitors_two_months_back(slack_client) if slack_client else 0}*"},
-                },
-                {
-                    "type": "divider"
-                }
-            ]
-            
-            # Insert the blocks in reverse order to maintain correct positioning
-            for block in reversed(website_visitors_blocks):
-                data['blocks'].insert(search_index, block)
-        
-        return data
+
+    # Insert Website Visitors section before the search section
+    # Find the search section and insert before it
+    search_index = None
+    for i, item in enumerate(block['blocks']):
+        if item.get('type') == 'input' and item.get('element', {}).get('action_id') == 'account_search':
+            search_index = i
+            break
+
+    if search_index is not None:
+        # Insert website visitors section before search
+        website_visitors_blocks = [
+            {
+                "type": "section",
+                "text": {"type": "mrkdwn", "text": ":globe_with_meridians: Website Visitors (filtered) :globe_with_meridians:"}
+            },
+            {
+                "type": "divider"
+            },
+            {
+                "type": "section",
+                "text": {"type": "mrkdwn", "text": f"*Visitors last 7 days:* {count_text('visitors_last_7_days', int)}"},
+            },
+            {
+                "type": "section",
+                "text": {"type": "mrkdwn", "text": f"*Visitors current month ({get_month_name(0)}):* {count_text('visitors_current_month', int)}"},
+            },
+            {
+                "type": "section",
+                "text": {"type": "mrkdwn", "text": f"*Visitors last month ({get_month_name(1)}):* {count_text('visitors_last_month', int)}"},
+            },
+            {
+                "type": "section",
+                "text": {"type": "mrkdwn", "text": f"*Visitors two months back ({get_month_name(2)}):* {count_text('visitors_two_months_back', int)}"},
+            },
+            {
+                "type": "divider"
+            }
+        ]
+
+        # Insert the blocks in reverse order to maintain correct positioning
+        for item in reversed(website_visitors_blocks):
+            block['blocks'].insert(search_index, item)
+
+    # Show how old the numbers are, next to the END SESSION button
+    if built_at is not None:
+        actions = block['blocks'][-1]
+        actions['elements'].append({
+            "action_id": "refresh_dashboard",
+            "type": "button",
+            "text": {"type": "plain_text", "text": ":arrows_counterclockwise: REFRESH"},
+            "value": "refresh_dashboard"
+        })
+        block['blocks'].insert(len(block['blocks']) - 1, {
+            "type": "context",
+            "elements": [{
+                "type": "mrkdwn",
+                "text": f":clock3: Data as of <!date^{int(built_at)}^{{time}}|"
+                        f"{datetime.fromtimestamp(built_at, timezone.utc).strftime('%H:%M UTC')}> "
+                        f"({format_age(time.time() - built_at)})"
+            }]
+        })
+
+    return block
 
 def update_block(values: {}) -> json:
     """
@@ -607,91 +479,88 @@ def update_block(values: {}) -> json:
     :param values: The values of the account. Returned from a Retool API request
     :return: returns an updated action message JSON
     """
-    with open(TEMPLATE_STATE, 'r+') as f: #opens the file in read+write mode
-        data = json.load(f)
-        tier = values.get('tier_type')
-        active = values.get('active')
-        #  show active status
-        data["blocks"][0]["text"]["text"] = f"Statistics for account: {values.get('name')}"
-        data.get("blocks").append(
-            {"type": "context",
-            "elements": [
-                {"type": "plain_text",
-                "text": f"Active: {str(values.get('active'))}{' :white_check_mark:' if values.get('active') else ' :x:'}"}
-            ]}
-        )
-        # shows onboarding status
-        data["blocks"][1].get("elements").append(
+    data = templates.get("state")
+    tier = values.get('tier_type')
+    active = values.get('active')
+    #  show active status
+    data["blocks"][0]["text"]["text"] = f"Statistics for account: {values.get('name')}"
+    data.get("blocks").append(
+        {"type": "context",
+        "elements": [
             {"type": "plain_text",
-            "text": (
-                f"Onboarding Status: {str(values.get('onboarding_status'))}"
-                f"{' :ballot_box_with_check:' if values.get('onboarding_status') == 'done' else ' :x:'}"
-            )}
-        )
-
-        # shows asset count
-        data["blocks"][1].get("elements").append(
-            {"type": "plain_text",
-            "text": f"Assets: {values.get('asset_number')} :chart_with_upwards_trend:"}
-        )
-        # shows asset count
-        data["blocks"][1].get("elements").append(
-            {"type": "plain_text",
-            "text": f"License Age: {values.get('license_age')} :handshake:"}
-        )
-
-        # Shows last activity
-        data["blocks"][1].get("elements").append(
-            {"type": "plain_text",
-            "text": f"Last Activity: {values.get('last_activity')} :clock3:"}
-        )
-        # Shows total savings
-        data["blocks"][1].get("elements").append(
-            {"type": "plain_text",
-            "text": f"Total Savings: {values.get('total_savings')} :moneybag:"}
-        )
-        # Shows tier
-        data["blocks"][1].get("elements").append(
-            {"type": "plain_text",
-            "text": f"Tier: {tier} {':house:' if tier == 'PREMIUM_TRIAL' else ':office:'}"}
-        )
-        # Shows SKUs
-        skus = values.get('skus', [])
-        if not isinstance(skus, list):
-            skus = []  # Ensure it's a list
-        skus_text = ", ".join(skus) if skus else "None"
-        
-        data["blocks"][1].get("elements").append(
-            {"type": "plain_text",
-            "text": f"SKUs: {skus_text} :package:"}
-        )
-        data["blocks"][1].get("elements").append(
-            {"type": "plain_text",
-            "text": (
-                " IaC Status: :o:\n"
-                f"Codified: {values.get('codified')}\n"
-                f"Drift: {values.get('drift')}\n"
-                f"Unmanaged: {values.get('unmanaged')}"
-            )
-            }
+            "text": f"Active: {str(values.get('active'))}{' :white_check_mark:' if values.get('active') else ' :x:'}"}
+        ]}
+    )
+    # shows onboarding status
+    data["blocks"][1].get("elements").append(
+        {"type": "plain_text",
+        "text": (
+            f"Onboarding Status: {str(values.get('onboarding_status'))}"
+            f"{' :ballot_box_with_check:' if values.get('onboarding_status') == 'done' else ' :x:'}"
+        )}
+    )
+
+    # shows asset count
+    data["blocks"][1].get("elements").append(
+        {"type": "plain_text",
+        "text": f"Assets: {values.get('asset_number')} :chart_with_upwards_trend:"}
+    )
+    # shows asset count
+    data["blocks"][1].get("elements").append(
+        {"type": "plain_text",
+        "text": f"License Age: {values.get('license_age')} :handshake:"}
+    )
+
+    # Shows last activity
+    data["blocks"][1].get("elements").append(
+        {"type": "plain_text",
+        "text": f"Last Activity: {values.get('last_activity')} :clock3:"}
+    )
+    # Shows total savings
+    data["blocks"][1].get("elements").append(
+        {"type": "plain_text",
+        "text": f"Total Savings: {values.get('total_savings')} :moneybag:"}
+    )
+    # Shows tier
+    data["blocks"][1].get("elements").append(
+        {"type": "plain_text",
+        "text": f"Tier: {tier} {':house:' if tier == 'PREMIUM_TRIAL' else ':office:'}"}
+    )
+    # Shows SKUs
+    skus = values.get('skus', [])
+    if not isinstance(skus, list):
+        skus = []  # Ensure it's a list
+    skus_text = ", ".join(skus) if skus else "None"
+    
+    data["blocks"][1].get("elements").append(
+        {"type": "plain_text",
+        "text": f"SKUs: {skus_text} :package:"}
+    )
+    data["blocks"][1].get("elements").append(
+        {"type": "plain_text",
+        "text": (
+            " IaC Status: :o:\n"
+            f"Codified: {values.get('codified')}\n"
+            f"Drift: {values.get('drift')}\n"
+            f"Unmanaged: {values.get('unmanaged')}"
         )
-
-        # data["blocks"][1].get("elements").append(
-        #     {"type": "plain_text",
-        #      "text": f"\n':o:' IaC Status:\n"})
-        # data["blocks"][1].get("elements").append(
-        #     {"type": "plain_text",
-        #      "text": f"Codified: {values.get('codified')}"})
-        # data["blocks"][1].get("elements").append(
-        #     {"type": "plain_text",
-        #      "text": f"Drift: {values.get('drift')}"})
-        # data["blocks"][1].get("elements").append(
-        #     {"type": "plain_text",
-        #      "text": f"Unmanaged: {values.get('unmanaged')}"})
-        with open(TEMPLATE_ACTIONS, 'r+') as f1:
-            data["blocks"].append(json.load(f1))
-        with open(TEMPLATE_BUTTONS, 'r+') as f2:
-            data["blocks"].append(json.load(f2))
+        }
+    )
+
+    # data["blocks"][1].get("elements").append(
+    #     {"type": "plain_text",
+    #      "text": f"\n':o:' IaC Status:\n"})
+    # data["blocks"][1].get("elements").append(
+    #     {"type": "plain_text",
+    #      "text": f"Codified: {values.get('codified')}"})
+    # data["blocks"][1].get("elements").append(
+    #     {"type": "plain_text",
+    #      "text": f"Drift: {values.get('drift')}"})
+    # data["blocks"][1].get("elements").append(
+    #     {"type": "plain_text",
+    #      "text": f"Unmanaged: {values.get('unmanaged')}"})
+    data["blocks"].append(templates.get("actions"))
+    data["blocks"].append(templates.get("buttons"))
     return data
 
 def filter_function(index, name): #Unnecessery function
@@ -720,97 +589,8 @@ def get_tier(slack_formatted_tier: str) -> str:
                   ":house: PREMIUM TRIAL :house:": PREMIUM_TRIAL}
     return dictionary.get(slack_formatted_tier)
 
-def add_user_info(user_list: {}, user: str, timestamp: str, request: json, message: json):
-    """
-    Adds crucial parameters to a user.
-    :param user_list: The dictionary of the users.
-    :param user: The Id of the user
-    :param timestamp: The timestamp of the first message that the user received from the bot
-    :param request: A json that was returned from Retool. Contains all accounts that were returned from the query
-    :param message: The message that was sent in the Slack channel
-    """
-    # adds the slack information dictionary to the general information dictionary
-    user_list[user] = {"Timestamp": timestamp, "Request": request, "Account": "", "Action": "", "Prev": "", "Message": message}
-
-def update(user_list: {}, user: str, subdir: str, val: str):
-    """
-    Updates a value in a subdirectory in user_list
-    :param user_list: The dictionary of the users.
-    :param user: The Id of the user
-    :param subdir: The subdirectory to be accessed in user_list. val will be written into it
-    :param val: the value to be written into the provided subdirectory
-    """
-    user_list.get(user, {})[subdir] = val
-
-def get_item(user_list: {}, user: str, subdir: str) -> str:
-    """
-    :param user_list: The dictionary of the users.
-    :param user: The Id of the user
-    :param subdir: The subdirectory to be accessed in user_list. val will be written into it
-    :return: The item that is inside the 'subdir' directory of the dictionary
-    """
-    return user_list.get(user, {}).get(subdir)
-
-def remove(user_list: {}, user: str):
-    """
-    Removes information from the user. Used upon configuration abortion
-    :param user_list: The dictionary of the users.
-    :param user: The Id of the user
-    """
-    user_list[user] = ""
-
-def make_admin_list(s: str) -> {}:
-    """
-    Get a string of users and makes a dictionary out of it
-    :param s: The string to be transformed into a dictionary
-    :return: A dictionary of the bot's users
-    """
-    dictionary = dict((user.strip(), value.strip())
-                      for user, value in (element.split(':')
-                                          for element in s.split(', ')))
-    return dictionary
-
 ##########################################################################################################
 # Website Visitors Functions - Count Slack Messages from rb2b-filter bot
-def get_website_visitors_from_slack(client, channel_id: str = None) -> List[Dict]:
-    """
-    Fetches website visitor data by counting messages from rb2b-filter bot in Slack.
-    Returns a list of message records with timestamps.
-    """
-    try:
-        # If no channel ID provided, use the default channel where rb2b-filter bot messages are located
-        if not channel_id:
-            channel_id = "C08N60KMEA2"  # Channel where rb2b-filter bot messages are located
-        
-        # Fetch messages from the channel using the passed client
-        response = client.conversations_history(
-            channel=channel_id,
-            limit=1000  # Get up to 1000 messages
-        )
-        
-        if not response.get('ok'):
-            logging.error(f"Failed to fetch Slack messages: {response.get('error')}")
-            return []
-        
-        messages = response.get('messages', [])
-        visitor_messages = []
-        
-        for message in messages:
-            # Check if the message is from rb2b-filter bot
-            if message.get('username') == 'rb2b-filter':
-                visitor_messages.append({
-                    'timestamp': message.get('ts'),
-                    'text': message.get('text', ''),
-                    'user': message.get('user', ''),
-                    'username': message.get('username', '')
-                })
-        
-        return visitor_messages
-        
-    except Exception as e:
-        logging.error(f"Error fetching website visitors from Slack: {e}")
-        return []
-
 def get_visitors_count_for_period(client, days: int, channel_id: str = None) -> int:
     """
     Gets the count of website visitors (rb2b-filter messages) for a specific number of days (from yesterday).
@@ -822,31 +602,18 @@ def get_visitors_count_for_period(client, days: int, channel_id: str = None) ->
         
     Returns:
         int: Count of visitors in the specified period
+
+    Raises:
+        Exception: If the visitors cannot be counted, so the dashboard shows the section as unavailable, not as 0
     """
     try:
-        messages = get_website_visitors_from_slack(client, channel_id)
-        if not messages:
-            return 0
-        
         # Calculate period from yesterday (not from today)
-        yesterday = datetime.now(timezone.utc) - timedelta(days=1)
-        cutoff_timestamp = (yesterday - timedelta(days=days)).timestamp()
-        yesterday_timestamp = yesterday.timestamp()
-        
-        count = 0
-        
-        for message in messages:
-            # Slack timestamps are in seconds since epoch
-            message_timestamp = float(message.get('timestamp', 0))
-            
-            if cutoff_timestamp <= message_timestamp <= yesterday_timestamp:
-                count += 1
-        
-        return count
+        yesterday = datetime.now(timezone.utc).date() - timedelta(days=1)
+        return visitors.get_visitor_counter(client, channel_id).count_days(yesterday - timedelta(days=days - 1), yesterday)
         
     except Exception as e:
         logging.error(f"Error counting visitors for {days} days: {e}")
-        return 0
+        raise
 
 def get_visitors_last_7_days(client, channel_id: str = None) -> int:
     """Gets visitor count for the last 7 days (from yesterday)."""
@@ -860,90 +627,31 @@ def get_visitors_last_30_days(client, channel_id: str = None) -> int:
     """Gets visitor count for the last 30 days (from yesterday)."""
     return get_visitors_count_for_period(client, 30, channel_id)
 
-def get_visitors_current_month(client, channel_id: str = None) -> int:
-    """Gets visitor count for the current month (from 1st to yesterday)."""
+def get_visitors_for_named_period(client, period: str, channel_id: str = None) -> int:
+    """
+    Gets visitor count for one of the periods of visitors.get_period_days(), answered from the visitor event store
+    (or the cached channel history until the store is backfilled).
+    Errors are logged and raised, so the dashboard shows the section as unavailable instead of as 0.
+    """
     try:
-        messages = get_website_visitors_from_slack(client, channel_id)
-        if not messages:
-            return 0
-        
-        # Calculate from 1st of current month until yesterday (not today)
-        yesterday = datetime.now(timezone.utc) - timedelta(days=1)
-        start_of_month = yesterday.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        start_timestamp = start_of_month.timestamp()
-        yesterday_timestamp = yesterday.timestamp()
-        
-        count = 0
-        for message in messages:
-            message_timestamp = float(message.get('timestamp', 0))
-            if start_timestamp <= message_timestamp <= yesterday_timestamp:
-                count += 1
-        
-        return count
-        
+        first_day, last_day = visitors.get_period_days()[period]
+        return visitors.get_visitor_counter(client, channel_id).count_days(first_day, last_day)
+
     except Exception as e:
-        logging.error(f"Error counting visitors for current month: {e}")
-        return 0
+        logging.error(f"Error counting visitors for {period.replace('_', ' ')}: {e}")
+        raise
+
+def get_visitors_current_month(client, channel_id: str = None) -> int:
+    """Gets visitor count for the current month (from 1st to yesterday)."""
+    return get_visitors_for_named_period(client, "current_month", channel_id)
 
 def get_visitors_last_month(client, channel_id: str = None) -> int:
     """Gets visitor count for the last month (full month)."""
-    try:
-        messages = get_website_visitors_from_slack(client, channel_id)
-        if not messages:
-            return 0
-        
-        now = datetime.now(timezone.utc)
-        # Go back to last month
-        if now.month == 1:
-            last_month = now.replace(year=now.year-1, month=12)
-        else:
-            last_month = now.replace(month=now.month-1)
-        
-        start_of_last_month = last_month.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        end_of_last_month = (start_of_last_month.replace(month=start_of_last_month.month+1) - timedelta(seconds=1)).timestamp()
-        start_timestamp = start_of_last_month.timestamp()
-        
-        count = 0
-        for message in messages:
-            message_timestamp = float(message.get('timestamp', 0))
-            if start_timestamp <= message_timestamp <= end_of_last_month:
-                count += 1
-        
-        return count
-        
-    except Exception as e:
-        logging.error(f"Error counting visitors for last month: {e}")
-        return 0
+    return get_visitors_for_named_period(client, "last_month", channel_id)
 
 def get_visitors_two_months_back(client, channel_id: str = None) -> int:
     """Gets visitor count for two months back (full month)."""
-    try:
-        messages = get_website_visitors_from_slack(client, channel_id)
-        if not messages:
-            return 0
-        
-        now = datetime.now(timezone.utc)
-        # Go back two months
-        if now.month <= 2:
-            two_months_back = now.replace(year=now.year-1, month=now.month+10)
-        else:
-            two_months_back = now.replace(month=now.month-2)
-        
-        start_of_two_months_back = two_months_back.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        end_of_two_months_back = (start_of_two_months_back.replace(month=start_of_two_months_back.month+1) - timedelta(seconds=1)).timestamp()
-        start_timestamp = start_of_two_months_back.timestamp()
-        
-        count = 0
-        for message in messages:
-            message_timestamp = float(message.get('timestamp', 0))
-            if start_timestamp <= message_timestamp <= end_of_two_months_back:
-                count += 1
-        
-        return count
-        
-    except Exception as e:
-        logging.error(f"Error counting visitors for two months back: {e}")
-        return 0
+    return get_visitors_for_named_period(client, "two_months_back", channel_id)
 
 def get_month_name(months_ago: int = 0) -> str:
     """Gets the month name for a given number of months ago."""
@@ -0,0 +1,344 @@
+# Website visitor counts for the dashboard, from the messages the rb2b-filter bot posts to Slack
+import logging
+import re
+import sqlite3
+import threading
+from bisect import bisect_left, bisect_right, insort
+from datetime import date, datetime, timedelta, timezone
+from time import monotonic, sleep
+from typing import Dict, List, Optional, Tuple
+
+from slack_sdk.errors import SlackApiError
+
+logger = logging.getLogger(__name__)
+
+VISITORS_CHANNEL_ID = "C08N60KMEA2"  # Channel where rb2b-filter bot messages are located
+VISITORS_BOT_USERNAME = "rb2b-filter"
+PAGE_SIZE = 200  # Slack recommends no more than 200 messages per conversations.history page
+
+# rb2b posts the visitor's details as "Company: Acme" lines, possibly in bold or as a link
+COMPANY_PATTERN = re.compile(r"company\*?\s*:\s*\*?\s*(?:<[^|>]*\|)?([^\n*|>]+)", re.IGNORECASE)
+
+
+def month_start(year: int, month: int) -> datetime:
+    """
+    :return: Midnight UTC of the first day of a month, months outside 1-12 roll over into other years
+    """
+    year, month = year + (month - 1) // 12, (month - 1) % 12 + 1
+    return datetime(year, month, 1, tzinfo=timezone.utc)
+
+
+def get_period_days(now: datetime = None) -> Dict[str, Tuple[date, date]]:
+    """
+    The periods counted on the dashboard, in whole UTC days. Rolling periods and the current month end
+    yesterday, not today: if today is 14.9, the last 7 days are 7.9-13.9.
+    :param now: The current time, defaults to now (UTC)
+    :return: A dictionary of period name -> (first day, last day), both inclusive
+    """
+    now = now or datetime.now(timezone.utc)
+    yesterday = now.date() - timedelta(days=1)
+    last_month = month_start(now.year, now.month - 1).date()
+    two_months_back = month_start(now.year, now.month - 2).date()
+    periods = {f"last_{days}_days": (yesterday - timedelta(days=days - 1), yesterday) for days in (7, 14, 30)}
+    periods["current_month"] = (yesterday.replace(day=1), yesterday)
+    periods["last_month"] = (last_month, month_start(now.year, now.month).date() - timedelta(days=1))
+    periods["two_months_back"] = (two_months_back, last_month - timedelta(days=1))
+    return periods
+
+
+def get_period_ranges(now: datetime = None) -> Dict[str, Tuple[float, float]]:
+    """
+    :return: The periods of get_period_days() as (start, end) UNIX timestamps, both inclusive
+    """
+    return {name: day_range_to_timestamps(first_day, last_day)
+            for name, (first_day, last_day) in get_period_days(now).items()}
+
+
+def day_range_to_timestamps(first_day: date, last_day: date) -> Tuple[float, float]:
+    """
+    :return: Midnight UTC of first_day, and the last microsecond of last_day, as UNIX timestamps
+    """
+    start = datetime(first_day.year, first_day.month, first_day.day, tzinfo=timezone.utc)
+    end = datetime(last_day.year, last_day.month, last_day.day, tzinfo=timezone.utc) + timedelta(days=1)
+    return start.timestamp(), end.timestamp() - 1e-6
+
+
+def is_visitor_message(message: Dict) -> bool:
+    """
+    :return: True if the message was posted by the rb2b-filter bot
+    """
+    return message.get("username") == VISITORS_BOT_USERNAME
+
+
+def iter_channel_history(client, channel_id: str, oldest: str):
+    """
+    Pages through conversations.history with its cursor, waiting out rate limits
+    :param oldest: Only messages after this Slack timestamp (exclusive) are returned
+    :return: A generator of messages
+    """
+    cursor = None
+    while True:
+        try:
+            response = client.conversations_history(channel=channel_id, oldest=oldest, limit=PAGE_SIZE, cursor=cursor)
+        except SlackApiError as e:
+            if e.response.get("error") != "ratelimited":
+                raise
+            retry_after = float(e.response.headers.get("Retry-After", 1))
+            logger.warning(f"⏱️ conversations_history rate limited, retrying in {retry_after}s")
+            sleep(retry_after)
+            continue
+        yield from response.get("messages", [])
+        cursor = (response.get("response_metadata") or {}).get("next_cursor")
+        if not cursor:
+            return
+
+
+class VisitorAnalytics:
+    """
+    Counts rb2b-filter messages per period from a single, cached copy of the channel history.
+
+    The history is paged through with the conversations.history cursor, starting at the earliest period
+    the dashboard needs, so the count is not capped by a page size. Only message timestamps are kept,
+    in a sorted list: a period count is two binary searches. Once the cache is older than ttl, only messages
+    newer than the latest cached one are fetched. Concurrent callers share one fetch.
+    """
+
+    def __init__(self, client, channel_id: str = VISITORS_CHANNEL_ID, ttl: float = 300):
+        """
+        :param client: A Slack WebClient
+        :param channel_id: The channel the rb2b-filter bot posts to
+        :param ttl: Seconds a fetched history is used before new messages are fetched
+        """
+        self.client = client
+        self.channel_id = channel_id
+        self.ttl = ttl
+        self._timestamps: List[float] = []
+        self._oldest = None  # start of the fetched history
+        self._latest_ts = None  # raw "ts" of the newest fetched message, used as the next "oldest"
+        self._fetched_at = None
+        self._lock = threading.Lock()
+
+    def _fetch(self, oldest: str) -> Tuple[List[float], str]:
+        """
+        Pages through the channel history after oldest
+        :return: The timestamps of the rb2b-filter messages, and the raw ts of the newest message seen
+        """
+        timestamps = []
+        latest_ts = None
+        for message in iter_channel_history(self.client, self.channel_id, oldest):
+            if latest_ts is None or float(message["ts"]) > float(latest_ts):
+                latest_ts = message["ts"]
+            if is_visitor_message(message):
+                timestamps.append(float(message["ts"]))
+        return timestamps, latest_ts
+
+    def _refresh(self, oldest: float):
+        """
+        Makes sure the cache covers everything from oldest on and is not older than ttl
+        """
+        with self._lock:
+            fresh = self._fetched_at is not None and monotonic() - self._fetched_at < self.ttl
+            if self._oldest is not None and self._oldest <= oldest and fresh:
+                return
+            started = monotonic()
+            if self._oldest is not None and self._oldest <= oldest and self._latest_ts is not None:
+                # only messages posted since the last fetch ("oldest" is exclusive)
+                timestamps, latest_ts = self._fetch(self._latest_ts)
+                for ts in timestamps:
+                    insort(self._timestamps, ts)
+                self._latest_ts = latest_ts or self._latest_ts
+            else:
+                timestamps, latest_ts = self._fetch(f"{oldest:.6f}")
+                self._timestamps = sorted(timestamps)
+                self._oldest = oldest
+                self._latest_ts = latest_ts
+            self._fetched_at = monotonic()
+            logger.info(f"📥 Fetched {len(timestamps)} website visitor messages in {monotonic() - started:.2f}s "
+                        f"({len(self._timestamps)} cached)")
+
+    def count_between(self, start: float, end: float) -> int:
+        """
+        :param start: UNIX timestamp, inclusive
+        :param end: UNIX timestamp, inclusive
+        :return: The number of visitor messages posted in the period
+        """
+        self._refresh(min(start, min(s for s, _ in get_period_ranges().values())))
+        timestamps = self._timestamps
+        return bisect_right(timestamps, end) - bisect_left(timestamps, start)
+
+    def count_days(self, first_day: date, last_day: date) -> int:
+        """
+        :return: The number of visitor messages posted from first_day to last_day (UTC, inclusive)
+        """
+        return self.count_between(*day_range_to_timestamps(first_day, last_day))
+
+    def counts(self, now: datetime = None) -> Dict[str, int]:
+        """
+        :return: The visitor count of every period of get_period_ranges()
+        """
+        ranges = get_period_ranges(now)
+        self._refresh(min(start for start, _ in ranges.values()))
+        return {name: self.count_between(start, end) for name, (start, end) in ranges.items()}
+
+
+def parse_company(text: str) -> Optional[str]:
+    """
+    :param text: The text of an rb2b-filter message
+    :return: The company of the visitor (a "Company: ..." line), None if the message has none
+    """
+    match = COMPANY_PATTERN.search(text or "")
+    return match.group(1).strip() if match else None
+
+
+class VisitorEventStore:
+    """
+    A local time series of rb2b-filter messages, so the dashboard never reads the Slack history.
+
+    Every message of the channel that main.handle_message_events receives is appended with add_message(),
+    and backfill() fetches whatever was posted while the bot was down, once at startup. Besides the events
+    (timestamp, day, company), a per-day rollup table is updated in the same transaction, so counting a
+    period reads one row per day. Messages are keyed by their Slack ts, so a message seen both live and by
+    the backfill is only counted once.
+    """
+
+    def __init__(self, path: str, channel_id: str = VISITORS_CHANNEL_ID):
+        """
+        :param path: The SQLite file
+        :param channel_id: The channel the rb2b-filter bot posts to
+        """
+        self.path = path
+        self.channel_id = channel_id
+        self.ready = threading.Event()  # set once the backfill finished
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS events (ts TEXT PRIMARY KEY, day TEXT NOT NULL, company TEXT)")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS daily (day TEXT PRIMARY KEY, visitors INTEGER NOT NULL)")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    def _insert(self, messages) -> int:
+        """
+        Stores the visitor messages among messages, skipping the ones already stored
+        :return: The number of new events
+        """
+        added = 0
+        with self._lock, self._connection:
+            for message in messages:
+                if not is_visitor_message(message):
+                    continue
+                day = datetime.fromtimestamp(float(message["ts"]), timezone.utc).date().isoformat()
+                inserted = self._connection.execute(
+                    "INSERT OR IGNORE INTO events VALUES (?, ?, ?)",
+                    (message["ts"], day, parse_company(message.get("text")))).rowcount
+                if inserted:
+                    self._connection.execute(
+                        "INSERT INTO daily VALUES (?, 1) ON CONFLICT(day) DO UPDATE SET visitors = visitors + 1", (day,))
+                    added += 1
+        return added
+
+    def add_message(self, message: Dict) -> bool:
+        """
+        :param message: A message event of the visitors channel
+        :return: True if it was a new visitor message
+        """
+        if not message.get("ts"):
+            return False
+        return self._insert([message]) > 0
+
+    def backfill(self, client, oldest_day: date, batch_size: int = 500):
+        """
+        Fetches the messages posted since the last successful backfill, or since oldest_day if the store
+        does not cover that far back yet. Sets ready when done.
+
+        The history comes newest first, so a failed backfill leaves the older part of its range unfetched.
+        It is resumed from synced_until, the newest message of the last backfill that finished, and not from
+        the newest stored event, which may be a live message or part of a failed backfill.
+        """
+        started = monotonic()
+        with self._lock:
+            covered_from = self._connection.execute("SELECT value FROM meta WHERE key = 'covered_from'").fetchone()
+            synced_until = self._connection.execute("SELECT value FROM meta WHERE key = 'synced_until'").fetchone()
+        if covered_from and covered_from[0] <= oldest_day.isoformat() and synced_until:
+            oldest = synced_until[0]
+        else:
+            oldest = f"{day_range_to_timestamps(oldest_day, oldest_day)[0]:.6f}"
+
+        added = 0
+        batch = []
+        newest = oldest
+        try:
+            for message in iter_channel_history(client, self.channel_id, oldest):
+                if message.get("ts") and float(message["ts"]) > float(newest):
+                    newest = message["ts"]
+                batch.append(message)
+                if len(batch) >= batch_size:
+                    added += self._insert(batch)
+                    batch = []
+            added += self._insert(batch)
+        except Exception as e:
+            # counts keep coming from the Slack history until a backfill succeeds
+            logger.error(f"🚨 Website visitor backfill failed after {added} events: {str(e)}", exc_info=True)
+            return
+
+        with self._lock, self._connection:
+            self._connection.execute("INSERT OR REPLACE INTO meta VALUES ('synced_until', ?)", (newest,))
+            if not covered_from or covered_from[0] > oldest_day.isoformat():
+                self._connection.execute("INSERT OR REPLACE INTO meta VALUES ('covered_from', ?)",
+                                         (oldest_day.isoformat(),))
+        self.ready.set()
+        logger.info(f"✅ Website visitor store backfilled with {added} events in {monotonic() - started:.2f}s")
+
+    def count_days(self, first_day: date, last_day: date) -> int:
+        """
+        :return: The number of visitors from first_day to last_day (UTC, inclusive), summed from the daily rollups
+        """
+        with self._lock:
+            return self._connection.execute("SELECT COALESCE(SUM(visitors), 0) FROM daily WHERE day BETWEEN ? AND ?",
+                                            (first_day.isoformat(), last_day.isoformat())).fetchone()[0]
+
+    def companies(self, first_day: date, last_day: date) -> Dict[str, int]:
+        """
+        :return: Company -> number of visits from first_day to last_day (UTC, inclusive)
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT company, COUNT(*) FROM events WHERE day BETWEEN ? AND ? AND company IS NOT NULL "
+                "GROUP BY company ORDER BY COUNT(*) DESC", (first_day.isoformat(), last_day.isoformat())).fetchall()
+        return dict(rows)
+
+
+_analytics = {}
+_analytics_lock = threading.Lock()
+_event_store = None
+
+
+def set_event_store(store: VisitorEventStore):
+    """
+    Makes get_visitor_counter() answer from store once its backfill finished
+    """
+    global _event_store
+    _event_store = store
+
+
+def get_visitor_analytics(client, channel_id: str = None) -> VisitorAnalytics:
+    """
+    :return: The shared VisitorAnalytics of a channel, created on first use
+    """
+    channel_id = channel_id or VISITORS_CHANNEL_ID
+    with _analytics_lock:
+        if channel_id not in _analytics:
+            _analytics[channel_id] = VisitorAnalytics(client, channel_id)
+        return _analytics[channel_id]
+
+
+def get_visitor_counter(client, channel_id: str = None):
+    """
+    :return: The event store of the channel if it is backfilled, otherwise the Slack history based counter.
+             Both have count_days(first_day, last_day).
+    """
+    channel_id = channel_id or VISITORS_CHANNEL_ID
+    store = _event_store
+    if store is not None and store.channel_id == channel_id and store.ready.is_set():
+        return store
+    return get_visitor_analytics(client, channel_id)
@@ -0,0 +1,241 @@
+"""
+Offline benchmark of the FireflyBot retrieval pipeline.
+
+Builds synthetic FAISS indices of the requested sizes in the same on-disk layout main.py loads,
+then measures index load time and RSS, retrieval latency, end-to-end answer latency (embedding,
+retrieval, generation, truncation and Slack streaming, with no network) and recall@k against
+a brute-force search. --index-type selects one of the approximate index types of faiss_store.py.
+Fake embeddings and a stub LLM are used, so no Azure/Slack access is needed.
+
+usage:
+    python benchmarks/bench_retrieval.py --sizes 10000 100000 --output results.json
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import tempfile
+from time import perf_counter
+from typing import Dict, List
+
+import faiss
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Src"))
+
+import faiss_store  # noqa: E402
+import qa_engine  # noqa: E402
+import slack_stream  # noqa: E402
+import text_budget  # noqa: E402
+
+QUESTIONS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "questions.json")
+SOURCES = ["firefly", "confluence", "slack"]
+
+
+class HashEmbeddings(Embeddings):
+    """
+    Deterministic fake embeddings: the same text always maps to the same random vector
+    """
+
+    def __init__(self, dim: int):
+        self.dim = dim
+
+    def embed_query(self, text: str) -> List[float]:
+        seed = int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:8], 16)
+        return np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self.embed_query(text) for text in texts]
+
+
+class StubSlackClient:
+    """
+    Accepts chat_postMessage/chat_update calls without any network access
+    """
+
+    def chat_postMessage(self, **kwargs):
+        return {"ok": True, "ts": "0"}
+
+    def chat_update(self, **kwargs):
+        return {"ok": True}
+
+
+def synthetic_vectors(n: int, dim: int, seed: int, batch_size: int = 100000, clusters: int = 256):
+    """
+    Yields n random vectors in batches, so 1M+ vector indices never need a second full copy in memory.
+    Vectors are grouped around random topics like real embeddings are, uniform noise would make every
+    approximate index look far worse than it is on the knowledge base.
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    for start in range(0, n, batch_size):
+        size = min(batch_size, n - start)
+        noise = rng.standard_normal((size, dim)).astype(np.float32) * 0.5
+        yield centers[rng.integers(clusters, size=size)] + noise
+
+
+def build_synthetic_index(data_dir: str, source: str, n: int, dim: int, seed: int) -> str:
+    """
+    Writes a flat index and its document store the way main.load_faiss_index() expects them
+    :return: The index directory
+    """
+    index_dir = os.path.join(data_dir, f"faiss_index_{source}")
+    os.makedirs(index_dir, exist_ok=True)
+    index = faiss.IndexFlatL2(dim)
+    for batch in synthetic_vectors(n, dim, seed):
+        index.add(batch)
+    faiss.write_index(index, os.path.join(index_dir, faiss_store.INDEX_FILE_NAME))
+    faiss_store.write_metadata_store(
+        os.path.join(data_dir, f"faiss_metadata_{source}.sqlite"),
+        ((i, f"{source}-{i}", f"Synthetic {source} document {i}", {"row_id": i}) for i in range(n)))
+    return index_dir
+
+
+def brute_force_ids(data_dir: str, source: str, n: int, dim: int, seed: int, queries: np.ndarray, k: int) -> np.ndarray:
+    """
+    Exact k nearest neighbours of every query, computed batch by batch with numpy
+    :return: An array of shape (queries, k) with the row ids of the true neighbours
+    """
+    best_distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+    best_ids = np.full((len(queries), k), -1, dtype=np.int64)
+    offset = 0
+    for batch in synthetic_vectors(n, dim, seed):
+        distances = ((queries ** 2).sum(1)[:, None] - 2 * queries @ batch.T + (batch ** 2).sum(1)[None, :])
+        ids = np.broadcast_to(np.arange(offset, offset + len(batch)), distances.shape)
+        all_distances = np.concatenate([best_distances, distances], axis=1)
+        all_ids = np.concatenate([best_ids, ids], axis=1)
+        order = np.argsort(all_distances, axis=1)[:, :k]
+        best_distances = np.take_along_axis(all_distances, order, axis=1)
+        best_ids = np.take_along_axis(all_ids, order, axis=1)
+        offset += len(batch)
+    return best_ids
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """
+    :return: p50/p95/p99/max of the samples, in milliseconds
+    """
+    values = np.asarray(samples) * 1000
+    return {"p50_ms": float(np.percentile(values, 50)),
+            "p95_ms": float(np.percentile(values, 95)),
+            "p99_ms": float(np.percentile(values, 99)),
+            "max_ms": float(values.max())}
+
+
+def run_size(n: int, args, questions: List[str]) -> Dict:
+    """
+    Benchmarks one index size
+    """
+    embeddings = HashEmbeddings(args.dim)
+    with tempfile.TemporaryDirectory(dir=args.work_dir) as data_dir:
+        started = perf_counter()
+        for i, source in enumerate(SOURCES):
+            build_synthetic_index(data_dir, source, n, args.dim, seed=i)
+            if args.index_type != "flat":
+                index_dir = os.path.join(data_dir, f"faiss_index_{source}")
+                flat_index = faiss.read_index(os.path.join(index_dir, faiss_store.INDEX_FILE_NAME))
+                faiss.write_index(faiss_store.build_ann_index(flat_index, args.index_type),
+                                  os.path.join(index_dir, faiss_store.index_file_name(args.index_type)))
+        build_seconds = perf_counter() - started
+
+        indices = {source: faiss_store.LazyFaissIndex(source, os.path.join(data_dir, f"faiss_index_{source}"),
+                                                      os.path.join(data_dir, f"faiss_metadata_{source}.sqlite"),
+                                                      index_type=args.index_type, nprobe=args.nprobe,
+                                                      ef_search=args.ef_search)
+                   for source in SOURCES}
+        rss_before = faiss_store.get_rss_bytes()
+        started = perf_counter()
+        for index in indices.values():
+            index.load()
+        load_seconds = perf_counter() - started
+        rss_after = faiss_store.get_rss_bytes()
+
+        llm = FakeListChatModel(responses=[args.answer], sleep=args.llm_token_delay or None)
+        engine = qa_engine.QueryEngine(embeddings, indices, llm, max_retrieved_docs=args.k)
+        truncator = text_budget.AnswerTruncator(max_chars=text_budget.SLACK_MAX_MESSAGE_CHARS - 200)
+
+        vectors = [embeddings.embed_query(question) for question in questions]
+        retrieval_samples = []
+        recall_hits = 0
+        recall_total = 0
+        per_source_ids = {source: [] for source in SOURCES}
+        for _ in range(args.repeat):
+            for vector in vectors:
+                started = perf_counter()
+                engine.retrieve(vector)
+                retrieval_samples.append(perf_counter() - started)
+        for source in SOURCES:
+            for vector in vectors:
+                hits = indices[source].similarity_search_with_score_by_vector(vector, k=args.k)
+                per_source_ids[source].append([doc.metadata["row_id"] for doc, _ in hits])
+
+        query_matrix = np.asarray(vectors, dtype=np.float32)
+        for i, source in enumerate(SOURCES):
+            truth = brute_force_ids(data_dir, source, n, args.dim, i, query_matrix, args.k)
+            for found, expected in zip(per_source_ids[source], truth):
+                recall_hits += len(set(found) & set(expected.tolist()))
+                recall_total += args.k
+
+        end_to_end_samples = []
+        for question in questions:
+            started = perf_counter()
+            stream = slack_stream.SlackAnswerStream(StubSlackClient(), "C0", min_interval=0,
+                                                    truncate=truncator.truncate)
+            stream.start()
+            result = engine.query(question, on_token=stream.push)
+            answer = truncator.truncate(result["answer"]) if result["answer"] else ""
+            stream.finish(f"{slack_stream.ANSWER_HEADER}{answer}\n", result["sources"])
+            end_to_end_samples.append(perf_counter() - started)
+
+        return {"vectors_per_index": n,
+                "dim": args.dim,
+                "index_type": args.index_type,
+                "build_seconds": build_seconds,
+                "load_seconds": load_seconds,
+                "rss_delta_bytes": max(rss_after - rss_before, 0),
+                "rss_bytes": rss_after,
+                "index_stats": {source: index.stats() for source, index in indices.items()},
+                "retrieval": percentiles(retrieval_samples),
+                "end_to_end": percentiles(end_to_end_samples),
+                f"recall_at_{args.k}": recall_hits / recall_total if recall_total else None}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of the FireflyBot retrieval pipeline")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000],
+                        help="vectors per index, e.g. 10000 100000 1000000")
+    parser.add_argument("--dim", type=int, default=256, help="vector dimension (ada-002 uses 1536)")
+    parser.add_argument("--index-type", default="flat", choices=faiss_store.INDEX_TYPES,
+                        help="index served by the bot, approximate types are built from the flat one")
+    parser.add_argument("--nprobe", type=int, default=faiss_store.DEFAULT_NPROBE, help="IVF lists scanned per query")
+    parser.add_argument("--ef-search", type=int, default=faiss_store.DEFAULT_EF_SEARCH, help="HNSW efSearch")
+    parser.add_argument("--k", type=int, default=qa_engine.MAX_RETRIEVED_DOCS, help="documents retrieved per query")
+    parser.add_argument("--repeat", type=int, default=5, help="passes over the question set for retrieval latency")
+    parser.add_argument("--questions", default=QUESTIONS_PATH, help="JSON list of questions")
+    parser.add_argument("--answer", default="Synthetic answer from the stub LLM.", help="text the stub LLM returns")
+    parser.add_argument("--llm-token-delay", type=float, default=0, help="seconds the stub LLM waits per token")
+    parser.add_argument("--work-dir", default=None, help="where the synthetic indices are written")
+    parser.add_argument("--output", default="bench_results.json", help="where the JSON results are written")
+    args = parser.parse_args()
+
+    with open(args.questions) as f:
+        questions = json.load(f)
+
+    results = {"questions": len(questions), "runs": []}
+    for n in args.sizes:
+        print(f"📊 Benchmarking {n} vectors per {args.index_type} index...")
+        run = run_size(n, args, questions)
+        results["runs"].append(run)
+        print(f"✅ load {run['load_seconds']:.2f}s, retrieval p95 {run['retrieval']['p95_ms']:.2f}ms, "
+              f"end-to-end p95 {run['end_to_end']['p95_ms']:.2f}ms, recall@{args.k} {run[f'recall_at_{args.k}']:.3f}")
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"🎉 Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
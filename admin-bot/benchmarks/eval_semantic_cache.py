@@ -0,0 +1,100 @@
+"""
+Evaluation of the semantic tier threshold of the FireflyBot answer cache.
+
+Every pair of cache_pairs.json is run through answer_cache.AnswerCache itself: the first question is put,
+the second one is looked up. For each threshold the script reports how many paraphrases hit (answers saved)
+and how many near misses hit (a wrong answer served for a question about a different entity). The
+recommended threshold is the lowest one without any near-miss hit.
+
+Embeddings come from the Azure OpenAI deployment main.py uses (AZURE_API_KEY / AZURE_OPENAI_ENDPOINT).
+--embeddings keeps them in a JSON file, so later runs and other thresholds need no Azure access.
+
+usage:
+    python benchmarks/eval_semantic_cache.py --embeddings ada002_embeddings.json --output cache_eval.json
+"""
+import argparse
+import json
+import os
+import sys
+from typing import Dict, List
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Src"))
+
+import answer_cache  # noqa: E402
+
+PAIRS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache_pairs.json")
+THRESHOLDS = [round(t, 3) for t in np.arange(0.90, 0.996, 0.005)]
+
+
+def load_embeddings(texts: List[str], path: str = None) -> Dict[str, List[float]]:
+    """
+    :param path: Optional JSON file of text -> vector, missing texts are embedded and added to it
+    :return: text -> vector for every text
+    """
+    vectors = {}
+    if path and os.path.exists(path):
+        with open(path) as f:
+            vectors = json.load(f)
+    missing = [text for text in dict.fromkeys(texts) if text not in vectors]
+    if missing:
+        from langchain_openai import AzureOpenAIEmbeddings
+
+        model = AzureOpenAIEmbeddings(api_key=os.getenv("AZURE_API_KEY"),
+                                      azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+                                      deployment="text-embedding-ada-002", openai_api_version="2024-02-01")
+        vectors.update(zip(missing, model.embed_documents(missing)))
+        if path:
+            with open(path, "w") as f:
+                json.dump(vectors, f)
+    return vectors
+
+
+def hit_rate(pairs: List[List[str]], vectors: Dict[str, List[float]], threshold: float) -> float:
+    """
+    :return: The share of pairs whose second question is answered from the cached first one
+    """
+    hits = 0
+    for cached, asked in pairs:
+        cache = answer_cache.AnswerCache(similarity_threshold=threshold)
+        cache.put(cached, vectors[cached], {"answer": cached})
+        hits += cache.get_semantic(vectors[asked]) is not None
+    return hits / len(pairs) if pairs else 0.0
+
+
+def evaluate(pairs: Dict[str, List[List[str]]], vectors: Dict[str, List[float]],
+             thresholds: List[float] = THRESHOLDS) -> Dict:
+    """
+    :return: {"thresholds": [{"threshold", "paraphrase_hits", "near_miss_hits"}, ...], "recommended": threshold}
+    """
+    rows = [{"threshold": threshold,
+             "paraphrase_hits": hit_rate(pairs["paraphrases"], vectors, threshold),
+             "near_miss_hits": hit_rate(pairs["near_misses"], vectors, threshold)} for threshold in thresholds]
+    safe = [row["threshold"] for row in rows if row["near_miss_hits"] == 0]
+    return {"thresholds": rows, "recommended": min(safe) if safe else None}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluates the semantic answer cache threshold")
+    parser.add_argument("--pairs", default=PAIRS_PATH, help="JSON with paraphrases and near_misses question pairs")
+    parser.add_argument("--embeddings", default=None, help="JSON file the embeddings are read from and kept in")
+    parser.add_argument("--output", default="cache_eval.json", help="where the JSON results are written")
+    args = parser.parse_args()
+
+    with open(args.pairs) as f:
+        pairs = json.load(f)
+    texts = [text for kind in ("paraphrases", "near_misses") for pair in pairs[kind] for text in pair]
+    results = evaluate(pairs, load_embeddings(texts, args.embeddings))
+
+    for row in results["thresholds"]:
+        print(f"📊 {row['threshold']:.3f}: paraphrases {row['paraphrase_hits']:.0%} hit, "
+              f"near misses {row['near_miss_hits']:.0%} hit")
+    print(f"✅ Lowest threshold without a near-miss hit: {results['recommended']}")
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"🎉 Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Tests of answer_cache.AnswerCache and of the threshold evaluation in benchmarks/eval_semantic_cache.py.
+
+usage:
+    python -m pytest admin-bot/tests
+"""
+import json
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Src"))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks"))
+
+import answer_cache  # noqa: E402
+import eval_semantic_cache  # noqa: E402
+
+DIM = 64
+
+
+def unit(axis):
+    vector = np.zeros(DIM, dtype=np.float32)
+    vector[axis] = 1.0
+    return vector
+
+
+def at_similarity(vector, similarity, axis):
+    """
+    :return: A unit vector whose cosine similarity with the unit vector `vector` is `similarity`
+    """
+    return similarity * vector + np.sqrt(1 - similarity ** 2) * unit(axis)
+
+
+def test_semantic_tier_is_off_by_default():
+    cache = answer_cache.AnswerCache()
+    cache.put("how do i connect aws", unit(0), {"answer": "aws"})
+    assert cache.get_semantic(unit(0)) is None
+    assert cache.get_exact("How do I connect AWS?") == {"answer": "aws"}
+    assert answer_cache.AnswerCache(similarity_threshold=0).similarity_threshold is None
+
+
+def test_threshold_separates_paraphrases_from_near_misses():
+    cache = answer_cache.AnswerCache(similarity_threshold=0.98)
+    cache.put("how do i connect aws", unit(0), {"answer": "aws"})
+    assert cache.get_semantic(at_similarity(unit(0), 0.99, 1)) == {"answer": "aws"}
+    # an entity swap of ada-002 scores about here, it must not be answered with the cached answer
+    assert cache.get_semantic(at_similarity(unit(0), 0.96, 1)) is None
+    assert cache.stats()["semantic_hits"] == 1
+
+
+def test_evaluation_recommends_the_lowest_threshold_without_near_miss_hits():
+    with open(eval_semantic_cache.PAIRS_PATH) as f:
+        pairs = json.load(f)
+    assert pairs["paraphrases"] and pairs["near_misses"]
+
+    # questions appear in several pairs, every pair gets its own made up embeddings
+    pairs = {kind: [[f"{kind} {i} {cached}", f"{kind} {i} {asked}"] for i, (cached, asked) in enumerate(pairs[kind])]
+             for kind in ("paraphrases", "near_misses")}
+    vectors = {}
+    for kind, similarity in (("paraphrases", 0.99), ("near_misses", 0.962)):
+        for cached, asked in pairs[kind]:
+            vectors[cached] = unit(0)
+            vectors[asked] = at_similarity(unit(0), similarity, 1)
+    results = eval_semantic_cache.evaluate(pairs, vectors, thresholds=[0.95, 0.96, 0.965, 0.98, 0.995])
+
+    assert results["recommended"] == 0.965
+    rows = {row["threshold"]: row for row in results["thresholds"]}
+    assert rows[0.95]["near_miss_hits"] == 1.0
+    assert rows[0.98]["paraphrase_hits"] == 1.0 and rows[0.98]["near_miss_hits"] == 0
+    assert rows[0.995]["paraphrase_hits"] == 0
@@ -0,0 +1,182 @@
+"""
+Tests of session_store.RedisBackend against an in-memory fake of the Redis client calls it makes,
+and of session_store.MemoryBackend with a fake clock.
+
+usage:
+    python -m pytest admin-bot/tests
+"""
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Src"))
+
+import session_store  # noqa: E402
+
+
+class FakeRedis:
+    """
+    get/set(ex, nx, xx)/delete/lock like redis.Redis, with a clock the tests move forward
+    """
+
+    def __init__(self):
+        self.now = 0.0
+        self.data = {}  # key -> (value, expires at)
+        self.locks = {}
+
+    def get(self, key):
+        entry = self.data.get(key)
+        if entry is None or entry[1] <= self.now:
+            return None
+        return entry[0]
+
+    def set(self, key, value, ex=None, nx=False, xx=False):
+        exists = self.get(key) is not None
+        if (nx and exists) or (xx and not exists):
+            return None
+        self.data[key] = (value.encode(), self.now + ex if ex else float("inf"))
+        return True
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+    def lock(self, name, timeout=None):
+        return self.locks.setdefault(name, threading.Lock())
+
+
+def make_store(ttl=60):
+    client = FakeRedis()
+    return client, session_store.SessionStore(session_store.RedisBackend(client), ttl=ttl)
+
+
+def test_start_refuses_a_second_session():
+    _, sessions = make_store()
+    assert sessions.start("U1", "1.0", "C1").ts == "1.0"
+    assert sessions.start("U1", "2.0", "C1") is None
+    assert sessions.get("U1").ts == "1.0"
+    assert sessions.start("U2", "3.0", "C1") is not None
+
+
+def test_update_changes_fields_of_running_sessions_only():
+    client, sessions = make_store()
+    assert sessions.update("U1", account="acme") is None
+    assert client.get("admin-bot:session:U1") is None  # xx, an update never creates a session
+
+    sessions.start("U1", None, "C1")
+    session = sessions.update("U1", ts="1.0", account="acme")
+    assert (session.ts, session.account, session.channel_id) == ("1.0", "acme", "C1")
+    assert sessions.get("U1").account == "acme"
+
+
+def test_update_rejects_unknown_fields():
+    _, sessions = make_store()
+    sessions.start("U1", "1.0")
+    try:
+        sessions.update("U1", accounts="acme")
+    except AttributeError:
+        pass
+    else:
+        raise AssertionError("unknown field accepted")
+
+
+def test_sessions_expire_after_ttl_since_last_change():
+    client, sessions = make_store(ttl=60)
+    sessions.start("U1", "1.0")
+    client.now = 50
+    sessions.update("U1", account="acme")  # restarts the ttl
+    client.now = 100
+    assert sessions.is_active("U1")
+    client.now = 111
+    assert not sessions.is_active("U1")
+    assert sessions.update("U1", account="other") is None
+    assert sessions.start("U1", "2.0") is not None
+
+
+def test_end_removes_the_session():
+    _, sessions = make_store()
+    sessions.start("U1", "1.0")
+    assert sessions.end("U1").ts == "1.0"
+    assert sessions.get("U1") is None
+    assert sessions.end("U1") is None
+
+
+def test_lock_is_per_user_and_separate_from_the_write_lock():
+    _, sessions = make_store()
+    sessions.start("U1", "1.0")
+    with sessions.lock("U1"):
+        assert not sessions.lock("U1").acquire(blocking=False)
+        assert sessions.lock("U2").acquire(blocking=False)
+        # a handler holding the user lock can still update the session
+        assert sessions.update("U1", prev_ts="2.0").prev_ts == "2.0"
+    assert sessions.lock("U1").acquire(blocking=False)
+
+
+class Clock:
+    """
+    Replaces session_store.monotonic(), moved forward by the tests
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_memory_store(monkeypatch, ttl=60, max_sessions=1000):
+    clock = Clock()
+    monkeypatch.setattr(session_store, "monotonic", clock)
+    return clock, session_store.SessionStore(session_store.MemoryBackend(max_sessions), ttl=ttl)
+
+
+def test_memory_sessions_expire_after_ttl_since_last_change(monkeypatch):
+    clock, sessions = make_memory_store(monkeypatch, ttl=60)
+    sessions.start("U1", "1.0")
+    clock.now += 50
+    sessions.update("U1", account="acme")  # restarts the ttl
+    clock.now += 50
+    assert sessions.get("U1").account == "acme"
+    clock.now += 11
+    assert sessions.get("U1") is None
+    assert sessions.update("U1", account="other") is None
+    assert sessions.start("U1", "2.0") is not None
+
+
+def test_memory_backend_evicts_the_least_recently_changed_beyond_max_sessions(monkeypatch):
+    _, sessions = make_memory_store(monkeypatch, max_sessions=2)
+    sessions.start("U1", "1.0")
+    sessions.start("U2", "2.0")
+    sessions.update("U1", account="acme")  # U2 is now the least recently changed
+    sessions.start("U3", "3.0")
+    assert sessions.get("U2") is None
+    assert sessions.get("U1").account == "acme"
+    assert sessions.get("U3") is not None
+
+
+def test_memory_backend_purges_expired_sessions_from_the_front(monkeypatch):
+    clock, sessions = make_memory_store(monkeypatch, ttl=60)
+    backend = sessions.backend
+    sessions.start("U1", "1.0")
+    clock.now += 30
+    sessions.start("U2", "2.0")
+    clock.now += 40  # U1 expired, U2 has 20s left
+    sessions.start("U3", "3.0")
+    assert list(backend._sessions) == ["U2", "U3"]
+    clock.now += 30  # U2 expired too, U3 has 10s left
+    assert sessions.get("U3") is not None
+    assert list(backend._sessions) == ["U3"]
+
+
+def test_memory_backend_user_lock_lives_while_held():
+    backend = session_store.MemoryBackend()
+    lock = backend.lock("U1")
+    with lock:
+        # another handler of the same user gets the very same lock and has to wait
+        assert backend.lock("U1") is lock
+        assert not backend.lock("U1").acquire(blocking=False)
+        assert backend.lock("U2") is not lock
+    assert backend.lock("U1").acquire(blocking=False)
+    lock.release()
+
+    del lock
+    assert "U1" not in backend._user_locks  # dropped once nobody holds a reference
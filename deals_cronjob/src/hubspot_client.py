@@ -0,0 +1,298 @@
+# HubSpot CRM deals search, used by main.py.
+# COPY of the canonical admin-bot/Src/hubspot_client.py without its DealMirror, which only the bot uses
+# (the cronjob image is built from deals_cronjob only). Do not edit it here: change the admin-bot file and copy it over.
+import logging
+import threading
+from datetime import datetime
+from time import monotonic
+from typing import Dict, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+DEALS_API_URL = "https://api.hubapi.com/crm/v3/objects/deals"
+OWNERS_API_URL = "https://api.hubapi.com/crm/v3/owners"
+DEAL_PROPERTIES = ["dealtype", "dealname", "amount", "createdate", "hubspot_owner_id", "deal_source_1",
+                   "deal_source_2"]
+MAX_PAGE_SIZE = 100  # the largest page the search endpoint returns
+MAX_SEARCH_RESULTS = 10000  # HubSpot never pages past the first 10,000 results of a search
+
+
+def create_session(retries: int = 3, pool_size: int = 4) -> requests.Session:
+    """
+    :return: A pooled HTTP session that retries rate limited (429) and unavailable (502/503/504) responses,
+             waiting for the Retry-After HubSpot sends with them
+    """
+    retry = Retry(total=retries, status_forcelist=[429, 502, 503, 504], backoff_factor=1,
+                  respect_retry_after_header=True, allowed_methods=None)  # a search is a read-only POST
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_size, pool_maxsize=pool_size)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    return session
+
+
+def epoch_millis(value: datetime) -> str:
+    """
+    :return: A datetime as the milliseconds since the epoch HubSpot compares date properties with
+    """
+    return str(int(value.timestamp() * 1000))
+
+
+def parse_hubspot_datetime(value: str) -> datetime:
+    """
+    :return: A HubSpot timestamp such as 2024-09-13T09:30:00.123Z as an aware datetime, None if it is not one
+    """
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+
+def bucket_deals(deals: List[Dict], windows: Dict[str, Tuple[datetime, datetime]]) -> Dict[str, List[Dict]]:
+    """
+    Assigns every deal to each window its createdate falls in, windows may overlap.
+    The createdate of a deal is parsed once, and the deals keep their order inside a window.
+    :param deals: Deals as returned by HubSpotDealsClient.search()
+    :param windows: Window name -> (start, end), both inclusive
+    :return: Window name -> its deals, len() of a list is the count of the window
+    """
+    buckets = {name: [] for name in windows}
+    for deal in deals:
+        created = parse_hubspot_datetime(deal.get("properties", {}).get("createdate"))
+        if created is None:
+            continue
+        for name, (start, end) in windows.items():
+            if start <= created <= end:
+                buckets[name].append(deal)
+    return buckets
+
+
+def owner_name(owner: Dict) -> Optional[str]:
+    """
+    :return: "First Last" of a HubSpot owner, None if it has no full name
+    """
+    if owner.get("firstName") and owner.get("lastName"):
+        return owner["firstName"] + " " + owner["lastName"]
+    return None
+
+
+def created_between_filters(deal_type: str, start: datetime, end: datetime) -> List[Dict]:
+    """
+    :return: Search filters for the deals of deal_type created from start to end (inclusive)
+    """
+    return [{"propertyName": "dealtype", "operator": "EQ", "value": deal_type},
+            {"propertyName": "createdate", "operator": "GTE", "value": epoch_millis(start)},
+            {"propertyName": "createdate", "operator": "LTE", "value": epoch_millis(end)}]
+
+
+class _DealWindows:
+    """
+    get_deals_in_windows() for any class with get_deals_created_between(deal_type, start, end)
+    """
+
+    def get_deals_in_windows(self, deal_type: str,
+                             windows: Dict[str, Tuple[datetime, datetime]]) -> Dict[str, List[Dict]]:
+        """
+        Fetches the deals of every reporting window (e.g. last 7 days and the last three months) with one search
+        over their union range, instead of one search per window
+        :param deal_type: The dealtype to report
+        :param windows: Window name -> (start, end), both inclusive
+        :return: Window name -> its deals, newest first, see bucket_deals()
+        """
+        start = min(start for start, _ in windows.values())
+        end = max(end for _, end in windows.values())
+        buckets = bucket_deals(self.get_deals_created_between(deal_type, start, end), windows)
+        logger.debug("🗂️ Deals per window: " + ", ".join(f"{name} {len(deals)}" for name, deals in buckets.items()))
+        return buckets
+
+
+class HubSpotDealsClient(_DealWindows):
+    """
+    Searches HubSpot deals with the filtering done by HubSpot.
+
+    The deal type and the createdate range are filters of the CRM search endpoint, so only the matching deals
+    are paged through, 100 per request and newest first, with just the properties the reports show.
+    The number of requests grows with the deals of the period instead of with the whole CRM.
+    """
+
+    def __init__(self, api_key: str, deals_api_url: str = None, properties: List[str] = None,
+                 session: requests.Session = None, timeout: float = 30):
+        """
+        :param api_key: The private app token
+        :param deals_api_url: The deals object URL (DEALS_API_URL), the search endpoint is below it
+        :param properties: The deal properties to return, DEAL_PROPERTIES by default
+        :param session: The HTTP session to use, see create_session()
+        :param timeout: Timeout of a single request, in seconds
+        """
+        self.api_key = api_key
+        self.search_url = (deals_api_url or DEALS_API_URL).rstrip("/") + "/search"
+        self.properties = properties or DEAL_PROPERTIES
+        self.session = session or create_session()
+        self.timeout = timeout
+
+    def search(self, filters: List[Dict], sorts: List[Dict] = None, properties: List[str] = None) -> List[Dict]:
+        """
+        :param filters: The filters of a single filter group, all of them have to match
+        :param sorts: e.g. [{"propertyName": "createdate", "direction": "DESCENDING"}]
+        :param properties: The deal properties to return, self.properties by default
+        :return: Every deal matching the filters (at most MAX_SEARCH_RESULTS), as {"id": ..., "properties": {...}}
+        """
+        headers = {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
+        body = {"filterGroups": [{"filters": filters}], "properties": properties or self.properties,
+                "limit": MAX_PAGE_SIZE}
+        if sorts:
+            body["sorts"] = sorts
+        deals = []
+        while True:
+            response = self.session.post(self.search_url, headers=headers, json=body, timeout=self.timeout)
+            response.raise_for_status()
+            data = response.json()
+            deals.extend(data.get("results", []))
+            after = data.get("paging", {}).get("next", {}).get("after")
+            if not after or len(deals) >= MAX_SEARCH_RESULTS:
+                break
+            body["after"] = after
+        total = data.get("total", len(deals))
+        if total > MAX_SEARCH_RESULTS:
+            logger.warning(f"⚠️ HubSpot search matched {total} deals, only the first {MAX_SEARCH_RESULTS} are returned")
+        return deals
+
+    def get_deals_created_between(self, deal_type: str, start: datetime, end: datetime) -> List[Dict]:
+        """
+        :return: Deals of deal_type created from start to end (inclusive), newest first
+        """
+        started = monotonic()
+        deals = self.search(created_between_filters(deal_type, start, end),
+                            sorts=[{"propertyName": "createdate", "direction": "DESCENDING"}])
+        logger.debug(f"🔍 HubSpot returned {len(deals)} {deal_type} deals created between {start} and {end} "
+                     f"in {monotonic() - started:.2f}s")
+        return deals
+
+
+class OwnerDirectory:
+    """
+    HubSpot owner id -> "First Last", loaded on first use instead of at import.
+
+    Every page of the owners list is read. Once the names are older than ttl seconds, get() still answers from
+    them and a daemon thread reloads the list, so only the very first lookup waits for HubSpot. An id missing from
+    the list (e.g. an owner added since the last load) is fetched on its own once, and misses are remembered.
+    Used like the dictionary it replaces: owners.get(owner_id, "Unknown Owner").
+    """
+
+    def __init__(self, api_key: str, owners_api_url: str = None, ttl: float = 3600, retry_interval: float = 60,
+                 session: requests.Session = None, timeout: float = 10):
+        """
+        :param api_key: The private app token
+        :param owners_api_url: The owners URL (OWNERS_API_URL), a single owner is read from <url>/<id>
+        :param ttl: Seconds after which the owner list is reloaded in the background
+        :param retry_interval: Seconds before a failed load is retried
+        :param session: The HTTP session to use, see create_session()
+        :param timeout: Timeout of a single request, in seconds
+        """
+        self.api_key = api_key
+        self.owners_api_url = (owners_api_url or OWNERS_API_URL).rstrip("/")
+        self.ttl = ttl
+        self.retry_interval = retry_interval
+        self.session = session or create_session()
+        self.timeout = timeout
+        self._names = None
+        self._missing = set()
+        self._next_load = 0.0  # monotonic() from which the list is (re)loaded
+        self._lock = threading.Lock()
+        self._refreshing = threading.Lock()
+
+    def _headers(self) -> Dict:
+        return {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
+
+    def _fetch_all(self) -> Dict[str, str]:
+        """
+        :return: Owner id -> name of every page of the owners list
+        """
+        names = {}
+        params = {"limit": MAX_PAGE_SIZE, "archived": "false"}
+        while True:
+            response = self.session.get(self.owners_api_url, headers=self._headers(), params=params,
+                                        timeout=self.timeout)
+            response.raise_for_status()
+            data = response.json()
+            for owner in data.get("results", []):
+                name = owner_name(owner)
+                if name:
+                    names[str(owner["id"])] = name
+            after = data.get("paging", {}).get("next", {}).get("after")
+            if not after:
+                return names
+            params["after"] = after
+
+    def refresh(self):
+        """
+        Reloads the owner list, failures keep the current names until retry_interval passed
+        """
+        started = monotonic()
+        try:
+            names = self._fetch_all()
+        except Exception as e:
+            logger.error(f"🚨 Loading the HubSpot owners failed: {str(e)}")
+            self._next_load = monotonic() + self.retry_interval
+            return
+        with self._lock:
+            self._names = names
+            self._missing = set()
+            self._next_load = monotonic() + self.ttl
+        logger.info(f"👥 Loaded {len(names)} HubSpot owners in {monotonic() - started:.2f}s")
+
+    def _refresh_in_background(self):
+        if not self._refreshing.acquire(blocking=False):
+            return  # already reloading
+
+        def run():
+            try:
+                self.refresh()
+            finally:
+                self._refreshing.release()
+
+        threading.Thread(target=run, name="hubspot-owners", daemon=True).start()
+
+    def _fetch_one(self, owner_id: str) -> Optional[str]:
+        response = self.session.get(f"{self.owners_api_url}/{owner_id}", headers=self._headers(),
+                                    timeout=self.timeout)
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return owner_name(response.json())
+
+    def get(self, owner_id, default: str = None) -> str:
+        """
+        :return: The name of the owner, default if HubSpot does not know it
+        """
+        if not owner_id:
+            return default
+        owner_id = str(owner_id)
+        if self._names is None:
+            with self._refreshing:  # the first lookup loads the list, concurrent ones wait for it
+                if self._names is None and monotonic() >= self._next_load:
+                    self.refresh()
+        elif monotonic() >= self._next_load:
+            self._refresh_in_background()
+
+        names = self._names or {}
+        if owner_id in names:
+            return names[owner_id]
+        if owner_id in self._missing or self._names is None or not owner_id.isdigit():  # e.g. "N/A"
+            return default
+        try:
+            name = self._fetch_one(owner_id)
+        except Exception as e:
+            logger.error(f"🚨 Loading HubSpot owner {owner_id} failed: {str(e)}")
+            return default
+        with self._lock:
+            if name:
+                self._names[owner_id] = name
+            else:
+                self._missing.add(owner_id)
+        return name or default